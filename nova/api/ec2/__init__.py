@@ -20,9 +20,12 @@ Starting point for routing EC2 requests.
 
 """
 
+import hashlib
+import socket
 import urlparse
 
 from eventlet.green import httplib
+from eventlet import pools
 from oslo.config import cfg
 import webob
 import webob.dec
@@ -32,12 +35,12 @@ from nova.api.ec2 import apirequest
 from nova.api.ec2 import ec2utils
 from nova.api.ec2 import faults
 from nova.api import validator
+from nova import cache_utils
 from nova import context
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova import utils
 from nova import wsgi
@@ -58,6 +61,14 @@ ec2_opts = [
     cfg.StrOpt('keystone_ec2_url',
                default='http://localhost:5000/v2.0/ec2tokens',
                help='URL to get token from ec2 request.'),
+    cfg.IntOpt('keystone_ec2_conn_pool_size',
+               default=30,
+               help='Maximum number of keep-alive connections to keep open '
+                    'to keystone_ec2_url'),
+    cfg.IntOpt('keystone_ec2_cache_time',
+               default=30,
+               help='Number of seconds to cache successful keystone ec2 '
+                    'validations for, 0 disables the cache'),
     cfg.BoolOpt('ec2_private_dns_show_ip',
                 default=False,
                 help='Return the IP address as private dns hostname in '
@@ -162,7 +173,7 @@ class Lockout(wsgi.Middleware):
 
     def __init__(self, application):
         """middleware can use fake for testing."""
-        self.mc = memorycache.get_client()
+        self.mc = cache_utils.get_client()
         super(Lockout, self).__init__(application)
 
     @webob.dec.wsgify(RequestClass=wsgi.Request)
@@ -190,9 +201,83 @@ class Lockout(wsgi.Middleware):
         return res
 
 
+class KeystoneConnectionPool(pools.Pool):
+    """Pool of keep-alive connections to a keystone endpoint."""
+    def __init__(self, scheme, netloc, *args, **kwargs):
+        self.scheme = scheme
+        self.netloc = netloc
+        kwargs.setdefault("max_size", CONF.keystone_ec2_conn_pool_size)
+        kwargs.setdefault("order_as_stack", True)
+        super(KeystoneConnectionPool, self).__init__(*args, **kwargs)
+
+    def create(self):
+        LOG.debug(_('Pool creating new connection to %s'), self.netloc)
+        if self.scheme == "http":
+            return httplib.HTTPConnection(self.netloc)
+        return httplib.HTTPSConnection(self.netloc)
+
+
 class EC2KeystoneAuth(wsgi.Middleware):
     """Authenticate an EC2 request with keystone and convert to context."""
 
+    def __init__(self, application):
+        super(EC2KeystoneAuth, self).__init__(application)
+        self.mc = cache_utils.get_client()
+        self._pools = {}
+
+    def _get_pool(self, scheme, netloc):
+        key = (scheme, netloc)
+        if key not in self._pools:
+            self._pools[key] = KeystoneConnectionPool(scheme, netloc)
+        return self._pools[key]
+
+    def _post(self, creds_json):
+        """POST the credentials to keystone over a pooled connection.
+
+        Returns a (status, reason, body) tuple. The response body is always
+        read in full so the connection can be reused. A kept-alive
+        connection that keystone has since closed is retried once on a
+        fresh connection.
+        """
+        o = urlparse.urlparse(CONF.keystone_ec2_url)
+        headers = {'Content-Type': 'application/json'}
+        with self._get_pool(o.scheme, o.netloc).item() as conn:
+            for attempt in xrange(2):
+                try:
+                    conn.request('POST', o.path, body=creds_json,
+                                 headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                    break
+                except (httplib.HTTPException, socket.error):
+                    # Closing resets the connection, it will reconnect
+                    # the next time it is used.
+                    conn.close()
+                    if attempt:
+                        raise
+            if response.will_close:
+                conn.close()
+            return response.status, response.reason, data
+
+    def _validate(self, creds_json):
+        """Validate the credentials, using cached results when possible.
+
+        Only successful validations are cached. The key covers the whole
+        signed request, so a cached result is only reused for an identical
+        request.
+        """
+        cache_time = CONF.keystone_ec2_cache_time
+        if cache_time <= 0:
+            return self._post(creds_json)
+        key = 'ec2-keystone-%s' % hashlib.sha1(creds_json).hexdigest()
+        data = self.mc.get(key)
+        if data is not None:
+            return 200, 'OK', data
+        status, reason, data = self._post(creds_json)
+        if status == 200:
+            self.mc.set(key, data, time=cache_time)
+        return status, reason, data
+
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
         request_id = context.generate_request_id()
@@ -223,24 +308,14 @@ class EC2KeystoneAuth(wsgi.Middleware):
         else:
             creds = {'auth': {'OS-KSEC2:ec2Credentials': cred_dict}}
         creds_json = jsonutils.dumps(creds)
-        headers = {'Content-Type': 'application/json'}
-
-        o = urlparse.urlparse(CONF.keystone_ec2_url)
-        if o.scheme == "http":
-            conn = httplib.HTTPConnection(o.netloc)
-        else:
-            conn = httplib.HTTPSConnection(o.netloc)
-        conn.request('POST', o.path, body=creds_json, headers=headers)
-        response = conn.getresponse()
-        data = response.read()
-        if response.status != 200:
-            if response.status == 401:
-                msg = response.reason
+        status, reason, data = self._validate(creds_json)
+        if status != 200:
+            if status == 401:
+                msg = reason
             else:
                 msg = _("Failure communicating with keystone")
             return ec2_error(req, request_id, "Unauthorized", msg)
         result = jsonutils.loads(data)
-        conn.close()
 
         try:
             token_id = result['access']['token']['id']
@@ -23,6 +23,7 @@ datastore.
 """
 
 import base64
+import collections
 import time
 
 from oslo.config import cfg
@@ -1054,12 +1055,14 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType."""
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_uuid):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1138,10 +1141,28 @@ class CloudController(object):
             except exception.NotFound:
                 instances = []
 
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if not pipelib.is_vpn_image(instance['image_ref'])]
+
+        # Look up the ec2 and s3 image ids and the block device mappings
+        # for the whole set up front rather than once per instance.
+        instance_uuids = [instance['uuid'] for instance in instances]
+        ec2utils.get_int_ids_from_instance_uuids(
+            context.elevated(), instance_uuids)
+        glance_ids = set()
+        for instance in instances:
+            glance_ids.update([instance['image_ref'], instance['kernel_id'],
+                               instance['ramdisk_id']])
+        glance_ids.discard('')
+        ec2utils.glance_ids_to_ids(context, glance_ids)
+        bdms = collections.defaultdict(list)
+        for bdm in db.block_device_mapping_get_all_by_instances(
+                context, instance_uuids):
+            bdms[bdm['instance_uuid']].append(bdm)
+        zones = {}
+
         for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
             ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
@@ -1187,10 +1208,12 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms[instance['uuid']])
             host = instance['host']
-            zone = ec2utils.get_availability_zone_by_host(host)
-            i['placement'] = {'availabilityZone': zone}
+            if host not in zones:
+                zones[host] = ec2utils.get_availability_zone_by_host(host)
+            i['placement'] = {'availabilityZone': zones[host]}
             if instance['reservation_id'] not in reservations:
                 r = {}
                 r['reservationId'] = instance['reservation_id']
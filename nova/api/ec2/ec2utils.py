@@ -20,12 +20,12 @@ import functools
 import re
 
 from nova import availability_zones
+from nova import cache_utils
 from nova import context
 from nova import db
 from nova import exception
 from nova.network import model as network_model
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 
@@ -35,21 +35,56 @@ _CACHE_TIME = 7 * 24 * 60 * 60
 _CACHE = None
 
 
+def _get_cache():
+    global _CACHE
+    if not _CACHE:
+        _CACHE = cache_utils.get_client()
+    return _CACHE
+
+
 def memoize(func):
     @functools.wraps(func)
     def memoizer(context, reqid):
-        global _CACHE
-        if not _CACHE:
-            _CACHE = memorycache.get_client()
+        cache = _get_cache()
         key = "%s:%s" % (func.__name__, reqid)
-        value = _CACHE.get(key)
+        value = cache.get(key)
         if value is None:
             value = func(context, reqid)
-            _CACHE.set(key, value, time=_CACHE_TIME)
+            cache.set(key, value, time=_CACHE_TIME)
         return value
     return memoizer
 
 
+def _memoize_many(func, bulk_func, context, reqids):
+    """Look up many values of a memoized function at once.
+
+    Values missing from the cache are fetched with a single call to
+    bulk_func, which returns a dict of reqid to value, and are cached
+    under the same keys as func. Anything bulk_func does not return is
+    left to func itself.
+    """
+    cache = _get_cache()
+    result = {}
+    missing = []
+    for reqid in set(reqids):
+        if reqid is None:
+            continue
+        value = cache.get("%s:%s" % (func.__name__, reqid))
+        if value is None:
+            missing.append(reqid)
+        else:
+            result[reqid] = value
+    if missing:
+        for reqid, value in bulk_func(context, missing).iteritems():
+            cache.set("%s:%s" % (func.__name__, reqid), value,
+                      time=_CACHE_TIME)
+            result[reqid] = value
+        for reqid in missing:
+            if reqid not in result:
+                result[reqid] = func(context, reqid)
+    return result
+
+
 def reset_cache():
     global _CACHE
     _CACHE = None
@@ -114,6 +149,12 @@ def glance_id_to_id(context, glance_id):
         return db.s3_image_create(context, glance_id)['id']
 
 
+def glance_ids_to_ids(context, glance_ids):
+    """Convert many glance ids to internal (db) ids."""
+    return _memoize_many(glance_id_to_id, db.s3_image_get_ids_by_uuids,
+                        context, glance_ids)
+
+
 def ec2_id_to_glance_id(context, ec2_id):
     image_id = ec2_id_to_id(ec2_id)
     return id_to_glance_id(context, image_id)
@@ -277,6 +318,13 @@ def get_int_id_from_instance_uuid(context, instance_uuid):
         return db.ec2_instance_create(context, instance_uuid)['id']
 
 
+def get_int_ids_from_instance_uuids(context, instance_uuids):
+    """Get or create the ec2 int ids for many instance uuids."""
+    return _memoize_many(get_int_id_from_instance_uuid,
+                        db.get_ec2_instance_ids_by_uuids,
+                        context, instance_uuids)
+
+
 @memoize
 def get_int_id_from_volume_uuid(context, volume_uuid):
     if volume_uuid is None:
@@ -26,10 +26,10 @@ import webob.dec
 import webob.exc
 
 from nova.api.metadata import base
+from nova import cache_utils
 from nova import conductor
 from nova import exception
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova import wsgi
 
 CACHE_EXPIRATION = 15  # in seconds
@@ -58,7 +58,7 @@ class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
     def __init__(self):
-        self._cache = memorycache.get_client()
+        self._cache = cache_utils.get_client()
         self.conductor_api = conductor.API()
 
     def get_metadata_by_remote_address(self, address):
@@ -18,6 +18,7 @@
 import datetime
 import urlparse
 
+from oslo.config import cfg
 from webob import exc
 
 from nova.api.openstack import extensions
@@ -27,6 +28,24 @@ from nova.compute import api
 from nova.compute import instance_types
 from nova import exception
 from nova.openstack.common import timeutils
+from nova import utils
+
+simple_tenant_usage_opts = [
+    cfg.IntOpt('simple_tenant_usage_batch_size',
+               default=1000,
+               help='Number of instances fetched at a time when totalling '
+                    'the usage of all tenants'),
+    cfg.BoolOpt('simple_tenant_usage_rollups',
+                default=False,
+                help='Total the usage of audited periods from the usage '
+                     'rollups written by the instance usage audit. Periods '
+                     'which have not been audited on all compute hosts '
+                     'are still totalled from the instances'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(simple_tenant_usage_opts)
+CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
 
 authorize_show = extensions.extension_authorizer('compute',
                                                  'simple_tenant_usage:show')
@@ -68,6 +87,12 @@ class SimpleTenantUsagesTemplate(xmlutil.TemplateBuilder):
 
 
 class SimpleTenantUsageController(object):
+    def __init__(self):
+        self.host_api = api.HostAPI()
+        # Audit periods whose instance usage audit is known to have
+        # finished on all compute hosts. That never changes afterwards.
+        self._audited_periods = set()
+
     def _hours_for(self, instance, period_start, period_stop):
         launched_at = instance['launched_at']
         terminated_at = instance['terminated_at']
@@ -97,7 +122,7 @@ class SimpleTenantUsageController(object):
                 stop = period_stop
             dt = stop - start
             seconds = (dt.days * 3600 * 24 + dt.seconds +
-                       dt.microseconds / 100000.0)
+                       dt.microseconds / 1000000.0)
 
             return seconds / 3600.0
         else:
@@ -128,6 +153,172 @@ class SimpleTenantUsageController(object):
 
         return it_ref
 
+    def _new_summary(self, tenant_id, period_start, period_stop, detailed):
+        summary = {}
+        summary['tenant_id'] = tenant_id
+        if detailed:
+            summary['server_usages'] = []
+        summary['total_local_gb_usage'] = 0
+        summary['total_vcpus_usage'] = 0
+        summary['total_memory_mb_usage'] = 0
+        summary['total_hours'] = 0
+        summary['start'] = period_start
+        summary['stop'] = period_stop
+        return summary
+
+    def _add_totals(self, rval, tenant_id, period_start, period_stop,
+                    hours, vcpu_hours, memory_mb_hours, local_gb_hours):
+        summary = rval.get(tenant_id)
+        if summary is None:
+            summary = self._new_summary(tenant_id, period_start, period_stop,
+                                        False)
+            rval[tenant_id] = summary
+
+        summary['total_local_gb_usage'] += local_gb_hours
+        summary['total_vcpus_usage'] += vcpu_hours
+        summary['total_memory_mb_usage'] += memory_mb_hours
+        summary['total_hours'] += hours
+
+    def _add_instance_totals(self, context, rval, period_start, period_stop,
+                             window_start, window_stop, tenant_id=None):
+        """Add the usage of the instances active during a window.
+
+        Only the usage columns and flavor of the instances are read, a
+        batch at a time, so memory use does not grow with the number of
+        instances.
+        """
+        compute_api = api.API()
+        limit = CONF.simple_tenant_usage_batch_size
+        marker = None
+        flavors = {}
+
+        while True:
+            instances = compute_api.get_usage_by_window(context,
+                                                        window_start,
+                                                        window_stop,
+                                                        tenant_id,
+                                                        marker=marker,
+                                                        limit=limit)
+            for instance in instances:
+                flavor = self._get_flavor(context, compute_api, instance,
+                                          flavors)
+                if not flavor:
+                    continue
+                hours = self._hours_for(instance, window_start, window_stop)
+                local_gb = flavor['root_gb'] + flavor['ephemeral_gb']
+                self._add_totals(rval, instance['project_id'],
+                                 period_start, period_stop, hours,
+                                 flavor['vcpus'] * hours,
+                                 flavor['memory_mb'] * hours,
+                                 local_gb * hours)
+
+            if not limit or len(instances) < limit:
+                break
+            marker = instances[-1]['id']
+
+    def _add_rollup_totals(self, context, rval, period_start, period_stop,
+                           window_start, window_stop, tenant_id=None):
+        """Add the usage rolled up by the instance usage audit."""
+        totals = api.API().get_usage_rollup_totals(context, window_start,
+                                                   window_stop, tenant_id)
+        for total in totals:
+            self._add_totals(rval, total['project_id'],
+                             period_start, period_stop,
+                             total['instance_hours'], total['vcpu_hours'],
+                             total['memory_mb_hours'],
+                             total['local_gb_hours'])
+
+    def _audit_periods(self, window_start, window_stop):
+        """Return the completed audit periods overlapping a window.
+
+        The periods are returned oldest first.
+        """
+        periods = []
+        begin, end = utils.last_completed_audit_period()
+        while end > window_start:
+            if begin < window_stop:
+                periods.append((begin, end))
+            begin, end = utils.last_completed_audit_period(before=begin)
+        periods.reverse()
+        return periods
+
+    def _audit_done(self, context, begin, end, services):
+        """Check whether the instance usage audit of a period is complete.
+
+        That is the case once the audit finished without errors on every
+        compute host that was up by the end of the period, as a host only
+        writes the usage rollups of a period when it audits it.
+        """
+        if (begin, end) in self._audited_periods:
+            return True
+
+        task_logs = self.host_api.task_log_get_all(context,
+                                                   "instance_usage_audit",
+                                                   begin, end)
+        done_hosts = set(tlog['host'] for tlog in task_logs
+                         if tlog['state'] == "DONE" and not tlog['errors'])
+        for service in services:
+            created_at = service['created_at']
+            if ((created_at is None or created_at < end) and
+                    service['host'] not in done_hosts):
+                return False
+
+        self._audited_periods.add((begin, end))
+        return True
+
+    def _rollup_window(self, context, period_start, period_stop):
+        """Return the part of a period that usage rollups can answer.
+
+        Rollups cover whole hours up to the end of the last audit period
+        which, like all audit periods before it within the window, has
+        been audited on all compute hosts.
+        """
+        one_hour = datetime.timedelta(hours=1)
+        rollup_start = period_start.replace(minute=0, second=0,
+                                            microsecond=0)
+        if rollup_start < period_start:
+            rollup_start += one_hour
+        rollup_stop = min(period_stop.replace(minute=0, second=0,
+                                              microsecond=0),
+                          utils.last_completed_audit_period()[1])
+        if rollup_start >= rollup_stop:
+            return rollup_start, rollup_stop
+
+        # Disabled compute services are included, they can still have
+        # instances on them.
+        context = context.elevated()
+        services = self.host_api.service_get_all(
+            context, filters={'topic': CONF.compute_topic})
+        audited_stop = rollup_start
+        for begin, end in self._audit_periods(rollup_start, rollup_stop):
+            if not self._audit_done(context, begin, end, services):
+                break
+            audited_stop = end
+        return rollup_start, min(rollup_stop, audited_stop)
+
+    def _tenant_usage_totals_for_period(self, context, period_start,
+                                        period_stop, tenant_id=None):
+        """Total the usage of each tenant without per-server details."""
+        rval = {}
+        windows = [(period_start, period_stop, self._add_instance_totals)]
+
+        if CONF.simple_tenant_usage_rollups:
+            rollup_start, rollup_stop = self._rollup_window(context,
+                                                            period_start,
+                                                            period_stop)
+            if rollup_start < rollup_stop:
+                windows = [
+                    (period_start, rollup_start, self._add_instance_totals),
+                    (rollup_start, rollup_stop, self._add_rollup_totals),
+                    (rollup_stop, period_stop, self._add_instance_totals)]
+
+        for window_start, window_stop, add_totals in windows:
+            if window_start < window_stop:
+                add_totals(context, rval, period_start, period_stop,
+                           window_start, window_stop, tenant_id)
+
+        return rval.values()
+
     def _tenant_usages_for_period(self, context, period_start,
                                   period_stop, tenant_id=None, detailed=True):
 
@@ -178,17 +369,9 @@ class SimpleTenantUsageController(object):
             info['uptime'] = delta.days * 24 * 3600 + delta.seconds
 
             if info['tenant_id'] not in rval:
-                summary = {}
-                summary['tenant_id'] = info['tenant_id']
-                if detailed:
-                    summary['server_usages'] = []
-                summary['total_local_gb_usage'] = 0
-                summary['total_vcpus_usage'] = 0
-                summary['total_memory_mb_usage'] = 0
-                summary['total_hours'] = 0
-                summary['start'] = period_start
-                summary['stop'] = period_stop
-                rval[info['tenant_id']] = summary
+                rval[info['tenant_id']] = self._new_summary(
+                        info['tenant_id'], period_start, period_stop,
+                        detailed)
 
             summary = rval[info['tenant_id']]
             summary['total_local_gb_usage'] += info['local_gb'] * info['hours']
@@ -241,10 +424,15 @@ class SimpleTenantUsageController(object):
         now = timeutils.utcnow()
         if period_stop > now:
             period_stop = now
-        usages = self._tenant_usages_for_period(context,
-                                                period_start,
-                                                period_stop,
-                                                detailed=detailed)
+        if detailed:
+            usages = self._tenant_usages_for_period(context,
+                                                    period_start,
+                                                    period_stop,
+                                                    detailed=True)
+        else:
+            usages = self._tenant_usage_totals_for_period(context,
+                                                          period_start,
+                                                          period_stop)
         return {'tenant_usages': usages}
 
     @wsgi.serializers(xml=SimpleTenantUsageTemplate)
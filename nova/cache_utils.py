@@ -0,0 +1,146 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bounded in process cache used when no memcached servers are set."""
+
+import heapq
+
+from oslo.config import cfg
+
+from nova.openstack.common import memorycache
+from nova.openstack.common import timeutils
+
+cache_opts = [
+    cfg.IntOpt('memorycache_max_items',
+               default=100000,
+               help='Maximum number of keys held by the in process cache, '
+                    'the least recently used ones are evicted beyond it. '
+                    '0 means unlimited.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(cache_opts)
+CONF.import_opt('memcached_servers', 'nova.openstack.common.memorycache')
+
+
+def get_client(memcached_servers=None):
+    client_cls = Client
+
+    if not memcached_servers:
+        memcached_servers = CONF.memcached_servers
+    if memcached_servers:
+        try:
+            import memcache
+            client_cls = memcache.Client
+        except ImportError:
+            pass
+
+    return client_cls(memcached_servers, debug=0)
+
+
+class Client(memorycache.Client):
+    """Memory cache client holding at most max_items keys."""
+
+    def __init__(self, *args, **kwargs):
+        """Ignores the passed in args, except for max_items."""
+        super(Client, self).__init__(*args, **kwargs)
+        # Keys are linked in least to most recently used order in a
+        # circular doubly linked list of [prev, next, key] links, starting
+        # after self._root. The expiry times are kept in a heap so that
+        # expired keys can be found without scanning the whole cache.
+        # Heap entries of keys which were deleted or set again since are
+        # skipped.
+        self._root = []
+        self._root[:] = [self._root, self._root, None]
+        self._links = {}
+        self._timeouts = []
+        self.max_items = kwargs.get('max_items', CONF.memorycache_max_items)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _link(self, key):
+        """Marks a key as the most recently used one."""
+        last = self._root[0]
+        link = [last, self._root, key]
+        last[1] = self._root[0] = self._links[key] = link
+
+    def _unlink(self, key):
+        prev_link, next_link, _key = self._links.pop(key)
+        prev_link[1] = next_link
+        next_link[0] = prev_link
+
+    def _remove(self, key):
+        del self.cache[key]
+        self._unlink(key)
+
+    def _expunge(self):
+        """Removes the expired keys."""
+        now = timeutils.utcnow_ts()
+        while self._timeouts and self._timeouts[0][0] <= now:
+            timeout, key = heapq.heappop(self._timeouts)
+            if key in self.cache and self.cache[key][0] == timeout:
+                self._remove(key)
+
+        # Don't let entries of keys set again pile up in the heap
+        if len(self._timeouts) > 2 * len(self.cache) + 100:
+            self._timeouts = [(timeout, key) for key, (timeout, _value)
+                              in self.cache.iteritems() if timeout]
+            heapq.heapify(self._timeouts)
+
+    def get(self, key):
+        """Retrieves the value for a key or None.
+
+        this expunges expired keys during each get"""
+
+        self._expunge()
+        if key not in self.cache:
+            self.misses += 1
+            return None
+
+        self._unlink(key)
+        self._link(key)
+        self.hits += 1
+        return self.cache[key][1]
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        timeout = 0
+        if time != 0:
+            timeout = timeutils.utcnow_ts() + time
+            heapq.heappush(self._timeouts, (timeout, key))
+        if key in self.cache:
+            self._unlink(key)
+        self.cache[key] = (timeout, value)
+        self._link(key)
+
+        while self.max_items and len(self.cache) > self.max_items:
+            self._remove(self._root[1][2])
+            self.evictions += 1
+        return True
+
+    def delete(self, key, time=0):
+        """Deletes the value associated with a key."""
+        if key in self.cache:
+            self._remove(key)
+
+    def get_stats(self):
+        """Returns the statistics of the cache like memcached does."""
+        return [('memorycache', {'curr_items': len(self.cache),
+                                 'get_hits': self.hits,
+                                 'get_misses': self.misses,
+                                 'evictions': self.evictions})]
@@ -1320,6 +1320,17 @@ class API(base.Base):
         return self.db.instance_get_active_by_window_joined(context, begin,
                                                      end, project_id)
 
+    def get_usage_by_window(self, context, begin, end=None, project_id=None,
+                            marker=None, limit=None):
+        """Get the usage columns of instances active over a window."""
+        return self.db.instance_get_active_by_window_usage(context, begin,
+                end, project_id, marker, limit)
+
+    def get_usage_rollup_totals(self, context, begin, end, project_id=None):
+        """Get the usage rolled up over a window, totalled per project."""
+        return self.db.instance_usage_rollup_get_totals(context, begin, end,
+                                                        project_id)
+
     #NOTE(bcwaldon): this doesn't really belong in this class
     def get_instance_type(self, context, instance_type_id):
         """Get an instance type by instance type id."""
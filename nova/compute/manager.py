@@ -118,6 +118,10 @@ interval_opts = [
                default=60,
                help="Number of seconds between instance info_cache self "
                         "healing updates"),
+    cfg.IntOpt("heal_instance_info_cache_batch_size",
+               default=10,
+               help="Maximum number of instances whose info_cache is "
+                    "refreshed on each info_cache self healing update"),
     cfg.IntOpt('host_state_interval',
                default=120,
                help='Interval in seconds for querying the host status'),
@@ -339,6 +343,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self._last_bw_usage_poll = 0
         self._last_vol_usage_poll = 0
         self._last_info_cache_heal = 0
+        self._instances_to_heal = set()
         self.compute_api = compute.API()
         self.compute_rpcapi = compute_rpcapi.ComputeAPI()
         self.conductor_api = conductor.API()
@@ -2311,6 +2316,7 @@ class ComputeManager(manager.SchedulerDependentManager):
             self.conductor_api.network_migrate_instance_finish(context,
                                                                instance,
                                                                migration)
+            self._mark_info_cache_stale(instance)
 
             instance = self._instance_update(context, instance['uuid'],
                     vm_state=vm_states.ACTIVE, task_state=None)
@@ -2546,6 +2552,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.conductor_api.network_migrate_instance_finish(context,
                                                            instance,
                                                            migration)
+        self._mark_info_cache_stale(instance)
 
         network_info = self._get_instance_nw_info(context, instance)
 
@@ -2627,6 +2634,7 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         self.network_api.add_fixed_ip_to_instance(context, instance,
                 network_id, conductor_api=self.conductor_api)
+        self._mark_info_cache_stale(instance)
 
         network_info = self._inject_network_info(context, instance=instance)
         self.reset_network(context, instance)
@@ -2651,6 +2659,7 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         self.network_api.remove_fixed_ip_from_instance(context, instance,
                 address, conductor_api=self.conductor_api)
+        self._mark_info_cache_stale(instance)
 
         network_info = self._inject_network_info(context,
                                                  instance=instance)
@@ -3379,6 +3388,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.conductor_api.network_migrate_instance_finish(context,
                                                            instance,
                                                            migration)
+        self._mark_info_cache_stale(instance)
 
         network_info = self._get_instance_nw_info(context, instance)
         block_device_info = self._get_instance_volume_block_device_info(
@@ -3458,17 +3468,25 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.driver.destroy(instance, self._legacy_nw_info(network_info),
                             block_device_info)
 
+    def _mark_info_cache_stale(self, instance):
+        """Have the next info_cache heal refresh this instance first.
+
+        Called whenever the network of an instance changed, so a cache
+        which was refreshed concurrently with the change gets fixed up
+        soon rather than when its turn comes up again.
+        """
+        self._instances_to_heal.add(instance['uuid'])
+
     @manager.periodic_task
     def _heal_instance_info_cache(self, context):
-        """Called periodically.  On every call, try to update the
-        info_cache's network information for another instance by
+        """Called periodically.  On every call, update the info_cache's
+        network information for a batch of instances on this host by
         calling to the network manager.
 
-        This is implemented by keeping a cache of uuids of instances
-        that live on this host.  On each call, we pop one off of a
-        list, pull the DB record, and try the call to the network API.
-        If anything errors, we don't care.  It's possible the instance
-        has been deleted, etc.
+        Instances whose network recently changed go first, followed by
+        the instances with the least recently updated info_cache, up to
+        heal_instance_info_cache_batch_size of them.  If anything errors,
+        we don't care.  It's possible the instance has been deleted, etc.
         """
         heal_interval = CONF.heal_instance_info_cache_interval
         if not heal_interval:
@@ -3478,38 +3496,38 @@ class ComputeManager(manager.SchedulerDependentManager):
             return
         self._last_info_cache_heal = curr_time
 
-        instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
-        instance = None
+        db_instances = self.conductor_api.instance_get_all_by_host(
+                context, self.host,
+                columns_to_join=['info_cache', 'system_metadata'])
+        # Forget about instances which are gone or have moved elsewhere
+        self._instances_to_heal &= set(inst['uuid'] for inst in db_instances)
+        if not db_instances:
+            return
 
-        while not instance or instance['host'] != self.host:
-            if instance_uuids:
-                try:
-                    instance = self.conductor_api.instance_get_by_uuid(context,
-                        instance_uuids.pop(0))
-                except exception.InstanceNotFound:
-                    # Instance is gone.  Try to grab another.
-                    continue
-            else:
-                # No more in our copy of uuids.  Pull from the DB.
-                db_instances = self.conductor_api.instance_get_all_by_host(
-                        context, self.host, columns_to_join=[])
-                if not db_instances:
-                    # None.. just return.
-                    return
-                instance = db_instances.pop(0)
-                instance_uuids = [inst['uuid'] for inst in db_instances]
-                self._instance_uuids_to_heal = instance_uuids
+        def _heal_priority(instance):
+            info_cache = instance.get('info_cache') or {}
+            updated_at = (info_cache.get('updated_at') or
+                          info_cache.get('created_at'))
+            return (instance['uuid'] not in self._instances_to_heal,
+                    updated_at is not None, updated_at)
+
+        db_instances.sort(key=_heal_priority)
+        batch = db_instances[:CONF.heal_instance_info_cache_batch_size]
 
-        # We have an instance now and it's ours
         try:
             # Call to network API to get instance info.. this will
-            # force an update to the instance's info_cache
-            self._get_instance_nw_info(context, instance)
-            LOG.debug(_('Updated the info_cache for instance'),
-                      instance=instance)
+            # force an update to the instances' info_cache
+            nw_infos = self.network_api.get_instance_nw_info_bulk(
+                context, batch, conductor_api=self.conductor_api)
         except Exception:
             # We don't care about any failures
-            pass
+            return
+
+        for instance in batch:
+            if instance['uuid'] in nw_infos:
+                self._instances_to_heal.discard(instance['uuid'])
+                LOG.debug(_('Updated the info_cache for instance'),
+                          instance=instance)
 
     @manager.periodic_task
     def _poll_rebooting_instances(self, context):
@@ -3633,6 +3651,15 @@ class ComputeManager(manager.SchedulerDependentManager):
                                         'on host %s') % self.host,
                                       instance=instance)
                         errors += 1
+                try:
+                    rollups = compute_utils.instance_usage_rollups(
+                        context, self.conductor_api, instances, begin, end)
+                    self.conductor_api.instance_usage_rollup_set(
+                        context, self.host, begin, end, rollups)
+                except Exception:
+                    LOG.exception(_('Failed to store usage rollups '
+                                    'on host %s') % self.host)
+                    errors += 1
                 compute_utils.finish_instance_usage_audit(context,
                                               self.conductor_api,
                                               begin, end,
@@ -3800,16 +3827,24 @@ class ComputeManager(manager.SchedulerDependentManager):
     def _sync_power_states(self, context):
         """Align power states between the database and the hypervisor.
 
-        To sync power state data we make a DB call to get the number of
-        virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        To sync power state data we make a DB call to get the virtual machines
+        known by the database and ask the hypervisor for the power state of
+        all of its virtual machines at once. Only the instances whose power
+        state has drifted from the database, or does not match their
+        vm_state, are then handed over to _sync_instance_power_state.
         """
         db_instances = self.conductor_api.instance_get_all_by_host(
             context, self.host, columns_to_join=[])
 
-        num_vm_instances = self.driver.get_num_instances()
+        try:
+            vm_power_states = self.driver.get_power_states()
+        except NotImplementedError:
+            vm_power_states = None
+
+        if vm_power_states is not None:
+            num_vm_instances = len(vm_power_states)
+        else:
+            num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
 
         if num_vm_instances != num_db_instances:
@@ -3822,17 +3857,51 @@ class ComputeManager(manager.SchedulerDependentManager):
                            "pending task. Skip."), instance=db_instance)
                 continue
             # No pending tasks. Now try to figure out the real vm_power_state.
-            try:
-                vm_instance = self.driver.get_info(db_instance)
-                vm_power_state = vm_instance['state']
-            except exception.InstanceNotFound:
-                vm_power_state = power_state.NOSTATE
-            # Note(maoy): the above get_info call might take a long time,
-            # for example, because of a broken libvirt driver.
+            if vm_power_states is not None:
+                vm_power_state = vm_power_states.get(db_instance['name'],
+                                                     power_state.NOSTATE)
+            else:
+                try:
+                    vm_instance = self.driver.get_info(db_instance)
+                    vm_power_state = vm_instance['state']
+                except exception.InstanceNotFound:
+                    vm_power_state = power_state.NOSTATE
+                # Note(maoy): the above get_info call might take a long time,
+                # for example, because of a broken libvirt driver.
+            if self._power_state_in_sync(db_instance, vm_power_state):
+                continue
             self._sync_instance_power_state(context,
                                             db_instance,
                                             vm_power_state)
 
+    @staticmethod
+    def _power_state_in_sync(db_instance, vm_power_state):
+        """Return True if _sync_instance_power_state has nothing to do.
+
+        That is the case when the database already holds vm_power_state
+        and it is a sane power state for the vm_state of the instance.
+        """
+        if db_instance['power_state'] != vm_power_state:
+            return False
+
+        vm_state = db_instance['vm_state']
+        if vm_state == vm_states.ACTIVE:
+            return vm_power_state == power_state.RUNNING
+        elif vm_state == vm_states.STOPPED:
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN,
+                                      power_state.CRASHED)
+        elif vm_state in (vm_states.SOFT_DELETED,
+                          vm_states.DELETED):
+            return vm_power_state in (power_state.NOSTATE,
+                                      power_state.SHUTDOWN)
+        return vm_state in (vm_states.BUILDING,
+                            vm_states.RESCUED,
+                            vm_states.RESIZED,
+                            vm_states.SUSPENDED,
+                            vm_states.PAUSED,
+                            vm_states.ERROR)
+
     def _sync_instance_power_state(self, context, db_instance, vm_power_state):
         """Align instance power state between the database and hypervisor.
 
@@ -4153,20 +4222,19 @@ class ComputeManager(manager.SchedulerDependentManager):
         if CONF.image_cache_manager_interval == 0:
             return
 
-        all_instances = self.conductor_api.instance_get_all(context)
-
         # Determine what other nodes use this storage
         storage_users.register_storage_use(CONF.instances_path, CONF.host)
         nodes = storage_users.get_storage_users(CONF.instances_path)
 
-        # Filter all_instances to only include those nodes which share this
-        # storage path.
+        # Only fetch the instances of the nodes which share this storage
+        # path, rather than every instance in the deployment.
         # TODO(mikal): this should be further refactored so that the cache
         # cleanup code doesn't know what those instances are, just a remote
         # count, and then this logic should be pushed up the stack.
         filtered_instances = []
-        for instance in all_instances:
-            if instance['host'] in nodes:
-                filtered_instances.append(instance)
+        for node in nodes:
+            filtered_instances.extend(
+                self.conductor_api.instance_get_all_by_host(
+                    context, node, columns_to_join=[]))
 
         self.driver.manage_image_cache(context, filtered_instances)
@@ -32,6 +32,7 @@ from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import lockutils
 from nova.openstack.common import log as logging
+from nova.scheduler import rpcapi as scheduler_rpcapi
 
 resource_tracker_opts = [
     cfg.IntOpt('reserved_host_disk_mb', default=0,
@@ -40,7 +41,12 @@ resource_tracker_opts = [
                help='Amount of memory in MB to reserve for the host'),
     cfg.StrOpt('compute_stats_class',
                default='nova.compute.stats.Stats',
-               help='Class that will manage stats for the local compute host')
+               help='Class that will manage stats for the local compute host'),
+    cfg.BoolOpt('compute_resources_push',
+                default=False,
+                help='Send the resource view of this compute node to the '
+                     'schedulers whenever it changes, so they do not need '
+                     'to read it back from the database'),
 ]
 
 CONF = cfg.CONF
@@ -49,6 +55,12 @@ CONF.register_opts(resource_tracker_opts)
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
+# Compute node fields the scheduler's host states are built from.
+PUSHED_RESOURCE_FIELDS = ['memory_mb', 'free_ram_mb', 'local_gb',
+                          'local_gb_used', 'free_disk_gb',
+                          'disk_available_least', 'vcpus', 'vcpus_used',
+                          'updated_at']
+
 
 class ResourceTracker(object):
     """Compute helper class for keeping track of resource usage as instances
@@ -64,6 +76,7 @@ class ResourceTracker(object):
         self.tracked_instances = {}
         self.tracked_migrations = {}
         self.conductor_api = conductor.API()
+        self.scheduler_rpcapi = scheduler_rpcapi.SchedulerAPI()
 
     @lockutils.synchronized(COMPUTE_RESOURCE_SEMAPHORE, 'nova-')
     def instance_claim(self, context, instance_ref, limits=None):
@@ -359,6 +372,23 @@ class ResourceTracker(object):
             del self.compute_node['service']
         self.compute_node = self.conductor_api.compute_node_update(
             context, self.compute_node, values, prune_stats)
+        if CONF.compute_resources_push:
+            self._push_resources(context)
+
+    def _push_resources(self, context):
+        """Fanout the resource view of this compute node to the schedulers.
+
+        The update travels as a capability carrying a 'compute_node_update'
+        key, which the scheduler's HostManager applies to its host state.
+        """
+        update = dict((field, self.compute_node.get(field))
+                      for field in PUSHED_RESOURCE_FIELDS)
+        update['stats'] = [dict(key=stat['key'], value=stat['value'])
+                           for stat in self.compute_node.get('stats', [])]
+        capabilities = {'hypervisor_hostname': self.nodename,
+                        'compute_node_update': jsonutils.to_primitive(update)}
+        self.scheduler_rpcapi.update_service_capabilities(context,
+                'compute', self.host, [capabilities])
 
     def _update_usage(self, resources, usage, sign=1):
         resources['memory_mb_used'] += sign * usage['memory_mb']
@@ -16,6 +16,7 @@
 
 """Compute-related Utilities and helpers."""
 
+import datetime
 import re
 import string
 import traceback
@@ -284,6 +285,84 @@ def finish_instance_usage_audit(context, conductor, begin, end, host, errors,
                                 host, errors, message)
 
 
+def _usage_instance_type(context, conductor, instance, instance_types_cache):
+    """Get the flavor an instance is billed by, or None.
+
+    Like the os-simple-tenant-usage extension, this reads the flavor from
+    the instance's system_metadata and only falls back to looking it up by
+    id for deleted instances.
+    """
+    try:
+        return instance_types.extract_instance_type(instance)
+    except KeyError:
+        if not instance['deleted']:
+            raise
+
+    instance_type_id = instance['instance_type_id']
+    if instance_type_id not in instance_types_cache:
+        try:
+            instance_types_cache[instance_type_id] = (
+                conductor.instance_type_get(context, instance_type_id))
+        except exception.InstanceTypeNotFound:
+            # can't bill if there is no instance type
+            instance_types_cache[instance_type_id] = None
+    return instance_types_cache[instance_type_id]
+
+
+def instance_usage_rollups(context, conductor, instances, begin, end):
+    """Split the usage of instances during a period into hourly rollups.
+
+    Returns a list with one dict per project and hour, holding the
+    instance, vcpu, memory_mb and local_gb hours used in that hour.
+    Instances are billed by their flavor and skipped if it is gone, the
+    same way the os-simple-tenant-usage extension bills them.
+    """
+    def _datetime(value):
+        if value is None or isinstance(value, datetime.datetime):
+            return value
+        return timeutils.parse_strtime(value)
+
+    one_hour = datetime.timedelta(hours=1)
+    rollups = {}
+    instance_types_cache = {}
+    for instance in instances:
+        launched_at = _datetime(instance.get('launched_at'))
+        if not launched_at:
+            continue
+        start = max(launched_at, begin)
+        stop = min(_datetime(instance.get('terminated_at')) or end, end)
+
+        instance_type = _usage_instance_type(context, conductor, instance,
+                                             instance_types_cache)
+        if not instance_type:
+            continue
+        vcpus = instance_type['vcpus']
+        memory_mb = instance_type['memory_mb']
+        local_gb = instance_type['root_gb'] + instance_type['ephemeral_gb']
+
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        while hour < stop:
+            dt = min(hour + one_hour, stop) - max(hour, start)
+            hours = (dt.days * 86400 + dt.seconds +
+                     dt.microseconds / 1000000.0) / 3600.0
+            key = (instance['project_id'], hour)
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = {'project_id': instance['project_id'],
+                                         'period_beginning': hour,
+                                         'instance_hours': 0,
+                                         'vcpu_hours': 0,
+                                         'memory_mb_hours': 0,
+                                         'local_gb_hours': 0}
+            rollup['instance_hours'] += hours
+            rollup['vcpu_hours'] += vcpus * hours
+            rollup['memory_mb_hours'] += memory_mb * hours
+            rollup['local_gb_hours'] += local_gb * hours
+            hour += one_hour
+
+    return rollups.values()
+
+
 def usage_volume_info(vol_usage):
     def null_safe_str(s):
         return str(s) if s else ''
@@ -297,6 +297,10 @@ class LocalAPI(object):
                                                begin, end, host,
                                                errors, message)
 
+    def instance_usage_rollup_set(self, context, host, begin, end, rollups):
+        return self._manager.instance_usage_rollup_set(context, host, begin,
+                                                       end, rollups)
+
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
@@ -633,6 +637,11 @@ class API(object):
                                                        begin, end, host,
                                                        errors, message)
 
+    def instance_usage_rollup_set(self, context, host, begin, end, rollups):
+        return self.conductor_rpcapi.instance_usage_rollup_set(context, host,
+                                                               begin, end,
+                                                               rollups)
+
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
@@ -49,7 +49,7 @@ datetime_fields = ['launched_at', 'terminated_at', 'updated_at']
 class ConductorManager(manager.Manager):
     """Mission: TBD."""
 
-    RPC_API_VERSION = '1.49'
+    RPC_API_VERSION = '1.50'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -296,6 +296,7 @@ class ConductorManager(manager.Manager):
         self.db.instance_info_cache_update(context, instance['uuid'],
                                            values)
 
+    @rpc_common.client_exceptions(exception.InstanceTypeNotFound)
     def instance_type_get(self, context, instance_type_id):
         result = self.db.instance_type_get(context, instance_type_id)
         return jsonutils.to_primitive(result)
@@ -390,6 +391,18 @@ class ConductorManager(manager.Manager):
                                            begin, end, host, errors, message)
         return jsonutils.to_primitive(result)
 
+    def instance_usage_rollup_set(self, context, host, begin, end, rollups):
+        def _datetime(value):
+            if isinstance(value, basestring):
+                return timeutils.parse_strtime(value)
+            return value
+
+        for rollup in rollups:
+            rollup['period_beginning'] = _datetime(rollup['period_beginning'])
+        self.db.instance_usage_rollup_set(context.elevated(), host,
+                                          _datetime(begin), _datetime(end),
+                                          rollups)
+
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
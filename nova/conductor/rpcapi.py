@@ -88,6 +88,7 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                  instance_get_all_by_filters
     1.48 - Added compute_unrescue
     1.49 - Added columns_to_join to instance_get_by_uuid
+    1.50 - Added instance_usage_rollup_set
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -377,6 +378,14 @@ class ConductorAPI(nova.openstack.common.rpc.proxy.RpcProxy):
                             message=message)
         return self.call(context, msg, version='1.37')
 
+    def instance_usage_rollup_set(self, context, host, begin, end, rollups):
+        begin_p = jsonutils.to_primitive(begin)
+        end_p = jsonutils.to_primitive(end)
+        rollups_p = jsonutils.to_primitive(rollups)
+        msg = self.make_msg('instance_usage_rollup_set', host=host,
+                            begin=begin_p, end=end_p, rollups=rollups_p)
+        return self.call(context, msg, version='1.50')
+
     def notify_usage_exists(self, context, instance, current_period=False,
                             ignore_missing_network_data=True,
                             system_metadata=None, extra_usage_info=None):
@@ -182,6 +182,11 @@ def compute_node_get_all(context):
     return IMPL.compute_node_get_all(context)
 
 
+def compute_node_get_all_changed_since(context, changes_since):
+    """Get all computeNodes created, updated or deleted since a time."""
+    return IMPL.compute_node_get_all_changed_since(context, changes_since)
+
+
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     """Get computeNodes given a hypervisor hostname match string."""
     return IMPL.compute_node_search_by_hypervisor(context, hypervisor_match)
@@ -278,6 +283,11 @@ def floating_ip_count_by_project(context, project_id, session=None):
                                              session=session)
 
 
+def floating_ip_count_by_projects(context, session=None):
+    """Count floating ips used by each project."""
+    return IMPL.floating_ip_count_by_projects(context, session=session)
+
+
 def floating_ip_deallocate(context, address):
     """Deallocate a floating ip by address."""
     return IMPL.floating_ip_deallocate(context, address)
@@ -511,6 +521,11 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return IMPL.fixed_ips_by_virtual_interface(context, vif_id)
 
 
+def fixed_ips_by_virtual_interfaces(context, vif_ids):
+    """Get fixed ips, with their floating ips, for several vifs."""
+    return IMPL.fixed_ips_by_virtual_interfaces(context, vif_ids)
+
+
 def fixed_ip_update(context, address, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_update(context, address, values)
@@ -521,6 +536,11 @@ def fixed_ip_count_by_project(context, project_id, session=None):
     return IMPL.fixed_ip_count_by_project(context, project_id,
                                           session=session)
 
+
+def fixed_ip_count_by_projects(context, session=None):
+    """Count fixed ips used by each project."""
+    return IMPL.fixed_ip_count_by_projects(context, session=session)
+
 ####################
 
 
@@ -549,6 +569,11 @@ def virtual_interface_get_by_instance(context, instance_id):
     return IMPL.virtual_interface_get_by_instance(context, instance_id)
 
 
+def virtual_interface_get_by_instances(context, instance_uuids):
+    """Gets all virtual_interfaces for several instances."""
+    return IMPL.virtual_interface_get_by_instances(context, instance_uuids)
+
+
 def virtual_interface_get_by_instance_and_network(context, instance_id,
                                                            network_id):
     """Gets all virtual interfaces for instance."""
@@ -581,6 +606,11 @@ def instance_data_get_for_project(context, project_id, session=None):
                                               session=session)
 
 
+def instance_data_get_by_projects(context, session=None):
+    """Get (instance_count, total_cores, total_ram) keyed by project."""
+    return IMPL.instance_data_get_by_projects(context, session=session)
+
+
 def instance_destroy(context, instance_uuid, constraint=None,
         update_cells=True):
     """Destroy the instance or raise if it does not exist."""
@@ -629,6 +659,21 @@ def instance_get_active_by_window_joined(context, begin, end=None,
                                               project_id, host)
 
 
+def instance_get_active_by_window_usage(context, begin, end=None,
+                                        project_id=None, marker=None,
+                                        limit=None):
+    """Get the usage columns of instances active during a time window.
+
+    Returns dicts of the id, uuid, project_id, launched_at,
+    terminated_at, deleted and instance_type_id of each instance along
+    with the instance_type system_metadata, ordered by id.  Pass the id
+    of the last instance of a batch as marker to get the next one.
+    """
+    return IMPL.instance_get_active_by_window_usage(context, begin, end,
+                                                    project_id, marker,
+                                                    limit)
+
+
 def instance_get_all_by_host(context, host, columns_to_join=None):
     """Get all instances belonging to a host."""
     return IMPL.instance_get_all_by_host(context, host, columns_to_join)
@@ -829,6 +874,12 @@ def network_get_all_by_uuids(context, network_uuids,
                                          project_only=project_only)
 
 
+def network_get_all_by_ids(context, network_ids, project_only="allow_none"):
+    """Return the networks with the given ids which could be found."""
+    return IMPL.network_get_all_by_ids(context, network_ids,
+                                       project_only=project_only)
+
+
 # pylint: disable=C0103
 
 def network_in_use_on_host(context, network_id, host=None):
@@ -939,6 +990,11 @@ def quota_usage_update(context, project_id, resource, **kwargs):
     return IMPL.quota_usage_update(context, project_id, resource, **kwargs)
 
 
+def quota_usage_refresh_all(context, resources, until_refresh):
+    """Recount the existing quota usages of all projects."""
+    return IMPL.quota_usage_refresh_all(context, resources, until_refresh)
+
+
 ###################
 
 
@@ -964,6 +1020,14 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                               until_refresh, max_age, project_id=project_id)
 
 
+def quota_reserve_conditional(context, resources, quotas, deltas, expire,
+                              until_refresh, max_age, project_id=None):
+    """Create reservations using conditional updates of the usages."""
+    return IMPL.quota_reserve_conditional(context, resources, quotas, deltas,
+                                          expire, until_refresh, max_age,
+                                          project_id=project_id)
+
+
 def reservation_commit(context, reservations, project_id=None):
     """Commit quota reservations."""
     return IMPL.reservation_commit(context, reservations,
@@ -976,6 +1040,18 @@ def reservation_rollback(context, reservations, project_id=None):
                                      project_id=project_id)
 
 
+def reservation_commit_conditional(context, reservations, project_id=None):
+    """Commit quota reservations using conditional updates."""
+    return IMPL.reservation_commit_conditional(context, reservations,
+                                               project_id=project_id)
+
+
+def reservation_rollback_conditional(context, reservations, project_id=None):
+    """Roll back quota reservations using conditional updates."""
+    return IMPL.reservation_rollback_conditional(context, reservations,
+                                                 project_id=project_id)
+
+
 def quota_destroy_all_by_project(context, project_id):
     """Destroy all quotas associated with a given project."""
     return IMPL.quota_destroy_all_by_project(context, project_id)
@@ -1038,6 +1114,12 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    """Get all block device mapping belonging to a list of instances."""
+    return IMPL.block_device_mapping_get_all_by_instances(context,
+                                                          instance_uuids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1121,6 +1203,11 @@ def security_group_count_by_project(context, project_id, session=None):
                                                 session=session)
 
 
+def security_group_count_by_projects(context, session=None):
+    """Count number of security groups in each project."""
+    return IMPL.security_group_count_by_projects(context, session=session)
+
+
 ####################
 
 
@@ -1489,6 +1576,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_ids_by_uuids(context, image_uuids):
+    """Get a dict of uuid to local s3 image id for the provided uuids."""
+    return IMPL.s3_image_get_ids_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     return IMPL.s3_image_create(context, image_uuid)
@@ -1646,6 +1738,11 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Get a dict of uuid to ec2 id from instance_id_mappings table."""
+    return IMPL.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table."""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
@@ -1704,6 +1801,23 @@ def task_log_get(context, task_name, period_beginning,
 ####################
 
 
+def instance_usage_rollup_set(context, host, period_beginning, period_ending,
+                              rollups):
+    """Replace the usage rollups of a host for the given period."""
+    return IMPL.instance_usage_rollup_set(context, host, period_beginning,
+                                          period_ending, rollups)
+
+
+def instance_usage_rollup_get_totals(context, period_beginning,
+                                     period_ending, project_id=None):
+    """Get the usage rolled up during a period, totalled per project."""
+    return IMPL.instance_usage_rollup_get_totals(context, period_beginning,
+                                                 period_ending, project_id)
+
+
+####################
+
+
 def archive_deleted_rows(context, max_rows=None):
     """Move up to max_rows rows from production tables to corresponding shadow
     tables.
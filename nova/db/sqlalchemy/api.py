@@ -23,6 +23,9 @@ import collections
 import copy
 import datetime
 import functools
+import itertools
+import random
+import re
 import sys
 import time
 import uuid
@@ -41,6 +44,7 @@ from sqlalchemy.orm import joinedload_all
 from sqlalchemy.orm import noload
 from sqlalchemy.schema import Table
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import case
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import select
 from sqlalchemy.sql import func
@@ -66,6 +70,12 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('fixed_ip_allocation_window',
+               default=64,
+               help='Number of free fixed ips read when allocating one from '
+                    'a network pool. One of them is claimed at random so '
+                    'that concurrent allocations rarely contend for the '
+                    'same row'),
 ]
 
 CONF = cfg.CONF
@@ -76,6 +86,9 @@ CONF.import_opt('sql_connection',
 
 LOG = logging.getLogger(__name__)
 
+# Number of rows inserted at once by fixed_ip_bulk_create
+FIXED_IP_BULK_CREATE_CHUNK = 1000
+
 get_engine = db_session.get_engine
 get_session = db_session.get_session
 
@@ -466,6 +479,21 @@ def compute_node_get_all(context):
             all()
 
 
+@require_admin_context
+def compute_node_get_all_changed_since(context, changes_since):
+    """Return compute nodes created, updated or deleted at or after
+    changes_since.  Deleted compute nodes are included so callers caching
+    compute node data can drop them.
+    """
+    return model_query(context, models.ComputeNode, read_deleted="yes").\
+            options(joinedload('service')).\
+            options(joinedload('stats')).\
+            filter(or_(models.ComputeNode.created_at >= changes_since,
+                       models.ComputeNode.updated_at >= changes_since,
+                       models.ComputeNode.deleted_at >= changes_since)).\
+            all()
+
+
 @require_admin_context
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -764,6 +792,19 @@ def floating_ip_count_by_project(context, project_id, session=None):
                    count()
 
 
+@require_admin_context
+def floating_ip_count_by_projects(context, session=None):
+    rows = model_query(context, models.FloatingIp.project_id,
+                       func.count(models.FloatingIp.id),
+                       base_model=models.FloatingIp, read_deleted="no",
+                       session=session).\
+                   filter(models.FloatingIp.project_id != None).\
+                   filter_by(auto_assigned=False).\
+                   group_by(models.FloatingIp.project_id).\
+                   all()
+    return dict(rows)
+
+
 @require_context
 @_retry_on_deadlock
 def floating_ip_fixed_ip_associate(context, floating_address,
@@ -1032,33 +1073,45 @@ def fixed_ip_associate_pool(context, network_id, instance_uuid=None,
     if instance_uuid and not uuidutils.is_uuid_like(instance_uuid):
         raise exception.InvalidUUID(uuid=instance_uuid)
 
+    values = {'network_id': network_id}
+    if instance_uuid:
+        values['instance_uuid'] = instance_uuid
+    if host:
+        values['host'] = host
+
+    # Rather than locking the first free row, which serializes every
+    # allocation on the network, read a window of free rows and claim one
+    # of them with a conditional update. Allocators racing for the same
+    # row simply move on to the next candidate.
     session = get_session()
-    with session.begin():
+    while True:
         network_or_none = or_(models.FixedIp.network_id == network_id,
                               models.FixedIp.network_id == None)
-        fixed_ip_ref = model_query(context, models.FixedIp, session=session,
-                                   read_deleted="no").\
+        candidates = model_query(context, models.FixedIp.id,
+                                 models.FixedIp.address,
+                                 base_model=models.FixedIp, session=session,
+                                 read_deleted="no").\
                                filter(network_or_none).\
                                filter_by(reserved=False).\
                                filter_by(instance_uuid=None).\
                                filter_by(host=None).\
-                               with_lockmode('update').\
-                               first()
-        # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
-        #             then this has concurrency issues
-        if not fixed_ip_ref:
+                               limit(CONF.fixed_ip_allocation_window).\
+                               all()
+        if not candidates:
             raise exception.NoMoreFixedIps()
 
-        if fixed_ip_ref['network_id'] is None:
-            fixed_ip_ref['network'] = network_id
-
-        if instance_uuid:
-            fixed_ip_ref['instance_uuid'] = instance_uuid
-
-        if host:
-            fixed_ip_ref['host'] = host
-        session.add(fixed_ip_ref)
-    return fixed_ip_ref['address']
+        random.shuffle(candidates)
+        for fixed_ip_id, address in candidates:
+            with session.begin():
+                rows = model_query(context, models.FixedIp, session=session,
+                                   read_deleted="no").\
+                               filter_by(id=fixed_ip_id).\
+                               filter(network_or_none).\
+                               filter_by(instance_uuid=None).\
+                               filter_by(host=None).\
+                               update(values, synchronize_session=False)
+            if rows:
+                return address
 
 
 @require_context
@@ -1071,12 +1124,20 @@ def fixed_ip_create(context, values):
 
 @require_context
 def fixed_ip_bulk_create(context, ips):
+    """Insert fixed ips, which may be any iterable of value dicts.
+
+    The rows are inserted in chunks with a single executemany each, so
+    only one chunk of them is held in memory at a time.
+    """
+    ips = iter(ips)
+    insert = models.FixedIp.__table__.insert()
     session = get_session()
     with session.begin():
-        for ip in ips:
-            model = models.FixedIp()
-            model.update(ip)
-            session.add(model)
+        while True:
+            chunk = list(itertools.islice(ips, FIXED_IP_BULK_CREATE_CHUNK))
+            if not chunk:
+                break
+            session.execute(insert, chunk)
 
 
 @require_context
@@ -1262,6 +1323,17 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return result
 
 
+@require_context
+def fixed_ips_by_virtual_interfaces(context, vif_ids):
+    if not vif_ids:
+        return []
+
+    return model_query(context, models.FixedIp, read_deleted="no").\
+                 options(joinedload('floating_ips')).\
+                 filter(models.FixedIp.virtual_interface_id.in_(vif_ids)).\
+                 all()
+
+
 @require_context
 def fixed_ip_update(context, address, values):
     session = get_session()
@@ -1285,6 +1357,18 @@ def fixed_ip_count_by_project(context, project_id, session=None):
                 count()
 
 
+@require_admin_context
+def fixed_ip_count_by_projects(context, session=None):
+    rows = model_query(context, models.Instance.project_id,
+                       func.count(models.FixedIp.id),
+                       base_model=models.FixedIp, read_deleted="no",
+                       session=session).\
+                filter(models.Instance.uuid == models.FixedIp.instance_uuid).\
+                group_by(models.Instance.project_id).\
+                all()
+    return dict(rows)
+
+
 ###################
 
 
@@ -1359,6 +1443,22 @@ def virtual_interface_get_by_instance(context, instance_uuid):
     return vif_refs
 
 
+@require_context
+def virtual_interface_get_by_instances(context, instance_uuids):
+    """Gets all virtual interfaces for several instances.
+
+    :param instance_uuids: = uuids of the instances to retrieve vifs for
+    """
+    if not instance_uuids:
+        return []
+
+    vif_refs = _virtual_interface_query(context).\
+                 filter(models.VirtualInterface.instance_uuid.in_(
+                        instance_uuids)).\
+                 all()
+    return vif_refs
+
+
 @require_context
 def virtual_interface_get_by_instance_and_network(context, instance_uuid,
                                                   network_id):
@@ -1496,6 +1596,21 @@ def instance_data_get_for_project(context, project_id, session=None):
     return (result[0] or 0, result[1] or 0, result[2] or 0)
 
 
+@require_admin_context
+def instance_data_get_by_projects(context, session=None):
+    rows = model_query(context,
+                       models.Instance.project_id,
+                       func.count(models.Instance.id),
+                       func.sum(models.Instance.vcpus),
+                       func.sum(models.Instance.memory_mb),
+                       base_model=models.Instance,
+                       session=session).\
+                   group_by(models.Instance.project_id).\
+                   all()
+    return dict((row[0], (row[1] or 0, row[2] or 0, row[3] or 0))
+                for row in rows)
+
+
 @require_context
 def instance_destroy(context, instance_uuid, constraint=None):
     session = get_session()
@@ -1650,8 +1765,6 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     will be returned by default, unless there's a filter that says
     otherwise"""
 
-    sort_fn = {'desc': desc, 'asc': asc}
-
     if not session:
         session = get_session()
 
@@ -1662,11 +1775,6 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
         manual_joins, columns_to_join = _manual_join_columns(columns_to_join)
 
     query_prefix = session.query(models.Instance)
-    for column in columns_to_join:
-        query_prefix = query_prefix.options(joinedload(column))
-
-    query_prefix = query_prefix.order_by(sort_fn[sort_dir](
-            getattr(models.Instance, sort_key)))
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1713,18 +1821,44 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               filters)
 
     # paginate query
+    sort_keys = [sort_key, 'created_at', 'id']
     if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                           models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
-                           marker=marker,
-                           sort_dir=sort_dir)
+        # Only the sort keys of the marker are needed to find the page
+        marker_uuid = marker
+        marker = model_query(context, models.Instance, session=session,
+                             project_only=True).\
+                         with_entities(*[getattr(models.Instance, key)
+                                         for key in sort_keys]).\
+                         filter_by(uuid=marker_uuid).\
+                         first()
+        if marker is None:
+            raise exception.MarkerNotFound(marker_uuid)
+
+    if limit is None:
+        for column in columns_to_join:
+            query_prefix = query_prefix.options(joinedload(column))
+        query_prefix = sqlalchemyutils.paginate_query(query_prefix,
+                               models.Instance, limit, sort_keys,
+                               marker=marker, sort_dir=sort_dir)
+        instances = query_prefix.all()
+    else:
+        # Page through the ids first, so the joined columns are only
+        # fetched for the instances on the requested page.
+        id_query = query_prefix.with_entities(models.Instance.id)
+        id_query = sqlalchemyutils.paginate_query(id_query,
+                               models.Instance, limit, sort_keys,
+                               marker=marker, sort_dir=sort_dir)
+        ids = [row.id for row in id_query.all()]
+        instances = []
+        if ids:
+            query = session.query(models.Instance).\
+                            filter(models.Instance.id.in_(ids))
+            for column in columns_to_join:
+                query = query.options(joinedload(column))
+            instances_by_id = dict((inst.id, inst) for inst in query.all())
+            instances = [instances_by_id[inst_id] for inst_id in ids]
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return _instances_fill_metadata(context, instances, manual_joins)
 
 
 def tag_filter(query, model, tag_model, tag_model_col, filters):
@@ -1803,10 +1937,61 @@ def tag_filter(query, model, tag_model, tag_model_col, filters):
     return query
 
 
+_REGEX_METACHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def _regex_literal(regex):
+    """Check whether an anchored regex only matches a literal string.
+
+    Returns a (literal, exact) tuple for '^literal$' (exact) and '^literal'
+    (prefix) patterns, where metacharacters in the literal may be escaped
+    with a backslash, or None for anything else.
+    """
+    if not regex.startswith('^'):
+        return None
+
+    chars = []
+    exact = False
+    i = 1
+    while i < len(regex):
+        char = regex[i]
+        if char == '\\':
+            if regex[i + 1:i + 2] not in _REGEX_METACHARS:
+                return None
+            chars.append(regex[i + 1])
+            i += 2
+            continue
+        if char == '$' and i == len(regex) - 1:
+            exact = True
+        elif char in _REGEX_METACHARS:
+            return None
+        else:
+            chars.append(char)
+        i += 1
+
+    if not chars:
+        return None
+    return ''.join(chars), exact
+
+
+def _prefix_filter(column_attr, prefix, db_string):
+    """Returns an index friendly, case preserving prefix match."""
+    if db_string == 'sqlite':
+        # sqlite only uses an index for LIKE and GLOB with literal patterns,
+        # and its LIKE is not case sensitive. A range of the BINARY
+        # collation matches exactly the strings starting with prefix.
+        upper = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+        return and_(column_attr >= prefix, column_attr < upper)
+    pattern = re.sub(r'([!%_])', r'!\1', prefix)
+    return column_attr.like(pattern + '%', escape='!')
+
+
 def regex_filter(query, model, filters):
     """Applies regular expression filtering to a query.
 
-    Returns the updated query.
+    Returns the updated query.  Anchored regexes that only match a literal
+    ('^foo$') or a literal prefix ('^foo') are turned into equality and
+    prefix matches that can use an index.
 
     :param query: query to apply filters to
     :param model: model object the query applies to
@@ -1828,8 +2013,17 @@ def regex_filter(query, model, filters):
             continue
         if 'property' == type(column_attr).__name__:
             continue
-        query = query.filter(column_attr.op(db_regexp_op)(
-                                    str(filters[filter_name])))
+        value = str(filters[filter_name])
+        literal = None
+        if db_string in regexp_op_map and db_string != 'oracle':
+            literal = _regex_literal(value)
+        if literal is None:
+            query = query.filter(column_attr.op(db_regexp_op)(value))
+        elif literal[1]:
+            query = query.filter(column_attr == literal[0])
+        else:
+            query = query.filter(_prefix_filter(column_attr, literal[0],
+                                                db_string))
     return query
 
 
@@ -1854,6 +2048,49 @@ def instance_get_active_by_window_joined(context, begin, end=None,
     return _instances_fill_metadata(context, query.all())
 
 
+@require_context
+def instance_get_active_by_window_usage(context, begin, end=None,
+                                        project_id=None, marker=None,
+                                        limit=None):
+    """Return the usage columns of instances active during window."""
+    columns = [models.Instance.id,
+               models.Instance.uuid,
+               models.Instance.project_id,
+               models.Instance.launched_at,
+               models.Instance.terminated_at,
+               models.Instance.deleted,
+               models.Instance.instance_type_id]
+    session = get_session()
+    query = session.query(*columns).\
+                  filter(or_(models.Instance.terminated_at == None,
+                             models.Instance.terminated_at > begin))
+    if end:
+        query = query.filter(models.Instance.launched_at < end)
+    if project_id:
+        query = query.filter_by(project_id=project_id)
+    if marker is not None:
+        query = query.filter(models.Instance.id > marker)
+    query = query.order_by(asc(models.Instance.id))
+    if limit:
+        query = query.limit(limit)
+
+    keys = [column.key for column in columns]
+    instances = [dict(zip(keys, row)) for row in query.all()]
+    if not instances:
+        return instances
+
+    # Only the flavor is needed out of the system_metadata
+    sys_meta = collections.defaultdict(list)
+    rows = _instance_system_metadata_get_multi(context,
+            [inst['uuid'] for inst in instances], session=session).\
+            filter(models.InstanceSystemMetadata.key.like('instance_type_%'))
+    for row in rows:
+        sys_meta[row['instance_uuid']].append(row)
+    for inst in instances:
+        inst['system_metadata'] = sys_meta[inst['uuid']]
+    return instances
+
+
 @require_admin_context
 def _instance_get_all_query(context, project_only=False, joins=None):
     if joins is None:
@@ -2345,6 +2582,17 @@ def network_get_all_by_uuids(context, network_uuids,
 
     return result
 
+
+@require_context
+def network_get_all_by_ids(context, network_ids, project_only="allow_none"):
+    if not network_ids:
+        return []
+
+    return model_query(context, models.Network, read_deleted="no",
+                       project_only=project_only).\
+                filter(models.Network.id.in_(network_ids)).\
+                all()
+
 # NOTE(vish): pylint complains because of the long method name, but
 #             it fits with the names of the rest of the methods
 # pylint: disable=C0103
@@ -2858,6 +3106,155 @@ def quota_reserve(context, resources, quotas, deltas, expire,
     return reservations
 
 
+@require_admin_context
+def quota_usage_refresh_all(context, resources, until_refresh):
+    """Recount the usages of all projects.
+
+    Each distinct sync_all routine of the resources counts its resources
+    for every project with one grouped query, and the usages of each
+    resource are then set with one update, regardless of the number of
+    projects.  Usages which don't exist yet are left to quota_reserve.
+    """
+    syncs = {}
+    for resource in resources.values():
+        sync_all = getattr(resource, 'sync_all', None)
+        if sync_all:
+            syncs.setdefault(sync_all, []).append(resource.name)
+
+    session = get_session()
+    with session.begin():
+        for sync_all, names in syncs.items():
+            counts = sync_all(context, session)
+            for name in names:
+                in_use = dict((project_id, usages[name])
+                              for project_id, usages in counts.items()
+                              if usages.get(name))
+                if in_use:
+                    in_use = case(in_use, value=models.QuotaUsage.project_id,
+                                  else_=0)
+                else:
+                    in_use = 0
+                model_query(context, models.QuotaUsage, session=session,
+                            read_deleted="no").\
+                        filter_by(resource=name).\
+                        update({'in_use': in_use,
+                                'until_refresh': until_refresh or None},
+                               synchronize_session=False)
+
+
+@require_context
+def quota_reserve_conditional(context, resources, quotas, deltas, expire,
+                              until_refresh, max_age, project_id=None):
+    """Reserve quota with conditional counter updates.
+
+    Instead of locking all usages of the project, the reserved count of
+    each usage is raised with an UPDATE which only matches while the
+    result stays within the quota.  Usages which are missing or need a
+    refresh are handed to quota_reserve, which recounts them under lock.
+    Since counting down until_refresh is itself a read-modify-write, it
+    only applies on that path.
+    """
+    if project_id is None:
+        project_id = context.project_id
+
+    usages = dict((row.resource, row) for row in
+                  model_query(context, models.QuotaUsage,
+                              read_deleted="no").
+                  filter_by(project_id=project_id).
+                  all())
+    for resource in deltas:
+        usage = usages.get(resource)
+        if (usage is None or usage.in_use < 0 or
+            (max_age and timeutils.is_older_than(
+                    usage.updated_at or usage.created_at, max_age))):
+            return quota_reserve(context, resources, quotas, deltas, expire,
+                                 until_refresh, max_age,
+                                 project_id=project_id)
+
+    elevated = context.elevated()
+    session = get_session()
+    with session.begin():
+        overs = []
+        # Update the usages in a stable order to avoid deadlocks.  Only
+        # positive deltas are reserved, see quota_reserve.
+        for resource in sorted(deltas):
+            delta = deltas[resource]
+            if delta <= 0:
+                continue
+            query = model_query(context, models.QuotaUsage, session=session,
+                                read_deleted="no").\
+                            filter_by(id=usages[resource].id)
+            if quotas[resource] >= 0:
+                query = query.filter(models.QuotaUsage.in_use +
+                                     models.QuotaUsage.reserved + delta <=
+                                     quotas[resource])
+            updated = query.update(
+                    {'reserved': models.QuotaUsage.reserved + delta},
+                    synchronize_session=False)
+            if not updated:
+                overs.append(resource)
+
+        # Raising within the transaction rolls back the reservations
+        # already made for the other resources.
+        if overs:
+            usages = dict((k, dict(in_use=v['in_use'],
+                                   reserved=v['reserved']))
+                          for k, v in usages.items())
+            raise exception.OverQuota(overs=sorted(overs), quotas=quotas,
+                                      usages=usages)
+
+        reservations = []
+        for resource, delta in deltas.items():
+            reservation = reservation_create(elevated, str(uuid.uuid4()),
+                                             usages[resource], project_id,
+                                             resource, delta, expire,
+                                             session=session)
+            reservations.append(reservation.uuid)
+
+    return reservations
+
+
+def _reservation_release_conditional(context, reservations, commit):
+    session = get_session()
+    with session.begin():
+        rows = model_query(context, models.Reservation, session=session,
+                           read_deleted="no").\
+                       filter(models.Reservation.uuid.in_(reservations)).\
+                       all()
+        for reservation in sorted(rows, key=lambda row: row.usage_id):
+            # Deleting the reservation first ensures it is applied once,
+            # even if it is committed or rolled back concurrently.
+            deleted = model_query(context, models.Reservation,
+                                  session=session, read_deleted="no").\
+                              filter_by(id=reservation.id).\
+                              soft_delete(synchronize_session=False)
+            if not deleted:
+                continue
+
+            updates = {}
+            if reservation.delta >= 0:
+                updates['reserved'] = (models.QuotaUsage.reserved -
+                                       reservation.delta)
+            if commit:
+                updates['in_use'] = (models.QuotaUsage.in_use +
+                                     reservation.delta)
+            if updates:
+                model_query(context, models.QuotaUsage, session=session,
+                            read_deleted="no").\
+                        filter_by(id=reservation.usage_id).\
+                        update(updates, synchronize_session=False)
+
+
+@require_context
+def reservation_commit_conditional(context, reservations, project_id=None):
+    _reservation_release_conditional(context, reservations, True)
+
+
+@require_context
+def reservation_rollback_conditional(context, reservations, project_id=None):
+    _reservation_release_conditional(context, reservations, False)
+
+
 def _quota_reservations_query(session, context, reservations):
     """Return the relevant reservations."""
 
@@ -2927,10 +3324,22 @@ def reservation_expire(context):
                                         session=session, read_deleted="no").\
                             filter(models.Reservation.expire < current_time)
 
-        for reservation in reservation_query.join(models.QuotaUsage).all():
-            if reservation.delta >= 0:
-                reservation.usage.reserved -= reservation.delta
-                reservation.usage.save(session=session)
+        # Release the reserved counts of all expired reservations, only
+        # positive deltas were reserved in the first place.
+        reservations = models.Reservation.__table__
+        expired = and_(reservations.c.deleted == 0,
+                       reservations.c.expire < current_time,
+                       reservations.c.delta >= 0)
+        reserved = select([func.coalesce(func.sum(reservations.c.delta), 0)]).\
+                       where(and_(expired, reservations.c.usage_id ==
+                                           models.QuotaUsage.id)).\
+                       as_scalar()
+        model_query(context, models.QuotaUsage, session=session,
+                    read_deleted="no").\
+                filter(models.QuotaUsage.id.in_(
+                       select([reservations.c.usage_id]).where(expired))).\
+                update({'reserved': models.QuotaUsage.reserved - reserved},
+                       synchronize_session=False)
 
         reservation_query.soft_delete(synchronize_session=False)
 
@@ -3081,6 +3490,16 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instances(context, instance_uuids):
+    if not instance_uuids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     _block_device_mapping_get_query(context).\
@@ -3300,6 +3719,17 @@ def security_group_count_by_project(context, project_id, session=None):
                    filter_by(project_id=project_id).\
                    count()
 
+
+@require_admin_context
+def security_group_count_by_projects(context, session=None):
+    rows = model_query(context, models.SecurityGroup.project_id,
+                       func.count(models.SecurityGroup.id),
+                       base_model=models.SecurityGroup, read_deleted="no",
+                       session=session).\
+                   group_by(models.SecurityGroup.project_id).\
+                   all()
+    return dict(rows)
+
 ###################
 
 
@@ -4396,6 +4826,17 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_ids_by_uuids(context, image_uuids):
+    """Find the local s3 image ids represented by the provided uuids."""
+    if not image_uuids:
+        return {}
+    rows = model_query(context, models.S3Image.uuid, models.S3Image.id,
+                       base_model=models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 all()
+    return dict(rows)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     try:
@@ -4861,6 +5302,21 @@ def get_ec2_instance_id_by_uuid(context, instance_id, session=None):
     return result['id']
 
 
+@require_context
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    rows = model_query(context,
+                       models.InstanceIdMapping.uuid,
+                       models.InstanceIdMapping.id,
+                       base_model=models.InstanceIdMapping,
+                       read_deleted='yes').\
+                    filter(models.InstanceIdMapping.uuid.in_(
+                        instance_uuids)).\
+                    all()
+    return dict(rows)
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id, session=None):
     result = _ec2_instance_get_query(context,
@@ -4947,6 +5403,51 @@ def task_log_end_task(context, task_name, period_beginning, period_ending,
             raise exception.TaskNotRunning(task_name=task_name, host=host)
 
 
+##################
+
+
+@require_admin_context
+def instance_usage_rollup_set(context, host, period_beginning, period_ending,
+                              rollups):
+    session = get_session()
+    with session.begin():
+        model_query(context, models.InstanceUsageRollup,
+                    session=session, read_deleted="yes").\
+                filter_by(host=host).\
+                filter(models.InstanceUsageRollup.period_beginning >=
+                       period_beginning).\
+                filter(models.InstanceUsageRollup.period_beginning <
+                       period_ending).\
+                delete(synchronize_session=False)
+
+        for values in rollups:
+            rollup_ref = models.InstanceUsageRollup()
+            rollup_ref.update(values)
+            rollup_ref.host = host
+            session.add(rollup_ref)
+
+
+@require_context
+def instance_usage_rollup_get_totals(context, period_beginning,
+                                     period_ending, project_id=None):
+    rollup = models.InstanceUsageRollup
+    columns = [func.sum(rollup.instance_hours),
+               func.sum(rollup.vcpu_hours),
+               func.sum(rollup.memory_mb_hours),
+               func.sum(rollup.local_gb_hours)]
+    query = model_query(context, rollup.project_id, *columns,
+                        base_model=rollup).\
+                filter(rollup.period_beginning >= period_beginning).\
+                filter(rollup.period_beginning < period_ending)
+    if project_id:
+        query = query.filter_by(project_id=project_id)
+    query = query.group_by(rollup.project_id)
+
+    keys = ['project_id', 'instance_hours', 'vcpu_hours', 'memory_mb_hours',
+            'local_gb_hours']
+    return [dict(zip(keys, row)) for row in query.all()]
+
+
 def _get_default_deleted_value(table):
     # TODO(dripton): It would be better to introspect the actual default value
     # from the column, but I don't see a way to do that in the low-level APIs
@@ -0,0 +1,71 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, DateTime, Float, Index, Integer, MetaData
+from sqlalchemy import String, Table
+
+from nova.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instance_usage_rollups = Table('instance_usage_rollups', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Integer, default=0),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('project_id', String(length=255)),
+        Column('host', String(length=255)),
+        Column('period_beginning', DateTime, nullable=False),
+        Column('instance_hours', Float, default=0),
+        Column('vcpu_hours', Float, default=0),
+        Column('memory_mb_hours', Float, default=0),
+        Column('local_gb_hours', Float, default=0),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+    )
+
+    try:
+        instance_usage_rollups.create()
+    except Exception:
+        msg = "Exception while creating table 'instance_usage_rollups'"
+        LOG.exception(msg)
+        raise
+
+    Index('instance_usage_rollups_period_beginning_project_id_idx',
+          instance_usage_rollups.c.period_beginning,
+          instance_usage_rollups.c.project_id).create(migrate_engine)
+    Index('instance_usage_rollups_host_period_beginning_idx',
+          instance_usage_rollups.c.host,
+          instance_usage_rollups.c.period_beginning).create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    instance_usage_rollups = Table('instance_usage_rollups', meta,
+                                   autoload=True)
+    try:
+        instance_usage_rollups.drop()
+    except Exception:
+        msg = "Exception while dropping table 'instance_usage_rollups'"
+        LOG.exception(msg)
+        raise
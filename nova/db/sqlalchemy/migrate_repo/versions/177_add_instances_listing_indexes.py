@@ -0,0 +1,50 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2013 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import MetaData, Table, Index
+
+
+# Based on the default sorting and filtering of instance_get_all_by_filters
+# from: nova/db/sqlalchemy/api.py
+INDEXES = [
+    ('instances_project_id_deleted_created_at_idx',
+     ('project_id', 'deleted', 'created_at')),
+    ('instances_deleted_created_at_idx',
+     ('deleted', 'created_at')),
+]
+
+
+def _indexes(instances):
+    return [Index(name, *[getattr(instances.c, column) for column in columns])
+            for name, columns in INDEXES]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+    for index in _indexes(instances):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instances = Table('instances', meta, autoload=True)
+    for index in _indexes(instances):
+        index.drop(migrate_engine)
@@ -990,3 +990,16 @@ class TaskLog(BASE, NovaBase):
     message = Column(String(255), nullable=False)
     task_items = Column(Integer(), default=0)
     errors = Column(Integer(), default=0)
+
+
+class InstanceUsageRollup(BASE, NovaBase):
+    """Instance usage of a project on a host, rolled up per hour."""
+    __tablename__ = 'instance_usage_rollups'
+    id = Column(Integer, primary_key=True, nullable=False, autoincrement=True)
+    project_id = Column(String(255))
+    host = Column(String(255))
+    period_beginning = Column(DateTime, nullable=False)
+    instance_hours = Column(Float, default=0)
+    vcpu_hours = Column(Float, default=0)
+    memory_mb_hours = Column(Float, default=0)
+    local_gb_hours = Column(Float, default=0)
@@ -35,6 +35,7 @@ from nova import exception
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import timeutils
+from nova import utils
 
 glance_opts = [
     cfg.StrOpt('glance_host',
@@ -64,6 +65,10 @@ glance_opts = [
                 help='A list of url scheme that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.IntOpt('glance_download_buffer_size',
+               default=1024 * 1024,
+               help='Size in bytes of the buffer used when writing '
+                    'downloaded images to disk'),
     ]
 
 LOG = logging.getLogger(__name__)
@@ -258,18 +263,26 @@ class GlanceImageService(object):
 
         return getattr(image_meta, 'direct_url', None)
 
-    def download(self, context, image_id, data=None):
-        """Calls out to Glance for data and writes data."""
+    def download(self, context, image_id, data=None, dst_path=None):
+        """Calls out to Glance for data and writes data.
+
+        The image is written to the file object data or, when it is not
+        given, to the file at dst_path.  With neither, the image chunks
+        are returned.
+        """
         if 'file' in CONF.allowed_direct_url_schemes:
             location = self.get_location(context, image_id)
             o = urlparse.urlparse(location)
             if o.scheme == "file":
-                with open(o.path, "r") as f:
-                    # FIXME(jbresnah) a system call to cp could have
-                    # significant performance advantages, however we
-                    # do not have the path to files at this point in
-                    # the abstraction.
-                    shutil.copyfileobj(f, data)
+                if data is None and dst_path:
+                    # cp shares the blocks of the image where the
+                    # filesystem supports it, and otherwise copies it
+                    # without passing the data through python.
+                    utils.execute('cp', '--reflink=auto', o.path, dst_path)
+                else:
+                    with open(o.path, "r") as f:
+                        shutil.copyfileobj(f, data,
+                                           CONF.glance_download_buffer_size)
                 return
 
         try:
@@ -277,8 +290,14 @@ class GlanceImageService(object):
         except Exception:
             _reraise_translated_image_exception(image_id)
 
-        if data is None:
+        if data is None and not dst_path:
             return image_chunks
+
+        if data is None:
+            with open(dst_path, 'wb',
+                      CONF.glance_download_buffer_size) as data:
+                for chunk in image_chunks:
+                    data.write(chunk)
         else:
             for chunk in image_chunks:
                 data.write(chunk)
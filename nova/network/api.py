@@ -68,7 +68,7 @@ def update_instance_cache_with_nw_info(api, context, instance,
     try:
         if not isinstance(nw_info, network_model.NetworkInfo):
             nw_info = None
-        if not nw_info:
+        if nw_info is None:
             nw_info = api._get_instance_nw_info(context, instance)
         # update cache
         cache = {'network_info': nw_info.json()}
@@ -372,6 +372,44 @@ class API(base.Base):
                                            result, conductor_api)
         return result
 
+    @wrap_check_policy
+    def get_instance_nw_info_bulk(self, context, instances,
+                                  conductor_api=None):
+        """Returns the network info of several instances keyed by uuid.
+
+        The info_cache of every instance is updated as well.  Instances
+        whose network info could not be retrieved are left out.
+        """
+        rxtx_factors = {}
+        hosts = {}
+        valid_instances = []
+        for instance in instances:
+            try:
+                instance_type = instance_types.extract_instance_type(instance)
+            except Exception:
+                LOG.exception(_('Failed to get network info'),
+                              instance=instance)
+                continue
+            rxtx_factors[instance['uuid']] = instance_type['rxtx_factor']
+            hosts[instance['uuid']] = instance['host']
+            valid_instances.append(instance)
+        if not valid_instances:
+            return {}
+        results = self.network_rpcapi.get_instance_nw_info_bulk(context,
+                instance_uuids=[inst['uuid'] for inst in valid_instances],
+                rxtx_factors=rxtx_factors, hosts=hosts)
+
+        nw_infos = {}
+        for instance in valid_instances:
+            if instance['uuid'] not in results:
+                continue
+            result = network_model.NetworkInfo.hydrate(
+                    results[instance['uuid']])
+            update_instance_cache_with_nw_info(self, context, instance,
+                                               result, conductor_api)
+            nw_infos[instance['uuid']] = result
+        return nw_infos
+
     def _get_instance_nw_info(self, context, instance):
         """Returns all network info related to an instance."""
         instance_type = instance_types.extract_instance_type(instance)
@@ -122,6 +122,11 @@ linux_net_opts = [
                default='DROP',
                help=('The table that iptables to jump to when a packet is '
                      'to be dropped.')),
+    cfg.BoolOpt('iptables_apply_changed_tables_only',
+                default=False,
+                help='Only restore the iptables tables whose chains or '
+                     'rules were changed, and skip iptables-restore when '
+                     'nothing changed'),
     ]
 
 CONF = cfg.CONF
@@ -142,6 +147,25 @@ def get_binary_name():
 binary_name = get_binary_name()
 
 
+def _strip_counts(line):
+    """Strip the [packet:byte] counts from the beginning of a line."""
+    if line.startswith('['):
+        line = line.split(']', 1)[1]
+    return line.strip()
+
+
+def _table_state(lines):
+    """Return the chains and rules of a table, ignoring their counts."""
+    chains = set()
+    rules = []
+    for line in lines:
+        if line.startswith(':'):
+            chains.add(line.rsplit(' [', 1)[0])
+        elif line.startswith('['):
+            rules.append(_strip_counts(line))
+    return chains, rules
+
+
 class IptablesRule(object):
     """An iptables rule.
 
@@ -291,10 +315,8 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        self.rules = [rule for rule in self.rules
+                      if rule.chain != chain or rule.wrap != wrap]
 
 
 class IptablesManager(object):
@@ -414,10 +436,23 @@ class IptablesManager(object):
                                                 run_as_root=True,
                                                 attempts=5)
             all_lines = all_tables.split('\n')
+            changed_lines = []
             for table_name, table in tables.iteritems():
                 start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                        all_lines[start:end], table, table_name)
+                current_lines = all_lines[start:end]
+                new_lines = self._modify_rules(current_lines, table,
+                                               table_name)
+                all_lines[start:end] = new_lines
+                if (not current_lines or
+                        _table_state(new_lines) !=
+                        _table_state(current_lines)):
+                    changed_lines += new_lines
+
+            if CONF.iptables_apply_changed_tables_only:
+                # iptables-restore leaves the tables it is not given alone
+                if not changed_lines:
+                    continue
+                all_lines = changed_lines
             self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
                          process_input='\n'.join(all_lines),
                          attempts=5)
@@ -449,27 +484,25 @@ class IptablesManager(object):
             current_lines = fake_table
 
         # Remove any trace of our rules
-        new_filter = filter(lambda line: binary_name not in line,
-                            current_lines)
+        new_filter = [line for line in current_lines
+                      if binary_name not in line]
 
         top_rules = []
         bottom_rules = []
 
         if CONF.iptables_top_regex:
             regex = re.compile(CONF.iptables_top_regex)
-            temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
-            top_rules = temp_filter
+            top_rules = [line for line in new_filter if regex.search(line)]
+            top_rule_strs = set(line.strip() for line in top_rules)
+            new_filter = [line for line in new_filter
+                          if line.strip() not in top_rule_strs]
 
         if CONF.iptables_bottom_regex:
             regex = re.compile(CONF.iptables_bottom_regex)
-            temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                    new_filter)
-            bottom_rules = temp_filter
+            bottom_rules = [line for line in new_filter if regex.search(line)]
+            bottom_rule_strs = set(line.strip() for line in bottom_rules)
+            new_filter = [line for line in new_filter
+                          if line.strip() not in bottom_rule_strs]
 
         seen_chains = False
         rules_index = 0
@@ -484,41 +517,37 @@ class IptablesManager(object):
         if not seen_chains:
             rules_index = 2
 
+        # rule.top == True means we want this rule to be at the top.
+        # Further down, we weed out duplicates from the bottom of the
+        # list, so here we remove the dupes ahead of time.
+
+        # We don't want to remove an entry if it has non-zero
+        # [packet:byte] counts and replace it with [0:0], so let's
+        # go look for a duplicate, and over-ride our table rule if
+        # found.
+        top_rule_strs = set(_strip_counts(str(rule))
+                            for rule in rules if rule.top)
+        duplicates = {}
+        if top_rule_strs:
+            remaining = []
+            for line in new_filter:
+                line_str = _strip_counts(line)
+                if line_str in top_rule_strs:
+                    # keep the last entry, if there is one
+                    duplicates[line_str] = line
+                else:
+                    remaining.append(line)
+            new_filter = remaining
+
         our_rules = top_rules
         bot_rules = []
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
-                # rule.top == True means we want this rule to be at the top.
-                # Further down, we weed out duplicates from the bottom of the
-                # list, so here we remove the dupes ahead of time.
-
-                # We don't want to remove an entry if it has non-zero
-                # [packet:byte] counts and replace it with [0:0], so let's
-                # go look for a duplicate, and over-ride our table rule if
-                # found.
-
-                # ignore [packet:byte] counts at beginning of line
-                if rule_str.startswith('['):
-                    rule_str = rule_str.split(']', 1)[1]
-                dup_filter = filter(lambda s: rule_str.strip() in s.strip(),
-                                    new_filter)
-
-                new_filter = filter(lambda s:
-                                    rule_str.strip() not in s.strip(),
-                                    new_filter)
-                # if no duplicates, use original rule
-                if dup_filter:
-                    # grab the last entry, if there is one
-                    dup = dup_filter[-1]
-                    rule_str = str(dup)
-                else:
-                    rule_str = str(rule)
-                rule_str.strip()
-
-                our_rules += [rule_str]
+                our_rules.append(duplicates.get(_strip_counts(rule_str),
+                                                rule_str))
             else:
-                bot_rules += [rule_str]
+                bot_rules.append(rule_str)
 
         our_rules += bot_rules
 
@@ -532,62 +561,43 @@ class IptablesManager(object):
 
         commit_index = new_filter.index('COMMIT')
         new_filter[commit_index:commit_index] = bottom_rules
-        seen_lines = set()
 
-        def _weed_out_duplicates(line):
-            # ignore [packet:byte] counts at beginning of lines
-            if line.startswith('['):
-                line = line.split(']', 1)[1]
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+        # ignore [packet:byte] counts at beginning of rules
+        remove_rule_strs = set(_strip_counts(str(rule))
+                               for rule in remove_rules)
 
-        def _weed_out_removes(line):
+        def _is_removed(line, line_str):
             # We need to find exact matches here
             if line.startswith(':'):
                 # it's a chain, for example, ":nova-billing - [0:0]"
                 # strip off everything except the chain name
-                line = line.split(':')[1]
-                line = line.split('- [')[0]
-                line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                chain = line.split(':')[1].split('- [')[0].strip()
+                return chain in remove_chains
             elif line.startswith('['):
                 # it's a rule
-                # ignore [packet:byte] counts at beginning of lines
-                line = line.split(']', 1)[1]
-                line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
-
-            # Leave it alone
-            return True
+                return line_str in remove_rule_strs
+            return False
 
         # We filter duplicates, letting the *last* occurrence take
         # precendence.  We also filter out anything in the "remove"
         # lists.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter = filter(_weed_out_removes, new_filter)
-        new_filter.reverse()
+        seen_lines = set()
+        new_lines = []
+        for line in reversed(new_filter):
+            # ignore [packet:byte] counts at beginning of lines
+            line_str = _strip_counts(line)
+            if line_str in seen_lines:
+                continue
+            seen_lines.add(line_str)
+            if not _is_removed(line, line_str):
+                new_lines.append(line)
+        new_lines.reverse()
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
 
-        return new_filter
+        return new_lines
 
 
 # NOTE(jkoelker) This is just a nice little stub point since mocking
@@ -270,7 +270,7 @@ class NetworkManager(manager.Manager):
         The one at a time part is to flatten the layout to help scale
     """
 
-    RPC_API_VERSION = '1.9'
+    RPC_API_VERSION = '1.10'
 
     # If True, this manager requires VIF to create a bridge.
     SHOULD_CREATE_BRIDGE = False
@@ -589,20 +589,80 @@ class NetworkManager(manager.Manager):
                                                          rxtx_factor, host)
         return nw_info
 
+    def get_instance_nw_info_bulk(self, context, instance_uuids,
+                                  rxtx_factors=None, hosts=None):
+        """Creates network info lists for several instances at once.
+
+        The vifs, networks, fixed ips and floating ips of all instances
+        are each loaded with a single query rather than once per instance.
+        :param rxtx_factors: dict of instance uuid to rxtx_factor
+        :param hosts: dict of instance uuid to the host of the instance
+        :returns: dict of instance uuid to network info list
+        """
+        rxtx_factors = rxtx_factors or {}
+        hosts = hosts or {}
+        nw_infos = dict((instance_uuid, network_model.NetworkInfo())
+                        for instance_uuid in instance_uuids)
+
+        vifs = self.db.virtual_interface_get_by_instances(context,
+                                                          instance_uuids)
+        network_ids = set(vif['network_id'] for vif in vifs
+                          if vif.get('network_id') is not None)
+        networks = dict((network['id'], network) for network in
+                        self._get_networks_by_ids(context, list(network_ids)))
+
+        fixed_ips = {}
+        for fixed_ip in self.db.fixed_ips_by_virtual_interfaces(context,
+                                            [vif['id'] for vif in vifs]):
+            vif_ips = fixed_ips.setdefault(fixed_ip['virtual_interface_id'],
+                                           [])
+            vif_ips.append(fixed_ip)
+
+        # multi_host dhcp servers are per network and host, so only look
+        # each of them up once.
+        dhcp_servers = {}
+        for vif in vifs:
+            instance_uuid = vif['instance_uuid']
+            network = networks.get(vif.get('network_id'))
+            if not network:
+                nw_infos[instance_uuid].append(self._build_vif_model(vif))
+                continue
+
+            host = hosts.get(instance_uuid)
+            dhcp_server = None
+            if self.DHCP and network.get('multi_host'):
+                key = (network['id'], host)
+                if key not in dhcp_servers:
+                    dhcp_servers[key] = self._get_dhcp_ip(context, network,
+                                                          host)
+                dhcp_server = dhcp_servers[key]
+            subnets = self._get_subnets_from_network(context, network, vif,
+                    host, ipam_subnets=self.ipam.get_subnets_by_network(
+                                                                network),
+                    dhcp_server=dhcp_server)
+
+            vif_ips = fixed_ips.get(vif['id'], [])
+            v4_IPs = [fixed_ip['address'] for fixed_ip in vif_ips]
+            v6_IPs = self.ipam.get_v6_ips_by_network(network, vif,
+                                                     network['project_id'])
+            floating_ips = dict((fixed_ip['address'], fixed_ip['floating_ips'])
+                                for fixed_ip in vif_ips)
+
+            nw_infos[instance_uuid].append(self._build_vif_model(vif,
+                    network, subnets, v4_IPs + v6_IPs, floating_ips,
+                    rxtx_factors.get(instance_uuid)))
+
+        return nw_infos
+
     def build_network_info_model(self, context, vifs, networks,
                                  rxtx_factor, instance_host):
         """Builds a NetworkInfo object containing all network information
         for an instance"""
         nw_info = network_model.NetworkInfo()
         for vif in vifs:
-            vif_dict = {'id': vif['uuid'],
-                        'type': network_model.VIF_TYPE_BRIDGE,
-                        'address': vif['address']}
-
             # handle case where vif doesn't have a network
             if not networks.get(vif['uuid']):
-                vif = network_model.VIF(**vif_dict)
-                nw_info.append(vif)
+                nw_info.append(self._build_vif_model(vif))
                 continue
 
             # get network dict for vif from args and build the subnets
@@ -610,12 +670,6 @@ class NetworkManager(manager.Manager):
             subnets = self._get_subnets_from_network(context, network, vif,
                                                      instance_host)
 
-            # if rxtx_cap data are not set everywhere, set to none
-            try:
-                rxtx_cap = network['rxtx_base'] * rxtx_factor
-            except (TypeError, KeyError):
-                rxtx_cap = None
-
             # get fixed_ips
             v4_IPs = self.ipam.get_v4_ips_by_interface(context,
                                                        network['uuid'],
@@ -626,45 +680,68 @@ class NetworkManager(manager.Manager):
                                                        vif['uuid'],
                                                        network['project_id'])
 
-            # create model FixedIPs from these fixed_ips
-            network_IPs = [network_model.FixedIP(address=ip_address)
-                           for ip_address in v4_IPs + v6_IPs]
-
             # get floating_ips for each fixed_ip
-            # add them to the fixed ip
-            for fixed_ip in network_IPs:
-                if fixed_ip['version'] == 6:
-                    continue
-                gfipbfa = self.ipam.get_floating_ips_by_fixed_address
-                floating_ips = gfipbfa(context, fixed_ip['address'])
-                floating_ips = [network_model.IP(address=ip['address'],
-                                                 type='floating')
-                                for ip in floating_ips]
-                for ip in floating_ips:
-                    fixed_ip.add_floating_ip(ip)
-
-            # add ips to subnets they belong to
-            for subnet in subnets:
-                subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
-                                 if fixed_ip.is_in_subnet(subnet)]
-
-            # convert network into a Network model object
-            network = network_model.Network(**self._get_network_dict(network))
-
-            # since network currently has no subnets, easily add them all
-            network['subnets'] = subnets
-
-            # add network and rxtx cap to vif_dict
-            vif_dict['network'] = network
-            if rxtx_cap:
-                vif_dict['rxtx_cap'] = rxtx_cap
-
-            # create the vif model and add to network_info
-            vif = network_model.VIF(**vif_dict)
-            nw_info.append(vif)
+            gfipbfa = self.ipam.get_floating_ips_by_fixed_address
+            floating_ips = dict((address, gfipbfa(context, address))
+                                for address in v4_IPs)
+
+            nw_info.append(self._build_vif_model(vif, network, subnets,
+                                                 v4_IPs + v6_IPs,
+                                                 floating_ips, rxtx_factor))
 
         return nw_info
 
+    def _build_vif_model(self, vif, network=None, subnets=None,
+                         ip_addresses=None, floating_ips=None,
+                         rxtx_factor=None):
+        """Builds the VIF model of a vif from its already retrieved
+        network, subnets, fixed ip addresses and floating ips, the latter
+        being a dict of fixed address to floating ips."""
+        vif_dict = {'id': vif['uuid'],
+                    'type': network_model.VIF_TYPE_BRIDGE,
+                    'address': vif['address']}
+
+        if not network:
+            return network_model.VIF(**vif_dict)
+
+        # if rxtx_cap data are not set everywhere, set to none
+        try:
+            rxtx_cap = network['rxtx_base'] * rxtx_factor
+        except (TypeError, KeyError):
+            rxtx_cap = None
+
+        # create model FixedIPs from these fixed_ips
+        network_IPs = [network_model.FixedIP(address=ip_address)
+                       for ip_address in ip_addresses]
+
+        # add the floating_ips of each fixed_ip to the fixed ip
+        for fixed_ip in network_IPs:
+            if fixed_ip['version'] == 6:
+                continue
+            for ip in floating_ips.get(fixed_ip['address'], []):
+                fixed_ip.add_floating_ip(network_model.IP(
+                                             address=ip['address'],
+                                             type='floating'))
+
+        # add ips to subnets they belong to
+        for subnet in subnets:
+            subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
+                             if fixed_ip.is_in_subnet(subnet)]
+
+        # convert network into a Network model object
+        network = network_model.Network(**self._get_network_dict(network))
+
+        # since network currently has no subnets, easily add them all
+        network['subnets'] = subnets
+
+        # add network and rxtx cap to vif_dict
+        vif_dict['network'] = network
+        if rxtx_cap:
+            vif_dict['rxtx_cap'] = rxtx_cap
+
+        # create the vif model
+        return network_model.VIF(**vif_dict)
+
     def _get_network_dict(self, network):
         """Returns the dict representing necessary and meta network fields."""
         # get generic network fields
@@ -680,10 +757,12 @@ class NetworkManager(manager.Manager):
         return network_dict
 
     def _get_subnets_from_network(self, context, network,
-                                  vif, instance_host=None):
+                                  vif, instance_host=None, ipam_subnets=None,
+                                  dhcp_server=None):
         """Returns the 1 or 2 possible subnets for a nova network."""
         # get subnets
-        ipam_subnets = self.ipam.get_subnets_by_net_id(context,
+        if ipam_subnets is None:
+            ipam_subnets = self.ipam.get_subnets_by_net_id(context,
                            network['project_id'], network['uuid'], vif['uuid'])
 
         subnets = []
@@ -694,12 +773,14 @@ class NetworkManager(manager.Manager):
                                              type='gateway')}
             # deal with dhcp
             if self.DHCP:
-                if network.get('multi_host'):
-                    dhcp_server = self._get_dhcp_ip(context, network,
-                                                    instance_host)
+                if not network.get('multi_host'):
+                    subnet_dict['dhcp_server'] = self._get_dhcp_ip(context,
+                                                                   subnet)
+                elif dhcp_server is not None:
+                    subnet_dict['dhcp_server'] = dhcp_server
                 else:
-                    dhcp_server = self._get_dhcp_ip(context, subnet)
-                subnet_dict['dhcp_server'] = dhcp_server
+                    subnet_dict['dhcp_server'] = self._get_dhcp_ip(context,
+                                                    network, instance_host)
 
             subnet_object = network_model.Subnet(**subnet_dict)
 
@@ -1233,18 +1314,21 @@ class NetworkManager(manager.Manager):
         if not fixed_cidr:
             fixed_cidr = netaddr.IPNetwork(network['cidr'])
         num_ips = len(fixed_cidr)
-        ips = []
-        for index in range(num_ips):
-            address = str(fixed_cidr[index])
-            if index < bottom_reserved or num_ips - index <= top_reserved:
-                reserved = True
-            else:
-                reserved = False
 
-            ips.append({'network_id': network_id,
-                        'address': address,
-                        'reserved': reserved})
-        self.db.fixed_ip_bulk_create(context, ips)
+        def _ips():
+            # Generate the ips lazily, the db layer inserts them in chunks
+            # so large networks don't have to be held in memory at once.
+            for index, address in enumerate(fixed_cidr):
+                if index < bottom_reserved or num_ips - index <= top_reserved:
+                    reserved = True
+                else:
+                    reserved = False
+
+                yield {'network_id': network_id,
+                       'address': str(address),
+                       'reserved': reserved}
+
+        self.db.fixed_ip_bulk_create(context, _ips())
 
     def _allocate_fixed_ips(self, context, instance_id, host, networks,
                             **kwargs):
@@ -1336,6 +1420,10 @@ class NetworkManager(manager.Manager):
         return self.db.network_get(context, network_id,
                                    project_only="allow_none")
 
+    def _get_networks_by_ids(self, context, network_ids):
+        return self.db.network_get_all_by_ids(context, network_ids,
+                                              project_only="allow_none")
+
     def _get_networks_by_uuids(self, context, network_uuids):
         return self.db.network_get_all_by_uuids(context, network_uuids,
                                                 project_only="allow_none")
@@ -1776,6 +1864,13 @@ class VlanManager(RPCAllocateFixedIP, floating_ips.FloatingIP, NetworkManager):
         #             project yet.
         return self.db.network_get(context, network_id, project_only=True)
 
+    def _get_networks_by_ids(self, context, network_ids):
+        # NOTE(vish): Don't allow access to networks with project_id=None as
+        #             these are networks that haven't been allocated to a
+        #             project yet.
+        return self.db.network_get_all_by_ids(context, network_ids,
+                                              project_only=True)
+
     def _get_networks_by_uuids(self, context, network_uuids):
         # NOTE(vish): Don't allow access to networks with project_id=None as
         #             these are networks that haven't been allocated to a
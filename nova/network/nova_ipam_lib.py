@@ -41,6 +41,12 @@ class QuantumNovaIPAMLib(object):
            associated with a Quantum Network UUID.
         """
         n = db.network_get_by_uuid(context.elevated(), net_id)
+        return self.get_subnets_by_network(n)
+
+    def get_subnets_by_network(self, n):
+        """Returns information about the IPv4 and IPv6 subnets
+           of an already retrieved network.
+        """
         subnet_v4 = {
             'network_id': n['uuid'],
             'cidr': n['cidr'],
@@ -85,6 +91,12 @@ class QuantumNovaIPAMLib(object):
         admin_context = context.elevated()
         network = db.network_get_by_uuid(admin_context, net_id)
         vif_rec = db.virtual_interface_get_by_uuid(context, vif_id)
+        return self.get_v6_ips_by_network(network, vif_rec, project_id)
+
+    def get_v6_ips_by_network(self, network, vif_rec, project_id):
+        """Returns a list containing a single IPv6 address strings
+           for an already retrieved network and virtual interface.
+        """
         if network['cidr_v6']:
             ip = ipv6.to_global(network['cidr_v6'],
                                 vif_rec['address'],
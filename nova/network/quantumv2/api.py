@@ -377,6 +377,24 @@ class API(base.Base):
                                    conductor_api)
         return result
 
+    def get_instance_nw_info_bulk(self, context, instances,
+                                  conductor_api=None):
+        """Return network information of several instances keyed by
+           uuid and update their caches.
+        """
+        nw_infos = {}
+        for instance in instances:
+            try:
+                result = self._get_instance_nw_info(context, instance)
+            except Exception:
+                LOG.exception(_('Failed to get network info'),
+                              instance=instance)
+                continue
+            update_instance_info_cache(self, context, instance, result,
+                                       conductor_api)
+            nw_infos[instance['uuid']] = result
+        return nw_infos
+
     def _get_instance_nw_info(self, context, instance, networks=None):
         LOG.debug(_('get_instance_nw_info() for %s'),
                   instance['display_name'])
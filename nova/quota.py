@@ -77,6 +77,10 @@ quota_opts = [
     cfg.IntOpt('max_age',
                default=0,
                help='number of seconds between subsequent usage refreshes'),
+    cfg.IntOpt('quota_usage_refresh_interval',
+               default=-1,
+               help='number of seconds between recounts of the usages of '
+                    'all projects. A negative value disables them'),
     cfg.StrOpt('quota_driver',
                default='nova.quota.DbQuotaDriver',
                help='default driver to use for quota checks'),
@@ -344,6 +348,11 @@ class DbQuotaDriver(object):
         quotas = self._get_quotas(context, resources, deltas.keys(),
                                   has_sync=True, project_id=project_id)
 
+        return self._quota_reserve(context, resources, quotas, deltas,
+                                   expire, project_id)
+
+    def _quota_reserve(self, context, resources, quotas, deltas, expire,
+                       project_id):
         # NOTE(Vek): Most of the work here has to be done in the DB
         #            API, because we have to do it in a transaction,
         #            which means access to the session.  Since the
@@ -425,6 +434,15 @@ class DbQuotaDriver(object):
 
         db.quota_destroy_all_by_project(context, project_id)
 
+    def refresh_usages(self, context, resources):
+        """Recount the usages of all projects.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+
+        db.quota_usage_refresh_all(context, resources, CONF.until_refresh)
+
     def expire(self, context):
         """Expire reservations.
 
@@ -437,6 +455,59 @@ class DbQuotaDriver(object):
         db.reservation_expire(context)
 
 
+class ConditionalUpdateQuotaDriver(DbQuotaDriver):
+    """
+    Database quota driver which does not lock all the usages of a
+    project to make or release a reservation.  Usage counters are
+    changed with single conditional updates instead, so reservations
+    made in parallel within one project don't serialize.  Usages
+    which are missing or out of sync are still recounted by the
+    locking code of the DbQuotaDriver.
+    """
+
+    def _quota_reserve(self, context, resources, quotas, deltas, expire,
+                       project_id):
+        return db.quota_reserve_conditional(context, resources, quotas,
+                                            deltas, expire,
+                                            CONF.until_refresh,
+                                            CONF.max_age,
+                                            project_id=project_id)
+
+    def commit(self, context, reservations, project_id=None):
+        """Commit reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        """
+        # If project_id is None, then we use the project_id in context
+        if project_id is None:
+            project_id = context.project_id
+
+        db.reservation_commit_conditional(context, reservations,
+                                          project_id=project_id)
+
+    def rollback(self, context, reservations, project_id=None):
+        """Roll back reservations.
+
+        :param context: The request context, for access checks.
+        :param reservations: A list of the reservation UUIDs, as
+                             returned by the reserve() method.
+        :param project_id: Specify the project_id if current context
+                           is admin and admin wants to impact on
+                           common user's tenant.
+        """
+        # If project_id is None, then we use the project_id in context
+        if project_id is None:
+            project_id = context.project_id
+
+        db.reservation_rollback_conditional(context, reservations,
+                                            project_id=project_id)
+
+
 class NoopQuotaDriver(object):
     """Driver that turns quotas calls into no-ops and pretends that quotas
     for all resources are unlimited.  This can be used if you do not
@@ -625,6 +696,14 @@ class NoopQuotaDriver(object):
         """
         pass
 
+    def refresh_usages(self, context, resources):
+        """Recount the usages of all projects.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+        pass
+
     def expire(self, context):
         """Expire reservations.
 
@@ -709,7 +788,7 @@ class BaseResource(object):
 class ReservableResource(BaseResource):
     """Describe a reservable resource."""
 
-    def __init__(self, name, sync, flag=None):
+    def __init__(self, name, sync, flag=None, sync_all=None):
         """
         Initializes a ReservableResource.
 
@@ -729,6 +808,11 @@ class ReservableResource(BaseResource):
         synchronization functions may be associated with more than one
         ReservableResource.
 
+        A resource may also have a bulk synchronization function, which
+        is passed an admin context and a session and returns the same
+        kind of dictionary for all projects at once, keyed by project
+        ID.  It is used to recount the usages of all projects.
+
         :param name: The name of the resource, i.e., "instances".
         :param sync: A callable which returns a dictionary to
                      resynchronize the in_use count for one or more
@@ -736,10 +820,14 @@ class ReservableResource(BaseResource):
         :param flag: The name of the flag or configuration option
                      which specifies the default value of the quota
                      for this resource.
+        :param sync_all: An optional callable which returns the
+                         resynchronized in_use counts of all projects,
+                         as described above.
         """
 
         super(ReservableResource, self).__init__(name, flag=flag)
         self.sync = sync
+        self.sync_all = sync_all
 
 
 class AbsoluteResource(BaseResource):
@@ -1039,6 +1127,19 @@ class QuotaEngine(object):
 
         self._driver.destroy_all_by_project(context, project_id)
 
+    def refresh_usages(self, context):
+        """Recount the usages of all projects.
+
+        Usages are recounted for all projects at once with grouped
+        queries, so that they don't drift from the actual resource
+        counts between the until_refresh and max_age refreshes made
+        when reserving.
+
+        :param context: The request context, for access checks.
+        """
+
+        self._driver.refresh_usages(context, self._resources)
+
     def expire(self, context):
         """Expire reservations.
 
@@ -1076,16 +1177,44 @@ def _sync_security_groups(context, project_id, session):
             context, project_id, session=session))
 
 
+def _sync_all_instances(context, session):
+    return dict((project_id, dict(zip(('instances', 'cores', 'ram'), data)))
+                for project_id, data in db.instance_data_get_by_projects(
+                context, session=session).items())
+
+
+def _sync_all_floating_ips(context, session):
+    return dict((project_id, dict(floating_ips=count))
+                for project_id, count in db.floating_ip_count_by_projects(
+                context, session=session).items())
+
+
+def _sync_all_fixed_ips(context, session):
+    return dict((project_id, dict(fixed_ips=count))
+                for project_id, count in db.fixed_ip_count_by_projects(
+                context, session=session).items())
+
+
+def _sync_all_security_groups(context, session):
+    return dict((project_id, dict(security_groups=count))
+                for project_id, count in db.security_group_count_by_projects(
+                context, session=session).items())
+
+
 QUOTAS = QuotaEngine()
 
 
 resources = [
-    ReservableResource('instances', _sync_instances, 'quota_instances'),
-    ReservableResource('cores', _sync_instances, 'quota_cores'),
-    ReservableResource('ram', _sync_instances, 'quota_ram'),
+    ReservableResource('instances', _sync_instances, 'quota_instances',
+                       _sync_all_instances),
+    ReservableResource('cores', _sync_instances, 'quota_cores',
+                       _sync_all_instances),
+    ReservableResource('ram', _sync_instances, 'quota_ram',
+                       _sync_all_instances),
     ReservableResource('floating_ips', _sync_floating_ips,
-                       'quota_floating_ips'),
-    ReservableResource('fixed_ips', _sync_fixed_ips, 'quota_fixed_ips'),
+                       'quota_floating_ips', _sync_all_floating_ips),
+    ReservableResource('fixed_ips', _sync_fixed_ips, 'quota_fixed_ips',
+                       _sync_all_fixed_ips),
     AbsoluteResource('metadata_items', 'quota_metadata_items'),
     AbsoluteResource('injected_files', 'quota_injected_files'),
     AbsoluteResource('injected_file_content_bytes',
@@ -1093,7 +1222,7 @@ resources = [
     AbsoluteResource('injected_file_path_bytes',
                      'quota_injected_file_path_bytes'),
     ReservableResource('security_groups', _sync_security_groups,
-                       'quota_security_groups'),
+                       'quota_security_groups', _sync_all_security_groups),
     CountableResource('security_group_rules',
                       db.security_group_rule_count_by_group,
                       'quota_security_group_rules'),
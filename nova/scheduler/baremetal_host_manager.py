@@ -39,11 +39,13 @@ class BaremetalNodeState(host_manager.HostState):
         self.free_disk_mb = free_disk_mb
         self.vcpus_total = compute['vcpus']
         self.vcpus_used = compute['vcpus_used']
+        self.generation = next(host_manager._generations)
 
     def consume_from_instance(self, instance):
         self.free_ram_mb = 0
         self.free_disk_mb = 0
         self.vcpus_used = self.vcpus_total
+        self.generation = next(host_manager._generations)
 
 
 def new_host_state(self, host, node, capabilities=None, service=None):
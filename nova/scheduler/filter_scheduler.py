@@ -19,6 +19,7 @@ You can customize this scheduler by specifying your own Host Filters and
 Weighing Functions.
 """
 
+import heapq
 import random
 
 from oslo.config import cfg
@@ -43,7 +44,14 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='When scheduling several instances in one request, '
+                     'filter and weigh all hosts only once and then only '
+                     're-evaluate the host chosen for each instance. Only '
+                     'valid if the configured filters and weighers judge '
+                     'each host independently of the others'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
@@ -328,6 +336,11 @@ class FilterScheduler(driver.Scheduler):
             num_instances = len(instance_uuids)
         else:
             num_instances = request_spec.get('num_instances', 1)
+        if CONF.scheduler_batch_placement:
+            return self._schedule_batch(hosts, filter_properties,
+                                        instance_properties, num_instances,
+                                        update_group_hosts)
+
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.get_filtered_hosts(hosts,
@@ -359,6 +372,59 @@ class FilterScheduler(driver.Scheduler):
                 filter_properties['group_hosts'].append(chosen_host.obj.host)
         return selected_hosts
 
+    def _schedule_batch(self, hosts, filter_properties, instance_properties,
+                        num_instances, update_group_hosts):
+        """Choose hosts for num_instances instances, filtering and weighing
+        all hosts only once.
+
+        The weighed hosts are kept in a heap.  Consuming an instance only
+        changes the chosen host, so only that host is filtered and weighed
+        again before it goes back into the heap.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties)
+        LOG.debug(_("Filtered %(hosts)s") % locals())
+        weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
+                filter_properties)
+
+        # heapq is a min-heap, so push negated weights.  The sequence
+        # number keeps ties in weighed order and avoids comparing hosts.
+        heap = [(-weighed_host.weight, seq, weighed_host)
+                for seq, weighed_host in enumerate(weighed_hosts)]
+        heapq.heapify(heap)
+        seq = len(heap)
+
+        scheduler_host_subset_size = max(CONF.scheduler_host_subset_size, 1)
+        selected_hosts = []
+        for num in xrange(num_instances):
+            if not heap:
+                # Can't get any more locally.
+                break
+
+            subset = [heapq.heappop(heap) for i in xrange(
+                    min(scheduler_host_subset_size, len(heap)))]
+            chosen = random.choice(subset)
+            for entry in subset:
+                if entry is not chosen:
+                    heapq.heappush(heap, entry)
+            chosen_host = chosen[2]
+            LOG.debug(_("Choosing host %(chosen_host)s") % locals())
+            selected_hosts.append(chosen_host)
+
+            # Now consume the resources and re-evaluate the chosen host
+            # for the next instance.
+            chosen_host.obj.consume_from_instance(instance_properties)
+            if update_group_hosts is True:
+                filter_properties['group_hosts'].append(chosen_host.obj.host)
+            if not self.host_manager.get_filtered_hosts([chosen_host.obj],
+                                                        filter_properties):
+                continue
+            chosen_host = self.host_manager.get_weighed_hosts(
+                    [chosen_host.obj], filter_properties)[0]
+            heapq.heappush(heap, (-chosen_host.weight, seq, chosen_host))
+            seq += 1
+        return selected_hosts
+
     def _assert_compute_node_has_enough_memory(self, context,
                                               instance_ref, dest):
         """Checks if destination host has enough memory for live migration.
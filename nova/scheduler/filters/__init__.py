@@ -17,11 +17,114 @@
 Scheduler host filters
 """
 
+import time
+
+from oslo.config import cfg
+
 from nova import filters
+from nova.openstack.common import importutils
+
+numpy = importutils.try_import('numpy')
+
+host_filter_opts = [
+    cfg.BoolOpt('scheduler_columnar_filtering',
+                default=False,
+                help='Evaluate the numeric host filters and weighers as '
+                     'array operations over all hosts at once instead of '
+                     'host by host. Ignored if numpy is not installed'),
+    cfg.IntOpt('scheduler_filter_cache_ttl',
+               default=0,
+               help='Number of seconds the results of cacheable host '
+                    'filters are reused for requests of the same shape, '
+                    'as long as the host capabilities do not change. This '
+                    'also bounds how long aggregate changes may go '
+                    'unnoticed. 0 disables the cache'),
+    ]
+
+CONF = cfg.CONF
+CONF.register_opts(host_filter_opts)
+
+
+def columnar_enabled():
+    """Return True if host filters and weighers may work on columns."""
+    return CONF.scheduler_columnar_filtering and numpy is not None
+
+
+class HostColumns(object):
+    """Numpy columns of HostState attributes which are kept across calls.
+
+    Every host gets a row the first time it is seen.  The attributes of a
+    host are only read again once its generation changed, so filtering
+    hosts which did not change costs a row lookup per host rather than a
+    getattr per host and attribute.
+    """
+    def __init__(self):
+        # { (host, node) : row }
+        self.rows = {}
+        # { attr : (values, generation each value was read at) }
+        self.columns = {}
+
+    def _column(self, attr, size):
+        column = self.columns.get(attr)
+        if column is None or len(column[0]) < size:
+            capacity = size
+            if column is not None:
+                capacity = max(size, 2 * len(column[0]))
+            values = numpy.zeros(capacity, dtype=float)
+            # Generations start at 1, so 0 marks a value never read
+            generations = numpy.zeros(capacity, dtype=numpy.int64)
+            if column is not None:
+                values[:len(column[0])] = column[0]
+                generations[:len(column[1])] = column[1]
+            column = (values, generations)
+            self.columns[attr] = column
+        return column
+
+    def get(self, host_states, *attrs):
+        """Return a numpy array of each named attribute over host_states."""
+        rows = numpy.empty(len(host_states), dtype=int)
+        generations = numpy.empty(len(host_states), dtype=numpy.int64)
+        for i, host_state in enumerate(host_states):
+            key = (host_state.host, host_state.nodename)
+            row = self.rows.get(key)
+            if row is None:
+                row = len(self.rows)
+                self.rows[key] = row
+            rows[i] = row
+            generations[i] = host_state.generation
+
+        result = []
+        for attr in attrs:
+            values, read_at = self._column(attr, len(self.rows))
+            for i in numpy.flatnonzero(read_at[rows] != generations):
+                values[rows[i]] = getattr(host_states[i], attr)
+                read_at[rows[i]] = generations[i]
+            result.append(values[rows])
+        return result
+
+
+_host_columns = HostColumns()
+
+
+def host_columns(host_states, *attrs):
+    """Return a numpy array of each named attribute over host_states."""
+    return _host_columns.get(host_states, *attrs)
 
 
 class BaseHostFilter(filters.BaseFilter):
     """Base class for host filters."""
+
+    # Set to True in filters whose result only depends on the host
+    # capabilities, the aggregates of the host and on the request fields
+    # returned by cache_key().
+    cacheable = False
+
+    def cache_key(self, filter_properties):
+        """Return a hashable key of the request fields the filter uses.
+        Override this in cacheable subclasses.
+        """
+        raise NotImplementedError()
+
     def _filter_one(self, obj, filter_properties):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
@@ -33,9 +136,82 @@ class BaseHostFilter(filters.BaseFilter):
         raise NotImplementedError()
 
 
+class BaseColumnarHostFilter(BaseHostFilter):
+    """Base class for host filters that can check all hosts in one batch.
+
+    When columnar filtering is enabled, hosts_pass() is called once with
+    every HostState instead of calling host_passes() for each of them.
+    """
+    def filter_all(self, filter_obj_list, filter_properties):
+        if not columnar_enabled():
+            return super(BaseColumnarHostFilter, self).filter_all(
+                    filter_obj_list, filter_properties)
+        host_states = list(filter_obj_list)
+        if not host_states:
+            return []
+        passes = self.hosts_pass(host_states, filter_properties)
+        return [host_state for host_state, host_passes
+                in zip(host_states, passes) if host_passes]
+
+    def hosts_pass(self, host_states, filter_properties):
+        """Return a sequence of booleans, one for each HostState, telling
+        whether it passes the filter.  Override this in a subclass,
+        typically using host_columns().
+        """
+        raise NotImplementedError()
+
+
 class HostFilterHandler(filters.BaseFilterHandler):
     def __init__(self):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
+        # { (filter class, cache key) : (created,
+        #       { (host, node) : (capabilities generation, result) }) }
+        self.results_cache = {}
+
+    def get_filtered_objects(self, filter_classes, objs,
+            filter_properties):
+        ttl = CONF.scheduler_filter_cache_ttl
+        for filter_cls in filter_classes:
+            filter_obj = filter_cls()
+            if ttl > 0 and filter_obj.cacheable:
+                objs = self._filter_all_cached(filter_obj, objs,
+                        filter_properties, ttl)
+            else:
+                objs = filter_obj.filter_all(objs, filter_properties)
+        return list(objs)
+
+    def _get_cached_results(self, filter_obj, filter_properties, ttl):
+        key = (filter_obj.__class__, filter_obj.cache_key(filter_properties))
+        now = time.time()
+        entry = self.results_cache.get(key)
+        if entry is None or now - entry[0] > ttl:
+            # Drop all expired entries so request shapes seen only once
+            # do not accumulate.
+            for cache_key, (created, results) in self.results_cache.items():
+                if now - created > ttl:
+                    del self.results_cache[cache_key]
+            entry = (now, {})
+            self.results_cache[key] = entry
+        return entry[1]
+
+    def _filter_all_cached(self, filter_obj, host_states, filter_properties,
+                           ttl):
+        """Yield the host states that pass filter_obj, reusing results
+        cached for hosts whose capabilities did not change since.
+        """
+        results = self._get_cached_results(filter_obj, filter_properties,
+                                           ttl)
+        for host_state in host_states:
+            state_key = (host_state.host, host_state.nodename)
+            cached = results.get(state_key)
+            generation = host_state.capabilities_generation
+            if cached is not None and cached[0] == generation:
+                passes = cached[1]
+            else:
+                passes = filter_obj._filter_one(host_state, filter_properties)
+                results[state_key] = (generation, passes)
+            if passes:
+                yield host_state
 
 
 def all_filters():
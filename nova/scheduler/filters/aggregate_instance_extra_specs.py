@@ -26,6 +26,12 @@ LOG = logging.getLogger(__name__)
 class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
     """AggregateInstanceExtraSpecsFilter works with InstanceType records."""
 
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        return tuple(sorted(instance_type.get('extra_specs', {}).items()))
+
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create instance_type
 
@@ -30,6 +30,13 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
     Note: in theory a compute node can be part of multiple availability_zones
     """
 
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        spec = filter_properties.get('request_spec', {})
+        props = spec.get('instance_properties', {})
+        return props.get('availability_zone')
+
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
@@ -24,6 +24,12 @@ LOG = logging.getLogger(__name__)
 class ComputeCapabilitiesFilter(filters.BaseHostFilter):
     """HostFilter hard-coded to work with InstanceType records."""
 
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        return tuple(sorted(instance_type.get('extra_specs', {}).items()))
+
     def _satisfies_extra_specs(self, capabilities, instance_type):
         """Check that the capabilities provided by the compute service
         satisfy the extra specs associated with the instance type"""
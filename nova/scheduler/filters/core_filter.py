@@ -30,7 +30,7 @@ CONF = cfg.CONF
 CONF.register_opt(cpu_allocation_ratio_opt)
 
 
-class CoreFilter(filters.BaseHostFilter):
+class CoreFilter(filters.BaseColumnarHostFilter):
     """CoreFilter filters based on CPU core utilization."""
 
     def host_passes(self, host_state, filter_properties):
@@ -53,3 +53,27 @@ class CoreFilter(filters.BaseHostFilter):
             host_state.limits['vcpu'] = vcpus_total
 
         return (vcpus_total - host_state.vcpus_used) >= instance_vcpus
+
+    def hosts_pass(self, host_states, filter_properties):
+        """Return which hosts have sufficient CPU cores."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return [True] * len(host_states)
+
+        host_vcpus_total, vcpus_used = filters.host_columns(host_states,
+                'vcpus_total', 'vcpus_used')
+        # Fail safe
+        unknown = host_vcpus_total == 0
+        if unknown.any():
+            LOG.warning(_("VCPUs not set; assuming CPU collection broken"))
+
+        instance_vcpus = instance_type['vcpus']
+        vcpus_total = host_vcpus_total * CONF.cpu_allocation_ratio
+
+        # Only provide a VCPU limit to compute if the virt driver is reporting
+        # an accurate count of installed VCPUs. (XenServer driver does not)
+        for host_state, limit in zip(host_states, vcpus_total):
+            if limit > 0:
+                host_state.limits['vcpu'] = float(limit)
+
+        return unknown | ((vcpus_total - vcpus_used) >= instance_vcpus)
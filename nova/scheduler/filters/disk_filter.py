@@ -27,7 +27,7 @@ CONF = cfg.CONF
 CONF.register_opt(disk_allocation_ratio_opt)
 
 
-class DiskFilter(filters.BaseHostFilter):
+class DiskFilter(filters.BaseColumnarHostFilter):
     """Disk Filter with over subscription flag."""
 
     def host_passes(self, host_state, filter_properties):
@@ -52,3 +52,28 @@ class DiskFilter(filters.BaseHostFilter):
         disk_gb_limit = disk_mb_limit / 1024
         host_state.limits['disk_gb'] = disk_gb_limit
         return True
+
+    def hosts_pass(self, host_states, filter_properties):
+        """Filter based on disk usage."""
+        instance_type = filter_properties.get('instance_type')
+        requested_disk = 1024 * (instance_type['root_gb'] +
+                                 instance_type['ephemeral_gb'])
+        free_disk_mb, total_usable_disk_gb = filters.host_columns(
+                host_states, 'free_disk_mb', 'total_usable_disk_gb')
+        total_usable_disk_mb = total_usable_disk_gb * 1024
+
+        disk_mb_limit = total_usable_disk_mb * CONF.disk_allocation_ratio
+        used_disk_mb = total_usable_disk_mb - free_disk_mb
+        usable_disk_mb = disk_mb_limit - used_disk_mb
+        passes = usable_disk_mb >= requested_disk
+        num_failed = len(host_states) - passes.sum()
+        if num_failed:
+            LOG.debug(_("%(num_failed)d hosts do not have "
+                    "%(requested_disk)s MB usable disk."), locals())
+
+        disk_gb_limit = disk_mb_limit / 1024
+        for host_state, limit, host_passes in zip(host_states,
+                                                  disk_gb_limit, passes):
+            if host_passes:
+                host_state.limits['disk_gb'] = float(limit)
+        return passes
@@ -28,7 +28,7 @@ CONF = cfg.CONF
 CONF.register_opt(max_io_ops_per_host_opt)
 
 
-class IoOpsFilter(filters.BaseHostFilter):
+class IoOpsFilter(filters.BaseColumnarHostFilter):
     """Filter out hosts with too many concurrent I/O operations."""
 
     def host_passes(self, host_state, filter_properties):
@@ -42,3 +42,13 @@ class IoOpsFilter(filters.BaseHostFilter):
             LOG.debug(_("%(host_state)s fails I/O ops check: Max IOs per host "
                         "is set to %(max_io_ops)s"), locals())
         return passes
+
+    def hosts_pass(self, host_states, filter_properties):
+        num_io_ops, = filters.host_columns(host_states, 'num_io_ops')
+        max_io_ops = CONF.max_io_ops_per_host
+        passes = num_io_ops < max_io_ops
+        num_failed = len(host_states) - passes.sum()
+        if num_failed:
+            LOG.debug(_("%(num_failed)d hosts fail I/O ops check: Max IOs per "
+                        "host is set to %(max_io_ops)s"), locals())
+        return passes
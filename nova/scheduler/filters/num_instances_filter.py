@@ -28,7 +28,7 @@ CONF = cfg.CONF
 CONF.register_opt(max_instances_per_host_opt)
 
 
-class NumInstancesFilter(filters.BaseHostFilter):
+class NumInstancesFilter(filters.BaseColumnarHostFilter):
     """Filter out hosts with too many instances."""
 
     def host_passes(self, host_state, filter_properties):
@@ -40,3 +40,14 @@ class NumInstancesFilter(filters.BaseHostFilter):
                         "instances per host is set to %(max_instances)s"),
                         locals())
         return passes
+
+    def hosts_pass(self, host_states, filter_properties):
+        num_instances, = filters.host_columns(host_states, 'num_instances')
+        max_instances = CONF.max_instances_per_host
+        passes = num_instances < max_instances
+        num_failed = len(host_states) - passes.sum()
+        if num_failed:
+            LOG.debug(_("%(num_failed)d hosts fail num_instances check: Max "
+                        "instances per host is set to %(max_instances)s"),
+                        locals())
+        return passes
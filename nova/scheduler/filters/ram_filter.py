@@ -29,7 +29,7 @@ CONF = cfg.CONF
 CONF.register_opt(ram_allocation_ratio_opt)
 
 
-class RamFilter(filters.BaseHostFilter):
+class RamFilter(filters.BaseColumnarHostFilter):
     """Ram Filter with over subscription flag."""
 
     def host_passes(self, host_state, filter_properties):
@@ -51,3 +51,26 @@ class RamFilter(filters.BaseHostFilter):
         # save oversubscription limit for compute node to test against:
         host_state.limits['memory_mb'] = memory_mb_limit
         return True
+
+    def hosts_pass(self, host_states, filter_properties):
+        """Only return hosts with sufficient available RAM."""
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        free_ram_mb, total_usable_ram_mb = filters.host_columns(host_states,
+                'free_ram_mb', 'total_usable_ram_mb')
+
+        memory_mb_limit = total_usable_ram_mb * CONF.ram_allocation_ratio
+        used_ram_mb = total_usable_ram_mb - free_ram_mb
+        usable_ram = memory_mb_limit - used_ram_mb
+        passes = usable_ram >= requested_ram
+        num_failed = len(host_states) - passes.sum()
+        if num_failed:
+            LOG.debug(_("%(num_failed)d hosts do not have %(requested_ram)s "
+                    "MB usable ram."), locals())
+
+        # save oversubscription limit for compute node to test against:
+        for host_state, limit, host_passes in zip(host_states,
+                                                  memory_mb_limit, passes):
+            if host_passes:
+                host_state.limits['memory_mb'] = float(limit)
+        return passes
@@ -46,6 +46,11 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     key 'instance_type' has the instance_type name as a value
     """
 
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        return filter_properties.get('instance_type')['name']
+
     def host_passes(self, host_state, filter_properties):
         instance_type = filter_properties.get('instance_type')
         context = filter_properties['context'].elevated()
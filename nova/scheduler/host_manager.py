@@ -17,6 +17,7 @@
 Manage hosts in the current zone.
 """
 
+import itertools
 import UserDict
 
 from oslo.config import cfg
@@ -51,6 +52,18 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.IntOpt('scheduler_host_state_refresh_interval',
+               default=0,
+               help='Minimum number of seconds between refreshes of the '
+                    'cached host states from the database. Updates pushed '
+                    'by compute services are applied immediately. '
+                    '0 refreshes on every scheduling request'),
+    cfg.IntOpt('scheduler_host_state_full_sync_interval',
+               default=0,
+               help='Number of seconds between full reloads of the compute '
+                    'nodes table. In between, only compute nodes changed '
+                    'since the previous refresh are fetched. 0 disables '
+                    'incremental refreshes'),
     ]
 
 CONF = cfg.CONF
@@ -58,6 +71,10 @@ CONF.register_opts(host_manager_opts)
 
 LOG = logging.getLogger(__name__)
 
+# Host state generations are unique across HostState objects, so results
+# cached for a host that has gone and come back are not reused.
+_generations = itertools.count(1)
+
 
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
@@ -100,6 +117,11 @@ class HostState(object):
     def __init__(self, host, node, capabilities=None, service=None):
         self.host = host
         self.nodename = node
+        # Changes whenever the capabilities or resources of the host do.
+        self.generation = next(_generations)
+        # Changes only when the capabilities of the host do.
+        self.capabilities_generation = next(_generations)
+        self.capabilities = None
         self.update_capabilities(capabilities, service)
 
         # Mutable available resources.
@@ -134,6 +156,10 @@ class HostState(object):
 
         if capabilities is None:
             capabilities = {}
+        if (self.capabilities is not None and
+                capabilities != self.capabilities.data):
+            self.generation = next(_generations)
+            self.capabilities_generation = next(_generations)
         self.capabilities = ReadOnlyDict(capabilities)
         if service is None:
             service = {}
@@ -144,6 +170,7 @@ class HostState(object):
         if (self.updated and compute['updated_at']
             and self.updated > compute['updated_at']):
             return
+        self.generation = next(_generations)
         all_ram_mb = compute['memory_mb']
 
         # Assume virtual size is all consumed by instances if use qcow2 disk.
@@ -205,6 +232,7 @@ class HostState(object):
         self.free_disk_mb -= disk_mb
         self.vcpus_used += vcpus
         self.updated = timeutils.utcnow()
+        self.generation = next(_generations)
 
         # Track number of instances on host
         self.num_instances += 1
@@ -260,6 +288,13 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
+        # { compute_node_id : (host, hypervisor_hostname) }
+        self.compute_node_keys = {}
+        # Timestamps used to bound the staleness of host_state_map
+        self.last_refresh = None
+        self.last_full_sync = None
+        # High-water mark of the compute node timestamps seen so far
+        self.changes_since = None
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -355,6 +390,10 @@ class HostManager(object):
             return
 
         state_key = (host, capabilities.get('hypervisor_hostname'))
+        if 'compute_node_update' in capabilities:
+            self._update_from_compute_node_push(state_key,
+                    capabilities['compute_node_update'])
+            return
         LOG.debug(_("Received %(service_name)s service update from "
                     "%(state_key)s.") % locals())
         # Copy the capabilities, so we don't modify the original dict
@@ -362,16 +401,83 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[state_key] = capab_copy
 
+        # Keep any cached host state current between refreshes.
+        host_state = self.host_state_map.get(state_key)
+        if host_state:
+            host_state.update_capabilities(capab_copy,
+                                           dict(host_state.service))
+
+    def _update_from_compute_node_push(self, state_key, compute):
+        """Apply a compute node resource view pushed by a compute host."""
+        host_state = self.host_state_map.get(state_key)
+        if not host_state:
+            # Unknown nodes are picked up on the next database refresh.
+            return
+        LOG.debug(_("Received resource update from %(state_key)s.") %
+                  locals())
+        compute = dict(compute)
+        if isinstance(compute.get('updated_at'), basestring):
+            compute['updated_at'] = timeutils.parse_strtime(
+                    compute['updated_at'])
+        host_state.update_from_compute_node(compute)
+
+    def _needs_refresh(self):
+        interval = CONF.scheduler_host_state_refresh_interval
+        if interval <= 0 or self.last_refresh is None:
+            return True
+        return timeutils.is_older_than(self.last_refresh, interval)
+
+    def _needs_full_sync(self):
+        interval = CONF.scheduler_host_state_full_sync_interval
+        if (interval <= 0 or self.last_full_sync is None
+                or self.changes_since is None):
+            return True
+        return timeutils.is_older_than(self.last_full_sync, interval)
+
+    def _advance_changes_since(self, compute):
+        for key in ('created_at', 'updated_at', 'deleted_at'):
+            timestamp = compute.get(key)
+            if timestamp and (self.changes_since is None or
+                              timestamp > self.changes_since):
+                self.changes_since = timestamp
+
+    def _remove_host_state(self, state_key):
+        host, node = state_key
+        LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                   "from scheduler") % locals())
+        del self.host_state_map[state_key]
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
+
+        The host states are cached between calls.  Depending on
+        the scheduler_host_state_* options, the cache is either reloaded
+        from every compute node, refreshed with only the compute nodes
+        changed since the previous call, or used as is.
         """
+        if not self._needs_refresh():
+            return self.host_state_map.itervalues()
+
+        full_sync = self._needs_full_sync()
+        if full_sync:
+            # Get resource usage across the available compute nodes:
+            compute_nodes = db.compute_node_get_all(context)
+            self.last_full_sync = timeutils.utcnow()
+        else:
+            compute_nodes = db.compute_node_get_all_changed_since(context,
+                    self.changes_since)
+        self.last_refresh = timeutils.utcnow()
 
-        # Get resource usage across the available compute nodes:
-        compute_nodes = db.compute_node_get_all(context)
         seen_nodes = set()
         for compute in compute_nodes:
+            self._advance_changes_since(compute)
+            if compute.get('deleted'):
+                state_key = self.compute_node_keys.pop(compute['id'], None)
+                if state_key in self.host_state_map:
+                    self._remove_host_state(state_key)
+                continue
             service = compute['service']
             if not service:
                 LOG.warn(_("No service for compute ID %s") % compute['id'])
@@ -390,14 +496,17 @@ class HostManager(object):
                         service=dict(service.iteritems()))
                 self.host_state_map[state_key] = host_state
             host_state.update_from_compute_node(compute)
+            self.compute_node_keys[compute['id']] = state_key
             seen_nodes.add(state_key)
 
-        # remove compute nodes from host_state_map if they are not active
-        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
-        for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % locals())
-            del self.host_state_map[state_key]
+        if full_sync:
+            # remove compute nodes from host_state_map if they are not active
+            dead_nodes = set(self.host_state_map.keys()) - seen_nodes
+            for state_key in dead_nodes:
+                self._remove_host_state(state_key)
+            self.compute_node_keys = dict(
+                    (compute_id, state_key) for compute_id, state_key
+                    in self.compute_node_keys.iteritems()
+                    if state_key in self.host_state_map)
 
         return self.host_state_map.itervalues()
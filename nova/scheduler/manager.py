@@ -50,6 +50,7 @@ scheduler_driver_opt = cfg.StrOpt('scheduler_driver',
 
 CONF = cfg.CONF
 CONF.register_opt(scheduler_driver_opt)
+CONF.import_opt('quota_usage_refresh_interval', 'nova.quota')
 
 QUOTAS = quota.QUOTAS
 
@@ -291,6 +292,10 @@ class SchedulerManager(manager.Manager):
     def _expire_reservations(self, context):
         QUOTAS.expire(context)
 
+    @manager.periodic_task(spacing=CONF.quota_usage_refresh_interval)
+    def _refresh_quota_usages(self, context):
+        QUOTAS.refresh_usages(context)
+
     # NOTE(russellb) This method can be removed in 3.0 of this API.  It is
     # deprecated in favor of the method in the base API.
     def get_backdoor_port(self, context):
@@ -22,6 +22,7 @@ number and the weighing has the opposite effect of the default.
 
 from oslo.config import cfg
 
+from nova.scheduler import filters
 from nova.scheduler import weights
 
 ram_weight_opts = [
@@ -43,3 +44,14 @@ class RAMWeigher(weights.BaseHostWeigher):
     def _weigh_object(self, host_state, weight_properties):
         """Higher weights win.  We want spreading to be the default."""
         return host_state.free_ram_mb
+
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        if not filters.columnar_enabled():
+            return super(RAMWeigher, self).weigh_objects(weighed_obj_list,
+                    weight_properties)
+        free_ram_mb, = filters.host_columns(
+                [weighed_obj.obj for weighed_obj in weighed_obj_list],
+                'free_ram_mb')
+        weights = self._weight_multiplier() * free_ram_mb
+        for weighed_obj, weight in zip(weighed_obj_list, weights):
+            weighed_obj.weight += float(weight)
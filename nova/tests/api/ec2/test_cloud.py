@@ -1155,6 +1155,45 @@ class CloudTestCase(test.TestCase):
         db.instance_destroy(self.context, inst1['uuid'])
         db.service_destroy(self.context, comp1['id'])
 
+    def test_describe_instances_bulk_lookups(self):
+        # Makes sure describe_instances does not look up ids and block
+        # device mappings once per instance.
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        sys_meta = instance_types.save_instance_type_info(
+            {}, instance_types.get_instance_type(1))
+        instances = [db.instance_create(self.context,
+                                        {'reservation_id': 'a',
+                                         'image_ref': image_uuid,
+                                         'instance_type_id': 1,
+                                         'host': 'host1',
+                                         'vm_state': 'active',
+                                         'system_metadata': sys_meta})
+                     for i in xrange(3)]
+        db.block_device_mapping_create(self.context,
+                                       {'instance_uuid': instances[0]['uuid'],
+                                        'device_name': '/dev/vda',
+                                        'volume_id': None})
+        ec2utils.reset_cache()
+
+        def fail(*args, **kwargs):
+            self.fail('unexpected per instance lookup')
+
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance', fail)
+        self.stubs.Set(db, 'get_ec2_instance_id_by_uuid', fail)
+        self.stubs.Set(db, 's3_image_get_by_uuid', fail)
+
+        result = self.cloud.describe_instances(self.context)
+        result = result['reservationSet'][0]['instancesSet']
+        self.assertEqual(
+            sorted(ec2utils.id_to_ec2_inst_id(inst['uuid'])
+                   for inst in instances),
+            sorted(i['instanceId'] for i in result))
+        for i in result:
+            self.assertEqual('ami-00000001', i['imageId'])
+            self.assertEqual('instance-store', i['rootDeviceType'])
+
     def test_describe_instances_deleted(self):
         image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
         sys_meta = instance_types.save_instance_type_info(
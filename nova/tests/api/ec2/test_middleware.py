@@ -25,6 +25,7 @@ import webob.exc
 from nova.api import ec2
 from nova import context
 from nova import exception
+from nova.openstack.common import jsonutils
 from nova.openstack.common import timeutils
 from nova import test
 
@@ -87,6 +88,119 @@ class LockoutTestCase(test.TestCase):
         self.assertFalse(self._is_locked_out('test'))
 
 
+class FakeKeystoneResponse(object):
+    def __init__(self, status, body):
+        self.status = status
+        self.reason = 'Unauthorized' if status == 401 else 'OK'
+        self.will_close = False
+        self._body = body
+
+    def read(self):
+        return self._body
+
+
+class FakeKeystoneConnection(object):
+    """Records keystone requests and replies with the queued responses."""
+    created = []
+    responses = []
+
+    def __init__(self, netloc):
+        self.netloc = netloc
+        self.requests = []
+        self.closed = 0
+        FakeKeystoneConnection.created.append(self)
+
+    def request(self, method, path, body=None, headers=None):
+        self.requests.append((method, path, body))
+
+    def getresponse(self):
+        response = FakeKeystoneConnection.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def close(self):
+        self.closed += 1
+
+
+class EC2KeystoneAuthTestCase(test.TestCase):
+    """Test case for the EC2KeystoneAuth middleware."""
+    def setUp(self):
+        super(EC2KeystoneAuthTestCase, self).setUp()
+        self.useFixture(test.TimeOverride())
+        FakeKeystoneConnection.created = []
+        FakeKeystoneConnection.responses = []
+        self.stubs.Set(ec2.httplib, 'HTTPConnection', FakeKeystoneConnection)
+        self.flags(keystone_ec2_url='http://keystone:5000/v2.0/ec2tokens')
+        self.auth = ec2.EC2KeystoneAuth(self._app)
+        self.token = jsonutils.dumps({'access': {
+            'token': {'id': 'token', 'tenant': {'id': 'fake'}},
+            'user': {'id': 'fake', 'roles': [{'name': 'member'}]},
+            'serviceCatalog': []}})
+
+    @staticmethod
+    @webob.dec.wsgify
+    def _app(req):
+        return req.environ['nova.context'].auth_token
+
+    def _queue(self, *responses):
+        FakeKeystoneConnection.responses.extend(responses)
+
+    def _request(self, signature='sig'):
+        req = webob.Request.blank('/?AWSAccessKeyId=key&Signature=%s' %
+                                  signature)
+        return req.get_response(self.auth)
+
+    def _num_requests(self):
+        return sum(len(conn.requests)
+                   for conn in FakeKeystoneConnection.created)
+
+    def test_reuses_connection(self):
+        self._queue(FakeKeystoneResponse(200, self.token),
+                    FakeKeystoneResponse(200, self.token))
+        self.assertEqual('token', self._request('sig1').body)
+        self.assertEqual('token', self._request('sig2').body)
+        self.assertEqual(1, len(FakeKeystoneConnection.created))
+        self.assertEqual(2, self._num_requests())
+
+    def test_caches_successful_validation(self):
+        self._queue(FakeKeystoneResponse(200, self.token),
+                    FakeKeystoneResponse(200, self.token))
+        self.assertEqual('token', self._request().body)
+        self.assertEqual('token', self._request().body)
+        self.assertEqual(1, self._num_requests())
+
+        timeutils.advance_time_seconds(CONF.keystone_ec2_cache_time)
+        self.assertEqual('token', self._request().body)
+        self.assertEqual(2, self._num_requests())
+
+    def test_cache_disabled(self):
+        self.flags(keystone_ec2_cache_time=0)
+        self._queue(FakeKeystoneResponse(200, self.token),
+                    FakeKeystoneResponse(200, self.token))
+        self._request()
+        self._request()
+        self.assertEqual(2, self._num_requests())
+
+    def test_does_not_cache_failure(self):
+        self._queue(FakeKeystoneResponse(401, ''),
+                    FakeKeystoneResponse(200, self.token))
+        self.assertEqual(400, self._request().status_int)
+        self.assertEqual('token', self._request().body)
+        self.assertEqual(2, self._num_requests())
+
+    def test_retries_dropped_connection(self):
+        self._queue(FakeKeystoneResponse(200, self.token),
+                    ec2.httplib.BadStatusLine(''),
+                    FakeKeystoneResponse(200, self.token))
+        self._request('sig1')
+        self.assertEqual('token', self._request('sig2').body)
+        conn = FakeKeystoneConnection.created[0]
+        self.assertEqual(1, len(FakeKeystoneConnection.created))
+        self.assertEqual(3, len(conn.requests))
+        self.assertEqual(1, conn.closed)
+
+
 class ExecutorTestCase(test.TestCase):
     def setUp(self):
         super(ExecutorTestCase, self).setUp()
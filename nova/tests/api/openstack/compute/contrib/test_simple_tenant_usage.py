@@ -70,6 +70,7 @@ def get_fake_db_instance(start, end, instance_id, tenant_id):
             'instance_type_id': 1,
             'launched_at': start,
             'terminated_at': end,
+            'deleted': 0,
             'system_metadata': sys_meta}
 
 
@@ -82,11 +83,30 @@ def fake_instance_get_active_by_window_joined(self, context, begin, end,
                                          for x in xrange(TENANTS * SERVERS)]
 
 
+def fake_get_usage_by_window(self, context, begin, end, project_id,
+                             marker=None, limit=None):
+    usages = [dict((key, inst[key]) for key in
+                   ('id', 'uuid', 'project_id', 'launched_at',
+                    'terminated_at', 'deleted', 'instance_type_id',
+                    'system_metadata'))
+              for inst in fake_instance_get_active_by_window_joined(
+                  self, context, begin, end, project_id)]
+    if project_id:
+        usages = [u for u in usages if u['project_id'] == project_id]
+    if marker is not None:
+        usages = [u for u in usages if u['id'] > marker]
+    if limit:
+        usages = usages[:limit]
+    return usages
+
+
 class SimpleTenantUsageTest(test.TestCase):
     def setUp(self):
         super(SimpleTenantUsageTest, self).setUp()
         self.stubs.Set(api.API, "get_active_by_window",
                        fake_instance_get_active_by_window_joined)
+        self.stubs.Set(api.API, "get_usage_by_window",
+                       fake_get_usage_by_window)
         self.admin_context = context.RequestContext('fakeadmin_0',
                                                     'faketenant_0',
                                                     is_admin=True)
@@ -115,14 +135,16 @@ class SimpleTenantUsageTest(test.TestCase):
         self.assertEqual(res.status_int, 200)
         res_dict = jsonutils.loads(res.body)
         usages = res_dict['tenant_usages']
+        # Usage built from rollups adds up fractional hours from the
+        # edges of the window, so round instead of truncating the totals.
         for i in xrange(TENANTS):
-            self.assertEqual(int(usages[i]['total_hours']),
+            self.assertEqual(round(usages[i]['total_hours']),
                              SERVERS * HOURS)
-            self.assertEqual(int(usages[i]['total_local_gb_usage']),
+            self.assertEqual(round(usages[i]['total_local_gb_usage']),
                              SERVERS * (ROOT_GB + EPHEMERAL_GB) * HOURS)
-            self.assertEqual(int(usages[i]['total_memory_mb_usage']),
+            self.assertEqual(round(usages[i]['total_memory_mb_usage']),
                              SERVERS * MEMORY_MB * HOURS)
-            self.assertEqual(int(usages[i]['total_vcpus_usage']),
+            self.assertEqual(round(usages[i]['total_vcpus_usage']),
                              SERVERS * VCPUS * HOURS)
             self.assertFalse(usages[i].get('server_usages'))
 
@@ -133,6 +155,110 @@ class SimpleTenantUsageTest(test.TestCase):
         future = NOW + datetime.timedelta(hours=HOURS)
         self._test_verify_index(START, future)
 
+    def test_verify_index_in_batches(self):
+        calls = []
+
+        def fake_usage(self, context, begin, end, project_id,
+                       marker=None, limit=None):
+            calls.append(marker)
+            return fake_get_usage_by_window(self, context, begin, end,
+                                            project_id, marker, limit)
+
+        self.stubs.Set(api.API, "get_usage_by_window", fake_usage)
+        self.flags(simple_tenant_usage_batch_size=3)
+        self._test_verify_index(START, STOP)
+        self.assertEqual(calls, [None, 2, 5, 8])
+
+    def test_verify_index_skips_instances_without_flavor(self):
+        def fake_usage(self, context, begin, end, project_id,
+                       marker=None, limit=None):
+            usages = fake_get_usage_by_window(self, context, begin, end,
+                                              project_id, marker, limit)
+            if marker is None:
+                # A deleted instance whose flavor is gone is not billed
+                usages.append({'id': TENANTS * SERVERS,
+                               'uuid': 'deleted-uuid',
+                               'project_id': 'faketenant_0',
+                               'launched_at': START,
+                               'terminated_at': STOP,
+                               'deleted': TENANTS * SERVERS,
+                               'instance_type_id': 42,
+                               'system_metadata': []})
+            return usages
+
+        def fake_get_instance_type(self, context, instance_type_id):
+            raise exception.InstanceTypeNotFound(
+                    instance_type_id=instance_type_id)
+
+        self.stubs.Set(api.API, "get_usage_by_window", fake_usage)
+        self.stubs.Set(api.API, "get_instance_type", fake_get_instance_type)
+        self._test_verify_index(START, STOP)
+
+    def _test_verify_index_from_rollups(self, task_log_state):
+        calls = []
+
+        def fake_rollup_totals(self, context, begin, end, project_id=None):
+            calls.append((begin, end))
+            dt = end - begin
+            hours = SERVERS * (dt.days * 24 + dt.seconds / 3600.0)
+            return [{'project_id': "faketenant_%s" % x,
+                     'instance_hours': hours,
+                     'vcpu_hours': VCPUS * hours,
+                     'memory_mb_hours': MEMORY_MB * hours,
+                     'local_gb_hours': (ROOT_GB + EPHEMERAL_GB) * hours}
+                    for x in xrange(TENANTS)]
+
+        def fake_service_get_all(self, context, filters=None,
+                                 set_zones=False):
+            return [{'host': 'host1', 'created_at': None},
+                    {'host': 'host2', 'created_at': None},
+                    # Not up yet when the window was audited
+                    {'host': 'host3', 'created_at': NOW}]
+
+        def fake_task_log_get_all(self, context, task_name, begin, end,
+                                  host=None, state=None):
+            return [{'host': host, 'state': task_log_state(host, end),
+                     'errors': 0}
+                    for host in ('host1', 'host2')]
+
+        self.stubs.Set(api.API, "get_usage_rollup_totals",
+                       fake_rollup_totals)
+        self.stubs.Set(api.HostAPI, "service_get_all", fake_service_get_all)
+        self.stubs.Set(api.HostAPI, "task_log_get_all",
+                       fake_task_log_get_all)
+        self.flags(simple_tenant_usage_rollups=True,
+                   instance_usage_audit_period='hour')
+        self._test_verify_index(START, STOP)
+        return calls
+
+    def test_verify_index_from_rollups(self):
+        calls = self._test_verify_index_from_rollups(
+            lambda host, end: "DONE")
+
+        rollup_start = START.replace(minute=0, second=0, microsecond=0)
+        if rollup_start < START:
+            rollup_start += datetime.timedelta(hours=1)
+        rollup_stop = STOP.replace(minute=0, second=0, microsecond=0)
+        self.assertEqual(calls, [(rollup_start, rollup_stop)])
+
+    def test_verify_index_from_rollups_of_audited_periods(self):
+        # The last four hours have not been audited on host2 yet
+        audited_stop = (STOP.replace(minute=0, second=0, microsecond=0) -
+                        datetime.timedelta(hours=4))
+
+        def task_log_state(host, end):
+            if host == 'host2' and end > audited_stop:
+                return "RUNNING"
+            return "DONE"
+
+        calls = self._test_verify_index_from_rollups(task_log_state)
+        self.assertEqual([stop for start, stop in calls], [audited_stop])
+
+    def test_verify_index_without_audited_periods(self):
+        calls = self._test_verify_index_from_rollups(
+            lambda host, end: "RUNNING")
+        self.assertEqual(calls, [])
+
     def test_verify_show(self):
         self._test_verify_show(START, STOP)
 
@@ -3659,6 +3659,58 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(instances[0]['task_state'], None)
 
+    def _test_sync_power_states(self, db_power_state, vm_power_states,
+                                synced):
+        instance = {'name': 'instance-00000001', 'uuid': 'fake-uuid',
+                    'task_state': None, 'vm_state': vm_states.ACTIVE,
+                    'power_state': db_power_state}
+        ctxt = context.get_admin_context()
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'instance_get_all_by_host')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+
+        self.compute.conductor_api.instance_get_all_by_host(
+            ctxt, self.compute.host, columns_to_join=[]).AndReturn([instance])
+        if vm_power_states is None:
+            self.compute.driver.get_power_states().AndRaise(
+                NotImplementedError())
+            self.stubs.Set(self.compute.driver, 'get_num_instances',
+                           lambda: 1)
+            self.compute.driver.get_info(instance).AndReturn(
+                {'state': power_state.RUNNING})
+            vm_power_state = power_state.RUNNING
+        else:
+            self.compute.driver.get_power_states().AndReturn(vm_power_states)
+            vm_power_state = vm_power_states.get(instance['name'],
+                                                 power_state.NOSTATE)
+        if synced:
+            self.compute._sync_instance_power_state(ctxt, instance,
+                                                    vm_power_state)
+
+        self.mox.ReplayAll()
+
+        self.compute._sync_power_states(ctxt)
+
+    def test_sync_power_states_in_sync(self):
+        self._test_sync_power_states(
+            power_state.RUNNING,
+            {'instance-00000001': power_state.RUNNING},
+            synced=False)
+
+    def test_sync_power_states_drifted(self):
+        self._test_sync_power_states(
+            power_state.RUNNING,
+            {'instance-00000001': power_state.SHUTDOWN},
+            synced=True)
+
+    def test_sync_power_states_missing_from_hypervisor(self):
+        self._test_sync_power_states(power_state.RUNNING, {}, synced=True)
+
+    def test_sync_power_states_without_bulk_driver_support(self):
+        self._test_sync_power_states(power_state.RUNNING, None, synced=False)
+
     def test_add_instance_fault(self):
         instance = self._create_fake_instance()
         exc_info = None
@@ -3848,82 +3900,73 @@ class ComputeTestCase(BaseTestCase):
                                                     fake_instance)
         self.assertEqual(fake_nw_info, result)
 
+    def test_heal_instance_info_cache_is_periodic(self):
+        task_names = [name for name, task in self.compute._periodic_tasks]
+        self.assertIn('_heal_instance_info_cache', task_names)
+        self.assertNotIn('_mark_info_cache_stale', task_names)
+
     def test_heal_instance_info_cache(self):
         # Update on every call for the test
         self.flags(heal_instance_info_cache_interval=-1)
+        self.flags(heal_instance_info_cache_batch_size=2)
         ctxt = context.get_admin_context()
 
-        instance_map = {}
         instances = []
         for x in xrange(5):
-            uuid = 'fake-uuid-%s' % x
-            instance_map[uuid] = {'uuid': uuid, 'host': CONF.host}
-            instances.append(instance_map[uuid])
+            updated_at = datetime.datetime(2013, 1, 1, 0, 5 - x)
+            instances.append({'uuid': 'fake-uuid-%s' % x,
+                              'host': CONF.host,
+                              'info_cache': {'updated_at': updated_at}})
+        # This info_cache has never been updated
+        instances[2]['info_cache'] = {'created_at': None, 'updated_at': None}
 
-        call_info = {'get_all_by_host': 0, 'get_by_uuid': 0,
-                'get_nw_info': 0, 'expected_instance': None}
+        call_info = {'get_all_by_host': 0, 'batches': [], 'failed': []}
 
         def fake_instance_get_all_by_host(context, host, columns_to_join):
             call_info['get_all_by_host'] += 1
-            self.assertEqual(columns_to_join, [])
+            self.assertEqual(columns_to_join,
+                             ['info_cache', 'system_metadata'])
             return instances[:]
 
-        def fake_instance_get_by_uuid(context, instance_uuid):
-            if instance_uuid not in instance_map:
-                raise exception.InstanceNotFound(instance_id=instance_uuid)
-            call_info['get_by_uuid'] += 1
-            return instance_map[instance_uuid]
-
-        # NOTE(comstud): Override the stub in setUp()
-        def fake_get_instance_nw_info(context, instance):
-            # Note that this exception gets caught in compute/manager
-            # and is ignored.  However, the below increment of
-            # 'get_nw_info' won't happen, and you'll get an assert
-            # failure checking it below.
-            self.assertEqual(call_info['expected_instance'], instance)
-            call_info['get_nw_info'] += 1
+        def fake_get_instance_nw_info_bulk(context, batch, conductor_api):
+            call_info['batches'].append([inst['uuid'] for inst in batch])
+            return dict((inst['uuid'], 'fake-nw-info') for inst in batch
+                        if inst['uuid'] not in call_info['failed'])
 
         self.stubs.Set(self.compute.conductor_api, 'instance_get_all_by_host',
                 fake_instance_get_all_by_host)
-        self.stubs.Set(self.compute.conductor_api, 'instance_get_by_uuid',
-                fake_instance_get_by_uuid)
-        self.stubs.Set(self.compute, '_get_instance_nw_info',
-                fake_get_instance_nw_info)
+        self.stubs.Set(self.compute.network_api, 'get_instance_nw_info_bulk',
+                fake_get_instance_nw_info_bulk)
 
-        call_info['expected_instance'] = instances[0]
+        # Caches which were never updated go first, then the oldest ones
         self.compute._heal_instance_info_cache(ctxt)
         self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(0, call_info['get_by_uuid'])
-        self.assertEqual(1, call_info['get_nw_info'])
+        self.assertEqual(['fake-uuid-2', 'fake-uuid-4'],
+                         call_info['batches'][-1])
 
-        call_info['expected_instance'] = instances[1]
+        # Instances whose network changed jump the queue
+        self.compute._mark_info_cache_stale(instances[0])
         self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(1, call_info['get_all_by_host'])
-        self.assertEqual(1, call_info['get_by_uuid'])
-        self.assertEqual(2, call_info['get_nw_info'])
-
-        # Make an instance switch hosts
-        instances[2]['host'] = 'not-me'
-        # Make an instance disappear
-        instance_map.pop(instances[3]['uuid'])
-        # '2' and '3' should be skipped..
-        call_info['expected_instance'] = instances[4]
+        self.assertEqual(['fake-uuid-0', 'fake-uuid-2'],
+                         call_info['batches'][-1])
+        self.assertEqual(set(), self.compute._instances_to_heal)
+
+        # They stay at the front of the queue until they were refreshed
+        call_info['failed'].append('fake-uuid-1')
+        self.compute._mark_info_cache_stale(instances[1])
         self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(call_info['get_all_by_host'], 1)
-        # Incremented for '2' and '4'.. '3' caused a raise above.
-        self.assertEqual(call_info['get_by_uuid'], 3)
-        self.assertEqual(call_info['get_nw_info'], 3)
-        # Should be no more left.
-        self.assertEqual(len(self.compute._instance_uuids_to_heal), 0)
-
-        # This should cause a DB query now so we get first instance
-        # back again
-        call_info['expected_instance'] = instances[0]
+        self.assertEqual(['fake-uuid-1', 'fake-uuid-2'],
+                         call_info['batches'][-1])
+        self.assertEqual(set(['fake-uuid-1']),
+                         self.compute._instances_to_heal)
+
+        # Instances which left the host are forgotten
+        instances.pop(1)
         self.compute._heal_instance_info_cache(ctxt)
-        self.assertEqual(call_info['get_all_by_host'], 2)
-        # Stays the same, because the instance came from the DB
-        self.assertEqual(call_info['get_by_uuid'], 3)
-        self.assertEqual(call_info['get_nw_info'], 4)
+        self.assertEqual(['fake-uuid-2', 'fake-uuid-4'],
+                         call_info['batches'][-1])
+        self.assertEqual(set(), self.compute._instances_to_heal)
+        self.assertEqual(4, call_info['get_all_by_host'])
 
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
@@ -4623,8 +4666,13 @@ class ComputeTestCase(BaseTestCase):
 
         self.mox.StubOutWithMock(self.compute.conductor_api,
                                  'notify_usage_exists')
+        self.mox.StubOutWithMock(self.compute.conductor_api,
+                                 'instance_usage_rollup_set')
         self.compute.conductor_api.notify_usage_exists(
             self.context, instances[0], ignore_missing_network_data=False)
+        begin, end = utils.last_completed_audit_period()
+        self.compute.conductor_api.instance_usage_rollup_set(
+            self.context, self.compute.host, begin, end, [])
         self.mox.ReplayAll()
         self.compute._instance_usage_audit(self.context)
 
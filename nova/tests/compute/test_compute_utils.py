@@ -17,6 +17,7 @@
 
 """Tests For miscellaneous util methods used with compute."""
 
+import datetime
 import string
 
 from oslo.config import cfg
@@ -34,6 +35,7 @@ from nova.openstack.common.notifier import test_notifier
 from nova import test
 from nova.tests import fake_instance_actions
 from nova.tests import fake_network
+from nova import utils
 import nova.tests.image.fake
 
 CONF = cfg.CONF
@@ -406,3 +408,83 @@ class UsageInfoTestCase(test.TestCase):
         image_ref_url = "%s/images/1" % glance.generate_glance_url()
         self.assertEquals(payload['image_ref_url'], image_ref_url)
         self.compute.terminate_instance(self.context, instance)
+
+
+class InstanceUsageRollupsTestCase(test.TestCase):
+    def setUp(self):
+        super(InstanceUsageRollupsTestCase, self).setUp()
+        self.begin = datetime.datetime(2013, 1, 1, 0, 0, 0)
+        self.end = datetime.datetime(2013, 1, 1, 3, 0, 0)
+
+        self.context = context.get_admin_context()
+        self.instance_type = instance_types.get_default_instance_type()
+        self.instance_type.update(vcpus=2, memory_mb=512, root_gb=10,
+                                  ephemeral_gb=5)
+
+    def _instance(self, project_id, launched_at, terminated_at=None):
+        sys_meta = instance_types.save_instance_type_info(
+            {}, self.instance_type)
+        return {'project_id': project_id,
+                'launched_at': launched_at,
+                'terminated_at': terminated_at,
+                'deleted': 0,
+                'instance_type_id': self.instance_type['id'],
+                'system_metadata': utils.dict_to_metadata(sys_meta),
+                # The flavor, not these columns, is what gets billed
+                'vcpus': 1,
+                'memory_mb': 1,
+                'root_gb': 1,
+                'ephemeral_gb': 1}
+
+    def _rollups(self, instances, conductor=None):
+        rollups = compute_utils.instance_usage_rollups(
+            self.context, conductor, instances, self.begin, self.end)
+        return dict(((r['project_id'], r['period_beginning'].hour), r)
+                    for r in rollups)
+
+    def test_splits_usage_per_hour(self):
+        instance = self._instance('p1',
+                                  datetime.datetime(2012, 12, 31, 23, 0, 0),
+                                  datetime.datetime(2013, 1, 1, 1, 30, 0))
+        rollups = self._rollups([instance])
+        self.assertEqual(sorted(rollups.keys()), [('p1', 0), ('p1', 1)])
+        self.assertEqual(rollups[('p1', 0)]['instance_hours'], 1.0)
+        self.assertEqual(rollups[('p1', 1)]['instance_hours'], 0.5)
+        self.assertEqual(rollups[('p1', 1)]['vcpu_hours'], 1.0)
+        self.assertEqual(rollups[('p1', 1)]['memory_mb_hours'], 256.0)
+        self.assertEqual(rollups[('p1', 1)]['local_gb_hours'], 7.5)
+
+    def test_sums_instances_of_a_project(self):
+        instances = [self._instance('p1', '2013-01-01T02:15:00.000000'),
+                     self._instance('p1', datetime.datetime(2013, 1, 1, 2)),
+                     self._instance('p2', datetime.datetime(2013, 1, 1, 2)),
+                     self._instance('p2', None)]
+        rollups = self._rollups(instances)
+        self.assertEqual(sorted(rollups.keys()), [('p1', 2), ('p2', 2)])
+        self.assertEqual(rollups[('p1', 2)]['instance_hours'], 1.75)
+        self.assertEqual(rollups[('p2', 2)]['instance_hours'], 1.0)
+
+    def test_deleted_instances_fall_back_to_flavor_id(self):
+        conductor = self.mox.CreateMockAnything()
+        conductor.instance_type_get(self.context, 1).AndReturn(
+            self.instance_type)
+        conductor.instance_type_get(self.context, 2).AndRaise(
+            exception.InstanceTypeNotFound(instance_type_id=2))
+        self.mox.ReplayAll()
+
+        instances = []
+        for instance_type_id in (1, 1, 2, 2):
+            instance = self._instance('p1', self.begin)
+            instance['system_metadata'] = []
+            instance['deleted'] = 1
+            instance['instance_type_id'] = instance_type_id
+            instances.append(instance)
+        rollups = self._rollups(instances, conductor)
+        # Instances whose flavor is gone are not billed
+        self.assertEqual(rollups[('p1', 0)]['instance_hours'], 2.0)
+        self.assertEqual(rollups[('p1', 0)]['vcpu_hours'], 4.0)
+
+    def test_flavor_required_for_active_instances(self):
+        instance = self._instance('p1', self.begin)
+        instance['system_metadata'] = []
+        self.assertRaises(KeyError, self._rollups, [instance])
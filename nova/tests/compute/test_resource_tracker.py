@@ -518,6 +518,33 @@ class InstanceClaimTestCase(BaseTrackerTestCase):
         self.assertEqual(claim_disk, self.compute['local_gb_used'])
         self.assertEqual(6 - claim_disk, self.compute['free_disk_gb'])
 
+    def test_claim_pushes_resources(self):
+        self.flags(compute_resources_push=True)
+        pushed = []
+
+        def fake_update_service_capabilities(ctxt, service_name, host,
+                                             capabilities):
+            pushed.append((service_name, host, capabilities))
+
+        self.stubs.Set(self.tracker.scheduler_rpcapi,
+                       'update_service_capabilities',
+                       fake_update_service_capabilities)
+
+        instance = self._fake_instance(memory_mb=3, root_gb=2,
+                                       ephemeral_gb=0)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+
+        self.assertEqual(1, len(pushed))
+        service_name, host, capabilities = pushed[0]
+        self.assertEqual('compute', service_name)
+        self.assertEqual(self.host, host)
+        self.assertEqual('fakenode', capabilities[0]['hypervisor_hostname'])
+        update = capabilities[0]['compute_node_update']
+        self.assertEqual(5 - 3, update['free_ram_mb'])
+        self.assertEqual(2, update['local_gb_used'])
+        self.assertEqual([{'key': 'num_instances', 'value': '1'}],
+                         update['stats'])
+
     def test_claim_and_abort(self):
         claim_mem = 3
         claim_disk = 2
@@ -14,6 +14,8 @@
 
 """Tests for the conductor service."""
 
+import datetime
+
 import mox
 
 from nova.api.ec2 import ec2utils
@@ -459,6 +461,19 @@ class _BaseTestCase(object):
             self.context, 'task', 'begin', 'end', 'host', 'errors', 'message')
         self.assertEqual(result, 'result')
 
+    def test_instance_usage_rollup_set(self):
+        begin = datetime.datetime(2013, 1, 1)
+        end = datetime.datetime(2013, 2, 1)
+        rollups = [{'project_id': 'fake-project',
+                    'period_beginning': begin,
+                    'instance_hours': 1.0}]
+        self.mox.StubOutWithMock(db, 'instance_usage_rollup_set')
+        db.instance_usage_rollup_set(self.context.elevated(), 'host', begin,
+                                     end, rollups)
+        self.mox.ReplayAll()
+        self.conductor.instance_usage_rollup_set(self.context, 'host', begin,
+                                                 end, rollups)
+
     def test_notify_usage_exists(self):
         info = {
             'audit_period_beginning': 'start',
@@ -71,6 +71,8 @@ VIR_DOMAIN_CRASHED = 6
 
 VIR_DOMAIN_XML_SECURE = 1
 
+VIR_CONNECT_LIST_DOMAINS_ACTIVE = 1
+
 VIR_DOMAIN_EVENT_ID_LIFECYCLE = 0
 
 VIR_DOMAIN_EVENT_DEFINED = 0
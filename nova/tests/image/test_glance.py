@@ -33,6 +33,7 @@ from nova import test
 from nova.tests.api.openstack import fakes
 from nova.tests.glance import stubs as glance_stubs
 from nova.tests import matchers
+from nova import utils
 
 CONF = cfg.CONF
 
@@ -512,6 +513,36 @@ class TestGlanceImageService(test.TestCase):
         os.remove(client.s_tmpfname)
         os.remove(tmpfname)
 
+    def test_download_file_url_to_path(self):
+        class MyGlanceStubClient(glance_stubs.StubGlanceClient):
+            """A client that returns a file url."""
+            def get(self, image_id):
+                return type('GlanceTestDirectUrlMeta', (object,),
+                            {'direct_url': 'file:///images/image1'})
+
+        service = self._create_image_service(MyGlanceStubClient())
+        self.flags(allowed_direct_url_schemes=['file'])
+        self.mox.StubOutWithMock(utils, 'execute')
+        utils.execute('cp', '--reflink=auto', '/images/image1', '/tmp/dst')
+        self.mox.ReplayAll()
+        service.download(self.context, 1, dst_path='/tmp/dst')
+
+    def test_download_to_path(self):
+        class MyGlanceStubClient(glance_stubs.StubGlanceClient):
+            """A client that returns image data in chunks."""
+            def data(self, image_id):
+                return ['chunk1', 'chunk2']
+
+        service = self._create_image_service(MyGlanceStubClient())
+        (outfd, tmpfname) = tempfile.mkstemp(prefix='downloaddst')
+        os.close(outfd)
+        try:
+            service.download(self.context, 1, dst_path=tmpfname)
+            with open(tmpfname) as f:
+                self.assertEqual(f.read(), 'chunk1chunk2')
+        finally:
+            os.remove(tmpfname)
+
     def test_client_forbidden_converts_to_imagenotauthed(self):
         class MyGlanceStubClient(glance_stubs.StubGlanceClient):
             """A client that raises a Forbidden exception."""
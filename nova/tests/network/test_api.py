@@ -28,6 +28,7 @@ from nova import exception
 from nova import network
 from nova.network import api
 from nova.network import floating_ips
+from nova.network import model as network_model
 from nova.network import rpcapi as network_rpcapi
 from nova import policy
 from nova import test
@@ -255,3 +256,58 @@ class ApiTestCase(test.TestCase):
         instance = {'uuid': FAKE_UUID}
         result = self.network_api._is_multi_host(self.context, instance)
         self.assertEqual(is_multi_host, result)
+
+    def test_get_instance_nw_info_bulk(self):
+        sys_meta = instance_types.save_instance_type_info({},
+                instance_types.get_default_instance_type())
+        instances = [dict(uuid='fake-uuid-%d' % x, host='fake-host',
+                          system_metadata=utils.dict_to_metadata(sys_meta))
+                     for x in xrange(3)]
+        nw_info = network_model.NetworkInfo()
+
+        def fake_get_nw_info_bulk(ctxt, instance_uuids, rxtx_factors, hosts):
+            self.assertEqual(['fake-uuid-0', 'fake-uuid-1', 'fake-uuid-2'],
+                             instance_uuids)
+            self.assertEqual(set(instance_uuids), set(rxtx_factors))
+            self.assertEqual('fake-host', hosts['fake-uuid-1'])
+            # fake-uuid-1 could not be found by the network manager
+            return {'fake-uuid-0': [], 'fake-uuid-2': []}
+
+        updated = []
+
+        def fake_instance_info_cache_update(context, instance_uuid, cache):
+            updated.append(instance_uuid)
+
+        self.stubs.Set(self.network_api.network_rpcapi,
+                       'get_instance_nw_info_bulk', fake_get_nw_info_bulk)
+        self.stubs.Set(self.network_api.db, 'instance_info_cache_update',
+                       fake_instance_info_cache_update)
+
+        result = self.network_api.get_instance_nw_info_bulk(self.context,
+                                                            instances)
+        self.assertEqual({'fake-uuid-0': nw_info, 'fake-uuid-2': nw_info},
+                         result)
+        self.assertEqual(['fake-uuid-0', 'fake-uuid-2'], updated)
+
+    def test_get_instance_nw_info_bulk_without_instance_type(self):
+        sys_meta = instance_types.save_instance_type_info({},
+                instance_types.get_default_instance_type())
+        instances = [dict(uuid='fake-uuid-%d' % x, host='fake-host',
+                          system_metadata=utils.dict_to_metadata(sys_meta))
+                     for x in xrange(2)]
+        # This instance has no flavor in its system_metadata
+        instances.append(dict(uuid='fake-uuid-2', host='fake-host',
+                              system_metadata=[]))
+
+        def fake_get_nw_info_bulk(ctxt, instance_uuids, rxtx_factors, hosts):
+            self.assertEqual(['fake-uuid-0', 'fake-uuid-1'], instance_uuids)
+            return dict((uuid, []) for uuid in instance_uuids)
+
+        self.stubs.Set(self.network_api.network_rpcapi,
+                       'get_instance_nw_info_bulk', fake_get_nw_info_bulk)
+        self.stubs.Set(self.network_api.db, 'instance_info_cache_update',
+                       lambda *args: None)
+
+        result = self.network_api.get_instance_nw_info_bulk(self.context,
+                                                            instances)
+        self.assertEqual(['fake-uuid-0', 'fake-uuid-1'], sorted(result))
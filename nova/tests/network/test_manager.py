@@ -31,6 +31,7 @@ from nova.network import manager as network_manager
 from nova.network import model as net_model
 from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common import importutils
+from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import rpc
 from nova.openstack.common.rpc import common as rpc_common
@@ -206,6 +207,55 @@ class FlatNetworkTestCase(test.TestCase):
                       for ip_num in xrange(1, num_fixed_ips + 1)]
             self.assertThat(info['ips'], matchers.DictListMatches(check))
 
+    def test_get_instance_nw_info_bulk(self):
+        ctxt = context.get_admin_context()
+        network = db.network_create_safe(ctxt, {
+                'uuid': 'bbbbbbbb-bbbb-bbbb-bbbb-bbbbbbbbbbbb',
+                'label': 'test', 'bridge': 'br0',
+                'cidr': '192.168.0.0/24', 'gateway': '192.168.0.1',
+                'cidr_v6': '2001:db8::/64', 'gateway_v6': '2001:db8::1',
+                'netmask_v6': '64', 'project_id': 'fake', 'rxtx_base': 10})
+        instance_uuids = []
+        for i in xrange(3):
+            instance = db.instance_create(ctxt, {'host': HOST})
+            instance_uuids.append(instance['uuid'])
+            vif = db.virtual_interface_create(ctxt, {
+                    'address': 'DE:AD:BE:EF:00:%02x' % i,
+                    'uuid': '00000000-0000-0000-0000-0000000000%02d' % i,
+                    'network_id': network['id'],
+                    'instance_uuid': instance['uuid']})
+            address = db.fixed_ip_create(ctxt, {
+                    'address': '192.168.0.%d' % (i + 10),
+                    'network_id': network['id'],
+                    'virtual_interface_id': vif['id'],
+                    'instance_uuid': instance['uuid'],
+                    'allocated': True})
+            if i == 1:
+                fixed_ip = db.fixed_ip_get_by_address(ctxt, address)
+                db.floating_ip_create(ctxt, {'address': '10.0.0.1',
+                                             'fixed_ip_id': fixed_ip['id']})
+        # An instance without any vifs gets an empty network info
+        instance = db.instance_create(ctxt, {'host': HOST})
+        instance_uuids.append(instance['uuid'])
+
+        rxtx_factors = dict((uuid, 2) for uuid in instance_uuids)
+        nw_infos = self.network.get_instance_nw_info_bulk(ctxt,
+                instance_uuids, rxtx_factors=rxtx_factors,
+                hosts=dict((uuid, HOST) for uuid in instance_uuids))
+
+        self.assertEqual(set(instance_uuids), set(nw_infos))
+        self.assertEqual([], nw_infos[instance_uuids[3]])
+        for instance_uuid in instance_uuids:
+            nw_info = self.network.get_instance_nw_info(ctxt, instance_uuid,
+                                                        2, HOST)
+            self.assertEqual(jsonutils.loads(nw_info.json()),
+                             jsonutils.loads(nw_infos[instance_uuid].json()))
+        self.assertEqual(['10.0.0.1'],
+                         [ip['address'] for ip in
+                          nw_infos[instance_uuids[1]].floating_ips()])
+        self.assertEqual(20,
+                         nw_infos[instance_uuids[0]][0].get_meta('rxtx_cap'))
+
     def test_validate_networks(self):
         self.mox.StubOutWithMock(db, 'network_get')
         self.mox.StubOutWithMock(db, 'network_get_all_by_uuids')
@@ -203,6 +203,12 @@ class NetworkRpcAPITestCase(test.TestCase):
                 instance_id='fake_id', rxtx_factor='fake_factor',
                 host='fake_host', project_id='fake_id', version='1.9')
 
+    def test_get_instance_nw_info_bulk(self):
+        self._test_network_api('get_instance_nw_info_bulk',
+                rpc_method='call', instance_uuids=['fake_uuid'],
+                rxtx_factors={'fake_uuid': 'fake_factor'},
+                hosts={'fake_uuid': 'fake_host'}, version='1.10')
+
     def test_validate_networks(self):
         self._test_network_api('validate_networks', rpc_method='call',
                 networks={})
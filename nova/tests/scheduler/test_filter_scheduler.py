@@ -659,6 +659,66 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.assertEquals(50, hosts[0].weight)
 
+    def test_schedule_batch_placement(self):
+        """Hosts are filtered and weighed once for the whole request, then
+        only the chosen host is re-evaluated after each instance."""
+
+        self.flags(scheduler_batch_placement=True,
+                   scheduler_host_subset_size=1)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+
+        filtered = []
+
+        def _fake_get_filtered_hosts(hosts, filter_properties):
+            hosts = list(hosts)
+            filtered.append(len(hosts))
+            return hosts
+
+        self.stubs.Set(sched.host_manager, 'get_filtered_hosts',
+                _fake_get_filtered_hosts)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        instance_properties = {'project_id': 1,
+                               'root_gb': 512,
+                               'memory_mb': 2048,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux'}
+        request_spec = {'num_instances': 4,
+                        'instance_properties': instance_properties}
+        self.mox.ReplayAll()
+        hosts = sched._schedule(fake_context, request_spec, {})
+
+        # host4: free_ram_mb=8192, host3: free_ram_mb=3072
+        self.assertEqual(['host4', 'host4', 'host4', 'host3'],
+                         [weighed_host.obj.host for weighed_host in hosts])
+        self.assertEqual([4, 1, 1, 1, 1], filtered)
+
+    def test_schedule_batch_placement_drops_full_hosts(self):
+        self.flags(scheduler_batch_placement=True,
+                   scheduler_default_filters=['RamFilter'],
+                   ram_allocation_ratio=1.0)
+        sched = fakes.FakeFilterScheduler()
+        fake_context = context.RequestContext('user', 'project',
+                is_admin=True)
+        fakes.mox_host_manager_db_calls(self.mox, fake_context)
+
+        instance_type = {'memory_mb': 4096, 'root_gb': 512,
+                         'ephemeral_gb': 0, 'vcpus': 1}
+        instance_properties = dict(instance_type, project_id=1,
+                                   os_type='Linux')
+        request_spec = {'num_instances': 3,
+                        'instance_type': instance_type,
+                        'instance_properties': instance_properties}
+        self.mox.ReplayAll()
+        hosts = sched._schedule(fake_context, request_spec, {})
+
+        # Only host4 has room, and only for two instances.
+        self.assertEqual(['host4', 'host4'],
+                         [weighed_host.obj.host for weighed_host in hosts])
+
     def test_select_hosts_happy_day(self):
         """select_hosts is basically a wrapper around the _select() method.
         Similar to the _select tests, this just does a happy path test to
@@ -16,6 +16,7 @@ Tests For Scheduler Host Filters.
 """
 
 import httplib
+import time
 
 from oslo.config import cfg
 import stubout
@@ -44,6 +45,74 @@ class TestBogusFilter(object):
     pass
 
 
+class TestCacheableFilter(filters.BaseHostFilter):
+    cacheable = True
+    calls = []
+
+    def cache_key(self, filter_properties):
+        return filter_properties.get('flavor')
+
+    def host_passes(self, host_state, filter_properties):
+        self.calls.append(host_state.host)
+        return host_state.host != 'host2'
+
+
+class HostFilterCacheTestCase(test.TestCase):
+    """Test case for caching of host filter results."""
+
+    def setUp(self):
+        super(HostFilterCacheTestCase, self).setUp()
+        self.flags(scheduler_filter_cache_ttl=60)
+        self.filter_handler = filters.HostFilterHandler()
+        self.hosts = [fakes.FakeHostState('host1', 'node1', {}),
+                      fakes.FakeHostState('host2', 'node2', {})]
+        TestCacheableFilter.calls = []
+
+    def _filter(self, filter_properties):
+        return self.filter_handler.get_filtered_objects(
+                [TestCacheableFilter], self.hosts, filter_properties)
+
+    def test_results_reused(self):
+        self.assertEqual([self.hosts[0]], self._filter({'flavor': 1}))
+        self.assertEqual([self.hosts[0]], self._filter({'flavor': 1}))
+        self.assertEqual(['host1', 'host2'], TestCacheableFilter.calls)
+
+    def test_results_keyed_by_request(self):
+        self._filter({'flavor': 1})
+        self._filter({'flavor': 2})
+        self.assertEqual(['host1', 'host2', 'host1', 'host2'],
+                         TestCacheableFilter.calls)
+
+    def test_host_state_change_invalidates(self):
+        self._filter({'flavor': 1})
+        self.hosts[1].update_capabilities({'foo': 'bar'})
+        self._filter({'flavor': 1})
+        self.assertEqual(['host1', 'host2', 'host2'],
+                         TestCacheableFilter.calls)
+
+    def test_resource_changes_keep_results(self):
+        self._filter({'flavor': 1})
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=0, vcpus=0)
+        self.hosts[1].consume_from_instance(instance)
+        self._filter({'flavor': 1})
+        self.assertEqual(['host1', 'host2'], TestCacheableFilter.calls)
+
+    def test_results_expire(self):
+        self.stubs.Set(time, 'time', lambda: 1000)
+        self._filter({'flavor': 1})
+        self.stubs.Set(time, 'time', lambda: 1061)
+        self._filter({'flavor': 1})
+        self.assertEqual(['host1', 'host2', 'host1', 'host2'],
+                         TestCacheableFilter.calls)
+
+    def test_cache_disabled(self):
+        self.flags(scheduler_filter_cache_ttl=0)
+        self._filter({'flavor': 1})
+        self._filter({'flavor': 1})
+        self.assertEqual(['host1', 'host2', 'host1', 'host2'],
+                         TestCacheableFilter.calls)
+
+
 class ExtraSpecsOpsTestCase(test.TestCase):
     def _do_extra_specs_ops_test(self, value, req, matches):
         assertion = self.assertTrue if matches else self.assertFalse
@@ -539,6 +608,44 @@ class HostFiltersTestCase(test.TestCase):
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
         self.assertEqual(2048 * 2.0, host.limits['memory_mb'])
 
+    def _stub_columnar_filtering(self):
+        if filters.numpy is None:
+            self.skipTest('numpy is not installed')
+        self.flags(scheduler_columnar_filtering=True)
+
+    def test_host_columns_reread_changed_hosts(self):
+        self._stub_columnar_filtering()
+        columns = filters.HostColumns()
+        host1 = fakes.FakeHostState('host1', 'node1', {'free_ram_mb': 512})
+        host2 = fakes.FakeHostState('host2', 'node2', {'free_ram_mb': 1024})
+        free_ram_mb, = columns.get([host1, host2], 'free_ram_mb')
+        self.assertEqual([512, 1024], list(free_ram_mb))
+
+        # Unchanged hosts are not read again
+        host1.free_ram_mb = 0
+        free_ram_mb, = columns.get([host2, host1], 'free_ram_mb')
+        self.assertEqual([1024, 512], list(free_ram_mb))
+
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=256, vcpus=0)
+        host2.consume_from_instance(instance)
+        host3 = fakes.FakeHostState('host3', 'node3', {'free_ram_mb': 2048})
+        free_ram_mb, = columns.get([host1, host2, host3], 'free_ram_mb')
+        self.assertEqual([512, 768, 2048], list(free_ram_mb))
+
+    def test_ram_filter_columnar(self):
+        self._stub_columnar_filtering()
+        filt_cls = self.class_map['RamFilter']()
+        self.flags(ram_allocation_ratio=2.0)
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': -1024, 'total_usable_ram_mb': 2048})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': -1025, 'total_usable_ram_mb': 2048})
+        result = filt_cls.filter_all([host1, host2], filter_properties)
+        self.assertEqual([host1], list(result))
+        self.assertEqual(2048 * 2.0, host1.limits['memory_mb'])
+        self.assertNotIn('memory_mb', host2.limits)
+
     def test_disk_filter_passes(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['DiskFilter']()
@@ -580,6 +687,24 @@ class HostFiltersTestCase(test.TestCase):
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
         self.assertEqual(12 * 10.0, host.limits['disk_gb'])
 
+    def test_disk_filter_columnar(self):
+        self._stub_columnar_filtering()
+        filt_cls = self.class_map['DiskFilter']()
+        self.flags(disk_allocation_ratio=10.0)
+        filter_properties = {'instance_type': {'root_gb': 100,
+                                               'ephemeral_gb': 19}}
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 13})
+        host3 = fakes.FakeHostState('host3', 'node3',
+                {'free_disk_mb': 0, 'total_usable_disk_gb': 12})
+        result = filt_cls.filter_all([host1, host2, host3],
+                                     filter_properties)
+        self.assertEqual([host1, host2], list(result))
+        self.assertEqual(12 * 10.0, host1.limits['disk_gb'])
+        self.assertNotIn('disk_gb', host3.limits)
+
     def test_disk_filter_oversubscribe_fail(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['DiskFilter']()
@@ -1311,6 +1436,22 @@ class HostFiltersTestCase(test.TestCase):
                 {'vcpus_total': 4, 'vcpus_used': 8})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_core_filter_columnar(self):
+        self._stub_columnar_filtering()
+        filt_cls = self.class_map['CoreFilter']()
+        filter_properties = {'instance_type': {'vcpus': 1}}
+        self.flags(cpu_allocation_ratio=2)
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 7})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'vcpus_total': 4, 'vcpus_used': 8})
+        host3 = fakes.FakeHostState('host3', 'node3', {})
+        result = filt_cls.filter_all([host1, host2, host3],
+                                     filter_properties)
+        self.assertEqual([host1, host3], list(result))
+        self.assertEqual(8, host2.limits['vcpu'])
+        self.assertNotIn('vcpu', host3.limits)
+
     @staticmethod
     def _make_zone_request(zone, is_admin=False):
         ctxt = context.RequestContext('fake', 'fake', is_admin=is_admin)
@@ -1396,6 +1537,28 @@ class HostFiltersTestCase(test.TestCase):
         filter_properties = {}
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_filter_num_iops_columnar(self):
+        self._stub_columnar_filtering()
+        self.flags(max_io_ops_per_host=8)
+        filt_cls = self.class_map['IoOpsFilter']()
+        host1 = fakes.FakeHostState('host1', 'node1',
+                                    {'num_io_ops': 7})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                                    {'num_io_ops': 8})
+        result = filt_cls.filter_all([host1, host2], {})
+        self.assertEqual([host1], list(result))
+
+    def test_filter_num_instances_columnar(self):
+        self._stub_columnar_filtering()
+        self.flags(max_instances_per_host=5)
+        filt_cls = self.class_map['NumInstancesFilter']()
+        host1 = fakes.FakeHostState('host1', 'node1',
+                                    {'num_instances': 5})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                                    {'num_instances': 4})
+        result = filt_cls.filter_all([host1, host2], {})
+        self.assertEqual([host2], list(result))
+
     def test_group_anti_affinity_filter_passes(self):
         filt_cls = self.class_map['GroupAntiAffinityFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -15,6 +15,8 @@
 """
 Tests For HostManager
 """
+import datetime
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -219,6 +221,30 @@ class HostManagerTestCase(test.TestCase):
                     ('host2', None): host2_cap}
         self.assertThat(service_states, matchers.DictMatches(expected))
 
+    def test_update_service_capabilities_compute_node_update(self):
+        context = 'fake_context'
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        update = dict(memory_mb=1024, free_ram_mb=128, local_gb=1024,
+                      local_gb_used=1, free_disk_gb=1023,
+                      disk_available_least=1000, vcpus=1, vcpus_used=1,
+                      updated_at=timeutils.strtime(),
+                      stats=[dict(key='num_instances', value='3')])
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                {'hypervisor_hostname': 'node1',
+                 'compute_node_update': update})
+
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        self.assertEqual(128, host_state.free_ram_mb)
+        self.assertEqual(1000 * 1024, host_state.free_disk_mb)
+        self.assertEqual(3, host_state.num_instances)
+        self.assertNotIn(('host1', 'node1'),
+                         self.host_manager.service_states)
+
     def test_get_all_host_states(self):
 
         context = 'fake_context'
@@ -322,6 +348,87 @@ class HostManagerChangedNodesTestCase(test.TestCase):
         host_states_map = self.host_manager.host_state_map
         self.assertEqual(len(host_states_map), 0)
 
+    def test_get_all_host_states_within_refresh_interval(self):
+        context = 'fake_context'
+        self.flags(scheduler_host_state_refresh_interval=60)
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        timeutils.set_time_override()
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(30)
+        # Served from the cache without hitting the database
+        self.host_manager.get_all_host_states(context)
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(len(host_states_map), 4)
+
+    def test_get_all_host_states_incremental(self):
+        context = 'fake_context'
+        self.flags(scheduler_host_state_full_sync_interval=600)
+        then = timeutils.utcnow()
+        compute_nodes = [dict(n, updated_at=then)
+                         for n in fakes.COMPUTE_NODES[:4]]
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'compute_node_get_all_changed_since')
+        db.compute_node_get_all(context).AndReturn(compute_nodes)
+        # node1 changed and node4 was deleted since the previous call
+        changed = [dict(compute_nodes[0], free_ram_mb=256,
+                        updated_at=then + datetime.timedelta(seconds=1)),
+                   dict(compute_nodes[3], deleted=4, service=None,
+                        deleted_at=then + datetime.timedelta(seconds=2))]
+        db.compute_node_get_all_changed_since(context, then).AndReturn(
+                changed)
+        db.compute_node_get_all_changed_since(context,
+                then + datetime.timedelta(seconds=2)).AndReturn([])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        self.host_manager.get_all_host_states(context)
+        self.host_manager.get_all_host_states(context)
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(len(host_states_map), 3)
+        self.assertNotIn(('host4', 'node4'), host_states_map)
+        self.assertEqual(host_states_map[('host1', 'node1')].free_ram_mb,
+                         256)
+        self.assertEqual(host_states_map[('host2', 'node2')].free_ram_mb,
+                         1024)
+
+    def test_get_all_host_states_full_sync_after_interval(self):
+        context = 'fake_context'
+        self.flags(scheduler_host_state_full_sync_interval=600)
+        timeutils.set_time_override()
+        then = timeutils.utcnow()
+        compute_nodes = [dict(n, updated_at=then)
+                         for n in fakes.COMPUTE_NODES[:4]]
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(compute_nodes)
+        db.compute_node_get_all(context).AndReturn(compute_nodes[:2])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        timeutils.advance_time_seconds(601)
+        self.host_manager.get_all_host_states(context)
+        host_states_map = self.host_manager.host_state_map
+        self.assertEqual(len(host_states_map), 2)
+
+    def test_update_service_capabilities_updates_host_state(self):
+        context = 'fake_context'
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                {'hypervisor_hostname': 'node1', 'foo': 'bar'})
+        host_state = self.host_manager.host_state_map[('host1', 'node1')]
+        self.assertEqual(host_state.capabilities['foo'], 'bar')
+        self.assertEqual(host_state.service['host'], 'host1')
+
 
 class HostStateTestCase(test.TestCase):
     """Test case for HostState class."""
@@ -360,6 +467,38 @@ class HostStateTestCase(test.TestCase):
         self.assertEqual(1, host.num_instances_by_os_type['windoze'])
         self.assertEqual(42, host.num_io_ops)
 
+    def test_generation_changes_with_host_state(self):
+        host = host_manager.HostState("fakehost", "fakenode",
+                                      capabilities={'foo': 'bar'})
+        generation = host.generation
+        capabilities_generation = host.capabilities_generation
+
+        host.update_capabilities({'foo': 'bar'}, {'host': 'fakehost'})
+        self.assertEqual(generation, host.generation)
+        self.assertEqual(capabilities_generation,
+                         host.capabilities_generation)
+
+        host.update_capabilities({'foo': 'baz'})
+        self.assertNotEqual(generation, host.generation)
+        self.assertNotEqual(capabilities_generation,
+                            host.capabilities_generation)
+        generation = host.generation
+        capabilities_generation = host.capabilities_generation
+
+        # Resource changes leave the capabilities generation alone
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=0, vcpus=0)
+        host.consume_from_instance(instance)
+        self.assertNotEqual(generation, host.generation)
+        generation = host.generation
+
+        compute = dict(memory_mb=0, free_disk_gb=0, local_gb=0,
+                       local_gb_used=0, free_ram_mb=0, vcpus=0,
+                       vcpus_used=0, updated_at=None)
+        host.update_from_compute_node(compute)
+        self.assertNotEqual(generation, host.generation)
+        self.assertEqual(capabilities_generation,
+                         host.capabilities_generation)
+
     def test_stat_consumption_from_instance(self):
         host = host_manager.HostState("fakehost", "fakenode")
 
@@ -17,6 +17,7 @@ Tests For Scheduler weights.
 """
 
 from nova import context
+from nova.scheduler import filters
 from nova.scheduler import weights
 from nova import test
 from nova.tests import matchers
@@ -101,3 +102,15 @@ class RamWeigherTestCase(test.TestCase):
         weighed_host = self._get_weighed_host(hostinfo_list)
         self.assertEqual(weighed_host.weight, 8192 * 2)
         self.assertEqual(weighed_host.obj.host, 'host4')
+
+    def test_ram_filter_multiplier_columnar(self):
+        if filters.numpy is None:
+            self.skipTest('numpy is not installed')
+        self.flags(scheduler_columnar_filtering=True)
+        self.flags(ram_weight_multiplier=2.0)
+        hostinfo_list = self._get_all_hosts()
+
+        # so, host4 should win:
+        weighed_host = self._get_weighed_host(hostinfo_list)
+        self.assertEqual(weighed_host.weight, 8192 * 2)
+        self.assertEqual(weighed_host.obj.host, 'host4')
@@ -0,0 +1,109 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import cache_utils
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class MemorycacheClientTestCase(test.TestCase):
+    def setUp(self):
+        super(MemorycacheClientTestCase, self).setUp()
+        self.useFixture(test.TimeOverride())
+        self.client = cache_utils.Client()
+
+    def _get_stats(self):
+        return self.client.get_stats()[0][1]
+
+    def test_set_and_get(self):
+        self.client.set('foo', 'bar')
+        self.assertEqual('bar', self.client.get('foo'))
+        self.assertEqual(None, self.client.get('baz'))
+        stats = self._get_stats()
+        self.assertEqual(1, stats['get_hits'])
+        self.assertEqual(1, stats['get_misses'])
+        self.assertEqual(1, stats['curr_items'])
+
+    def test_expiry(self):
+        self.client.set('short', 'a', time=10)
+        self.client.set('long', 'b', time=60)
+        self.client.set('forever', 'c')
+
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(None, self.client.get('short'))
+        self.assertEqual('b', self.client.get('long'))
+        self.assertEqual(2, self._get_stats()['curr_items'])
+
+        timeutils.advance_time_seconds(3600)
+        self.assertEqual(None, self.client.get('long'))
+        self.assertEqual('c', self.client.get('forever'))
+
+    def test_set_again_resets_expiry(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.set('foo', 'baz', time=60)
+
+        timeutils.advance_time_seconds(30)
+        self.assertEqual('baz', self.client.get('foo'))
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.client.add('foo', '1', time=10))
+        self.assertFalse(self.client.add('foo', '5'))
+        self.assertEqual(3, self.client.incr('foo', 2))
+        self.assertEqual(None, self.client.incr('bar'))
+
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(None, self.client.get('foo'))
+
+    def test_evicts_least_recently_used(self):
+        self.client = cache_utils.Client(max_items=2)
+        self.client.set('a', 1)
+        self.client.set('b', 2)
+        self.client.get('a')
+        self.client.set('c', 3)
+
+        self.assertEqual(None, self.client.get('b'))
+        self.assertEqual(1, self.client.get('a'))
+        self.assertEqual(3, self.client.get('c'))
+        stats = self._get_stats()
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(2, stats['curr_items'])
+
+    def test_evicts_after_delete_and_expiry(self):
+        self.client = cache_utils.Client(max_items=2)
+        self.client.set('a', 1)
+        self.client.set('b', 2, time=10)
+        self.client.delete('a')
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(None, self.client.get('b'))
+        self.client.set('c', 3)
+        self.client.set('d', 4)
+        self.client.set('e', 5)
+
+        self.assertEqual(None, self.client.get('c'))
+        self.assertEqual(4, self.client.get('d'))
+        self.assertEqual(5, self.client.get('e'))
+        self.assertEqual(1, self._get_stats()['evictions'])
+
+    def test_stale_timeouts_are_compacted(self):
+        for i in xrange(1000):
+            self.client.set('foo', i, time=60)
+        self.client.get('foo')
+        self.assertTrue(len(self.client._timeouts) <= 102)
+
+    def test_delete(self):
+        self.client.set('foo', 'bar', time=10)
+        self.client.delete('foo')
+        self.assertEqual(None, self.client.get('foo'))
+        timeutils.advance_time_seconds(10)
+        self.assertEqual(None, self.client.get('foo'))
@@ -24,6 +24,7 @@ import types
 import uuid as stdlib_uuid
 
 from oslo.config import cfg
+from sqlalchemy.dialects import mysql
 from sqlalchemy.dialects import sqlite
 from sqlalchemy import MetaData
 from sqlalchemy.schema import Table
@@ -32,6 +33,7 @@ from sqlalchemy.sql.expression import select
 from nova import context
 from nova import db
 from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
 from nova import exception
 from nova.openstack.common.db.sqlalchemy import session as db_session
 from nova.openstack.common import timeutils
@@ -206,6 +208,41 @@ class DbApiTestCase(DbTestCase):
                                                 {'display_name': u'test'})
         self.assertEqual(1, len(result))
 
+    def test_instance_get_active_by_window_usage(self):
+        now = timeutils.utcnow()
+        hour = datetime.timedelta(hours=1)
+        self.create_instances_with_args(launched_at=now - 3 * hour,
+                                        terminated_at=now - 2 * hour,
+                                        vcpus=1)
+        inst2 = self.create_instances_with_args(launched_at=now - 3 * hour,
+                system_metadata={'instance_type_vcpus': '2',
+                                 'image_base_image_ref': 'fake'})
+        inst3 = self.create_instances_with_args(launched_at=now - 2 * hour,
+                                                terminated_at=now, vcpus=3)
+        db.instance_destroy(self.context, inst3['uuid'])
+
+        result = db.instance_get_active_by_window_usage(self.context,
+                                                        now - hour)
+        self.assertEqual([inst2['id'], inst3['id']],
+                         [r['id'] for r in result])
+        sys_meta = result[0].pop('system_metadata')
+        self.assertEqual({'id': inst2['id'],
+                          'uuid': inst2['uuid'],
+                          'project_id': self.project_id,
+                          'launched_at': inst2['launched_at'],
+                          'terminated_at': None,
+                          'deleted': 0,
+                          'instance_type_id': None}, result[0])
+        self.assertEqual({'instance_type_vcpus': '2'},
+                         utils.metadata_to_dict(sys_meta))
+
+        result = db.instance_get_active_by_window_usage(self.context,
+                now - hour, marker=inst2['id'], limit=1)
+        self.assertEqual([inst3['id']], [r['id'] for r in result])
+        result = db.instance_get_active_by_window_usage(self.context,
+                now - hour, project_id='other')
+        self.assertEqual([], result)
+
     def test_instance_get_by_uuid(self):
         inst = self.create_instances_with_args()
         fake_meta, fake_sys = self.create_metadata_for_instance(inst['uuid'])
@@ -1219,6 +1256,30 @@ class DbApiTestCase(DbTestCase):
             self.assertTrue(keypair['name'] in expected_keypair_names)
             self.assertTrue(keypair['deleted'] in expected_deleted_ids)
 
+    def test_get_ec2_instance_ids_by_uuids(self):
+        inst1 = self.create_instances_with_args()
+        inst2 = self.create_instances_with_args()
+        self.create_instances_with_args()
+        expected = {
+            inst1['uuid']: db.get_ec2_instance_id_by_uuid(self.context,
+                                                          inst1['uuid']),
+            inst2['uuid']: db.get_ec2_instance_id_by_uuid(self.context,
+                                                          inst2['uuid'])}
+        result = db.get_ec2_instance_ids_by_uuids(
+            self.context, [inst1['uuid'], inst2['uuid'], 'fake-uuid'])
+        self.assertEqual(expected, result)
+        self.assertEqual({}, db.get_ec2_instance_ids_by_uuids(self.context,
+                                                              []))
+
+    def test_s3_image_get_ids_by_uuids(self):
+        image1 = db.s3_image_create(self.context, 'fake-image-1')
+        image2 = db.s3_image_create(self.context, 'fake-image-2')
+        db.s3_image_create(self.context, 'fake-image-3')
+        result = db.s3_image_get_ids_by_uuids(
+            self.context, ['fake-image-1', 'fake-image-2', 'fake-image-4'])
+        self.assertEqual({'fake-image-1': image1['id'],
+                          'fake-image-2': image2['id']}, result)
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate'}
@@ -1298,6 +1359,52 @@ class NotDbApiTestCase(DbTestCase):
                           self.context, {'display_name': '%test%'},
                           marker=str(stdlib_uuid.uuid4()))
 
+    def test_instance_get_all_by_filters_paginate_with_limit(self):
+        instances = [self.create_instances_with_args(metadata={'idx': i})
+                     for i in range(5)]
+        uuids = [inst['uuid'] for inst in instances]
+
+        pages = []
+        marker = None
+        while True:
+            page = db.instance_get_all_by_filters(self.context, {},
+                                                  'created_at', 'asc',
+                                                  limit=2, marker=marker)
+            if not page:
+                break
+            pages.append([inst['uuid'] for inst in page])
+            marker = page[-1]['uuid']
+            for inst in page:
+                self.assertTrue('info_cache' in inst)
+                self.assertEqual(utils.metadata_to_dict(inst['metadata']),
+                                 {'idx': str(uuids.index(inst['uuid']))})
+
+        self.assertEqual(pages, [uuids[0:2], uuids[2:4], uuids[4:]])
+
+        result = db.instance_get_all_by_filters(self.context, {},
+                                                'created_at', 'desc',
+                                                limit=2, marker=uuids[2])
+        self.assertEqual([inst['uuid'] for inst in result],
+                         [uuids[1], uuids[0]])
+
+    def test_instance_get_all_by_filters_marker_in_other_project(self):
+        self.create_instances_with_args()
+        other_ctxt = context.RequestContext('other', 'other')
+        other = self.create_instances_with_args(context=other_ctxt)
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, {}, 'created_at', 'asc',
+                          limit=2, marker=other['uuid'])
+
+    def test_instance_get_all_by_filters_deleted_marker(self):
+        self.create_instances_with_args()
+        deleted = self.create_instances_with_args()
+        db.instance_destroy(self.context, deleted['uuid'])
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          self.context, {}, 'created_at', 'asc',
+                          limit=2, marker=deleted['uuid'])
+
 
 class AggregateDBApiTestCase(test.TestCase):
     def setUp(self):
@@ -1647,6 +1754,57 @@ class SqlAlchemyDbApiTestCase(DbTestCase):
         self.assertEqual(2, len(result))
         self.assertEqual(types.UnicodeType, type(result[0]))
 
+    def test_regex_literal(self):
+        self.assertEqual(sqlalchemy_api._regex_literal('^foo$'),
+                         ('foo', True))
+        self.assertEqual(sqlalchemy_api._regex_literal('^foo'),
+                         ('foo', False))
+        self.assertEqual(sqlalchemy_api._regex_literal(r'^foo\.bar\$$'),
+                         ('foo.bar$', True))
+        for regex in ('foo', '^', '^$', '^fo.', '^foo*', r'^foo\d',
+                      '^foo$bar', '^(foo|bar)'):
+            self.assertEqual(sqlalchemy_api._regex_literal(regex), None)
+
+    def test_prefix_filter_like(self):
+        clause = sqlalchemy_api._prefix_filter(models.Instance.host,
+                                               'ho%_!', 'mysql')
+        compiled = clause.compile(dialect=mysql.dialect())
+        self.assertIn('LIKE', str(compiled))
+        self.assertIn("ESCAPE '!'", str(compiled))
+        self.assertEqual(compiled.params.values(), ['ho!%!_!!%'])
+
+    def test_instance_get_all_by_filters_regex_literals(self):
+        self.create_instances_with_args(host='host1')
+        self.create_instances_with_args(host='host10')
+        self.create_instances_with_args(host='HOST1')
+        self.create_instances_with_args(host='ho%t1')
+
+        def hosts(regex):
+            instances = db.instance_get_all_by_filters(self.context,
+                                                       {'host': regex})
+            return sorted(inst['host'] for inst in instances)
+
+        self.assertEqual(hosts('^host1$'), ['host1'])
+        self.assertEqual(hosts('^host1'), ['host1', 'host10'])
+        self.assertEqual(hosts('^ho%'), ['ho%t1'])
+        self.assertEqual(hosts('^ho.t1$'), ['ho%t1', 'host1'])
+
+    def _query_plan(self, filters):
+        session = sqlalchemy_api.get_session()
+        query = session.query(models.Instance)
+        query = sqlalchemy_api.regex_filter(query, models.Instance, filters)
+        compiled = query.statement.compile(dialect=session.bind.dialect)
+        params = [compiled.params[key] for key in compiled.positiontup]
+        rows = session.bind.execute('EXPLAIN QUERY PLAN %s' % compiled,
+                                    *params).fetchall()
+        return ' '.join(tuple(row)[-1] for row in rows)
+
+    def test_regex_filter_literals_use_index(self):
+        index = 'instances_host_deleted_idx'
+        self.assertIn(index, self._query_plan({'host': '^host1$'}))
+        self.assertIn(index, self._query_plan({'host': '^host'}))
+        self.assertNotIn(index, self._query_plan({'host': '^host.$'}))
+
 
 class CapacityTestCase(test.TestCase):
     def setUp(self):
@@ -1710,6 +1868,26 @@ class CapacityTestCase(test.TestCase):
         self.assertEqual(2, int(stats['num_proj_12345']))
         self.assertEqual(3, int(stats['num_vm_building']))
 
+    def test_compute_node_get_all_changed_since(self):
+        item = self._create_helper('host1')
+        before = item['created_at'] - datetime.timedelta(seconds=1)
+        after = item['created_at'] + datetime.timedelta(seconds=1)
+
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, before)
+        self.assertEqual([item['id']], [n['id'] for n in nodes])
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, after)
+        self.assertEqual([], nodes)
+
+    def test_compute_node_get_all_changed_since_includes_deleted(self):
+        item = self._create_helper('host1')
+        before = item['created_at'] - datetime.timedelta(seconds=1)
+        db.compute_node_delete(self.ctxt, item['id'])
+
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, before)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['deleted'])
+        self.assertEqual([], db.compute_node_get_all(self.ctxt))
+
     def test_compute_node_update(self):
         item = self._create_helper('host1')
 
@@ -2625,6 +2803,68 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
         self.assertEqual(fixed_ip['instance_uuid'], instance_uuid)
         self.assertEqual(fixed_ip['network_id'], network['id'])
 
+    def test_fixed_ip_bulk_create_in_chunks(self):
+        self.stubs.Set(sqlalchemy_api, 'FIXED_IP_BULK_CREATE_CHUNK', 2)
+        network = db.network_create_safe(self.ctxt, {})
+        ips = ({'address': '192.168.0.%d' % i, 'network_id': network['id'],
+                'reserved': i == 0} for i in xrange(5))
+        db.fixed_ip_bulk_create(self.ctxt, ips)
+
+        fixed_ips = [fixed_ip for fixed_ip in db.fixed_ip_get_all(self.ctxt)
+                     if fixed_ip['network_id'] == network['id']]
+        self.assertEqual(['192.168.0.%d' % i for i in xrange(5)],
+                         sorted(fixed_ip['address'] for fixed_ip in fixed_ips))
+        for fixed_ip in fixed_ips:
+            self.assertEqual(fixed_ip['address'] == '192.168.0.0',
+                             fixed_ip['reserved'])
+            self.assertFalse(fixed_ip['allocated'])
+            self.assertNotEqual(None, fixed_ip['created_at'])
+
+    def test_fixed_ip_associate_pool_allocates_each_ip_once(self):
+        self.flags(fixed_ip_allocation_window=2)
+        network = db.network_create_safe(self.ctxt, {})
+        addresses = set()
+        for i in xrange(4):
+            addresses.add(self.create_fixed_ip(address='192.168.0.%d' % i,
+                                               network_id=network['id']))
+        self.create_fixed_ip(address='192.168.0.10', network_id=network['id'],
+                             reserved=True)
+
+        allocated = set()
+        for i in xrange(4):
+            instance_uuid = self._create_instance()
+            address = db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                                 instance_uuid, host='foo')
+            fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+            self.assertEqual(instance_uuid, fixed_ip['instance_uuid'])
+            self.assertEqual('foo', fixed_ip['host'])
+            allocated.add(address)
+        self.assertEqual(addresses, allocated)
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool, self.ctxt,
+                          network['id'], self._create_instance())
+
+    def test_fixed_ip_associate_pool_skips_ip_taken_concurrently(self):
+        network = db.network_create_safe(self.ctxt, {})
+        self.create_fixed_ip(address='192.168.0.1')
+        self.create_fixed_ip(address='192.168.0.2')
+        other_uuid = self._create_instance()
+
+        def fake_shuffle(candidates):
+            # Another allocator claims the first candidate in the meantime
+            candidates.sort(key=lambda candidate: candidate[1])
+            db.fixed_ip_update(self.ctxt, candidates[0][1],
+                               {'instance_uuid': other_uuid})
+
+        self.stubs.Set(sqlalchemy_api.random, 'shuffle', fake_shuffle)
+        instance_uuid = self._create_instance()
+        address = db.fixed_ip_associate_pool(self.ctxt, network['id'],
+                                             instance_uuid)
+        self.assertEqual('192.168.0.2', address)
+        fixed_ip = db.fixed_ip_get_by_address(self.ctxt, address)
+        self.assertEqual(instance_uuid, fixed_ip['instance_uuid'])
+        self.assertEqual(network['id'], fixed_ip['network_id'])
+
 
 class InstanceDestroyConstraints(test.TestCase):
 
@@ -2824,6 +3064,60 @@ class TaskLogTestCase(test.TestCase):
         self.assertEqual(result['errors'], 1)
 
 
+class InstanceUsageRollupTestCase(test.TestCase):
+    def setUp(self):
+        super(InstanceUsageRollupTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.begin = datetime.datetime(2013, 1, 1, 0, 0, 0)
+        self.end = datetime.datetime(2013, 1, 1, 2, 0, 0)
+
+    def _rollup(self, project_id, hour, instance_hours=1.0):
+        return {'project_id': project_id,
+                'period_beginning': self.begin + datetime.timedelta(
+                                                        hours=hour),
+                'instance_hours': instance_hours,
+                'vcpu_hours': 2 * instance_hours,
+                'memory_mb_hours': 512 * instance_hours,
+                'local_gb_hours': 10 * instance_hours}
+
+    def _totals(self, begin=None, end=None, project_id=None):
+        totals = db.instance_usage_rollup_get_totals(self.context,
+                                                     begin or self.begin,
+                                                     end or self.end,
+                                                     project_id)
+        return dict((t['project_id'], t) for t in totals)
+
+    def test_instance_usage_rollup_get_totals(self):
+        db.instance_usage_rollup_set(self.context, 'host1', self.begin,
+                                     self.end, [self._rollup('p1', 0),
+                                                self._rollup('p1', 1, 0.5),
+                                                self._rollup('p2', 1)])
+        db.instance_usage_rollup_set(self.context, 'host2', self.begin,
+                                     self.end, [self._rollup('p1', 0)])
+
+        totals = self._totals()
+        self.assertEqual(sorted(totals.keys()), ['p1', 'p2'])
+        self.assertEqual(totals['p1']['instance_hours'], 2.5)
+        self.assertEqual(totals['p1']['vcpu_hours'], 5.0)
+        self.assertEqual(totals['p1']['memory_mb_hours'], 1280.0)
+        self.assertEqual(totals['p1']['local_gb_hours'], 25.0)
+
+        totals = self._totals(begin=self.begin + datetime.timedelta(hours=1))
+        self.assertEqual(totals['p1']['instance_hours'], 0.5)
+        self.assertEqual(self._totals(project_id='p2').keys(), ['p2'])
+
+    def test_instance_usage_rollup_set_replaces_period(self):
+        db.instance_usage_rollup_set(self.context, 'host1', self.begin,
+                                     self.end, [self._rollup('p1', 0),
+                                                self._rollup('p2', 1)])
+        db.instance_usage_rollup_set(self.context, 'host1', self.begin,
+                                     self.end, [self._rollup('p1', 0, 0.5)])
+
+        totals = self._totals()
+        self.assertEqual(totals.keys(), ['p1'])
+        self.assertEqual(totals['p1']['instance_hours'], 0.5)
+
+
 class BlockDeviceMappingTestCase(test.TestCase):
     def setUp(self):
         super(BlockDeviceMappingTestCase, self).setUp()
@@ -2937,6 +3231,21 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instances(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+        self._create_bdm({'instance_uuid': uuid1, 'device_name': 'first'})
+        self._create_bdm({'instance_uuid': uuid2, 'device_name': 'second'})
+        self._create_bdm({'instance_uuid': uuid3, 'device_name': 'third'})
+
+        bdms = db.block_device_mapping_get_all_by_instances(self.ctxt,
+                                                            [uuid1, uuid2])
+        self.assertEqual(['first', 'second'],
+                         sorted(bdm['device_name'] for bdm in bdms))
+        self.assertEqual([],
+                db.block_device_mapping_get_all_by_instances(self.ctxt, []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -27,6 +27,7 @@ from oslo.config import cfg
 
 from nova.compute import vm_states
 from nova import conductor
+from nova import context
 from nova import db
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -277,6 +278,102 @@ class ImageCacheManagerTestCase(test.TestCase):
         self.assertEquals(inuse_images, [found])
         self.assertEquals(len(image_cache_manager.unexplained_images), 0)
 
+    def test_list_backing_images_index(self):
+        backing_file = 'e97222e91fc4241f49a7f520d1dcf446751129b3_sm'
+        lookups = []
+
+        def fake_get_disk_backing_file(path):
+            lookups.append(path)
+            return backing_file
+
+        self.stubs.Set(virtutils, 'get_disk_backing_file',
+                       fake_get_disk_backing_file)
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(lock_path=tmpdir)
+            for ent in ('instance-00000001', 'instance-00000002'):
+                os.mkdir(os.path.join(tmpdir, ent))
+                open(os.path.join(tmpdir, ent, 'disk'), 'w').close()
+            found = os.path.join(tmpdir, CONF.base_dir_name, backing_file)
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = self.stock_instance_names
+
+            # The first pass inspects every disk, later ones use the index
+            for i in range(2):
+                self.assertEquals(image_cache_manager._list_backing_images(),
+                                  [found])
+                self.assertEquals(len(lookups), 2)
+
+            # Disks which are recreated are inspected again
+            imagecache.forget_backing_file(
+                os.path.join(tmpdir, 'instance-00000001'))
+            image_cache_manager._list_backing_images()
+            self.assertEquals(lookups[-1],
+                              os.path.join(tmpdir, 'instance-00000001',
+                                           'disk'))
+            self.assertEquals(len(lookups), 3)
+
+            # Instances which are gone are dropped from the index
+            os.remove(os.path.join(tmpdir, 'instance-00000002', 'disk'))
+            image_cache_manager._list_backing_images()
+            with open(os.path.join(tmpdir, 'backing_files')) as f:
+                index = json.loads(f.read())
+            self.assertEquals(index.keys(), ['instance-00000001'])
+            self.assertEquals(index['instance-00000001']['backing_file'],
+                              backing_file)
+
+    def test_list_backing_images_index_concurrent_forget(self):
+        backing_file = 'e97222e91fc4241f49a7f520d1dcf446751129b3_sm'
+        forget = []
+
+        def fake_get_disk_backing_file(path):
+            # Another instance disk is replaced while this pass runs
+            for instance_dir in forget:
+                imagecache.forget_backing_file(instance_dir)
+            return backing_file
+
+        self.stubs.Set(virtutils, 'get_disk_backing_file',
+                       fake_get_disk_backing_file)
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(lock_path=tmpdir)
+            for ent in ('instance-00000001', 'instance-00000002'):
+                os.mkdir(os.path.join(tmpdir, ent))
+                open(os.path.join(tmpdir, ent, 'disk'), 'w').close()
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            image_cache_manager.instance_names = self.stock_instance_names
+            image_cache_manager._list_backing_images()
+
+            imagecache.forget_backing_file(
+                os.path.join(tmpdir, 'instance-00000002'))
+            forget.append(os.path.join(tmpdir, 'instance-00000001'))
+            image_cache_manager._list_backing_images()
+
+            with open(os.path.join(tmpdir, 'backing_files')) as f:
+                index = json.loads(f.read())
+            self.assertEquals(index.keys(), ['instance-00000002'])
+
+    def test_backing_file_index_lock_on_instances_path(self):
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=os.path.join(tmpdir, 'instances'))
+            self.flags(lock_path=os.path.join(tmpdir, 'host-locks'))
+            os.mkdir(CONF.instances_path)
+
+            imagecache._update_backing_file_index(
+                {}, {'instance-00000001': {'backing_file': 'base'}}, [])
+
+            # Hosts sharing the instances path must share the lock too
+            self.assertTrue(os.path.exists(
+                os.path.join(CONF.instances_path, 'locks',
+                             'nova-backing-file-index')))
+            self.assertFalse(os.path.exists(CONF.lock_path))
+            self.assertEquals(sorted(os.listdir(CONF.instances_path)),
+                              ['backing_files', 'locks'])
+
     def test_find_base_file_nothing(self):
         self.stubs.Set(os.path, 'exists', lambda x: False)
 
@@ -508,6 +605,74 @@ class ImageCacheManagerTestCase(test.TestCase):
             # side effect of creating the checksum
             self.assertTrue(os.path.exists(info_fname))
 
+    def test_verify_checksum_resumed_across_passes(self):
+        self.flags(checksum_base_images=True)
+        self.flags(checksum_max_bytes_per_pass=32)
+        self.stubs.Set(imagecache, 'CHECKSUM_CHUNK_SIZE', 16)
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(image_info_filename_pattern=('$instances_path/'
+                                                    '%(image)s.info'))
+            fname, info_fname, testdata = self._make_checksum(tmpdir)
+
+            # Checksum is valid, but too old to be trusted
+            with open(info_fname, 'w') as f:
+                f.write('{"sha1": "%s", "sha1-timestamp": 1}\n'
+                        % hashlib.sha1(testdata).hexdigest())
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            results = []
+            for i in range(3):
+                results.append(
+                    image_cache_manager._verify_checksum('aaa', fname))
+            self.assertEquals(results, [None, None, True])
+            self.assertEquals(image_cache_manager.partial_checksums, {})
+
+    def test_verify_checksum_restarted_if_changed(self):
+        self.flags(checksum_base_images=True)
+        self.flags(checksum_max_bytes_per_pass=32)
+        self.stubs.Set(imagecache, 'CHECKSUM_CHUNK_SIZE', 16)
+
+        with utils.tempdir() as tmpdir:
+            self.flags(instances_path=tmpdir)
+            self.flags(image_info_filename_pattern=('$instances_path/'
+                                                    '%(image)s.info'))
+            fname, info_fname, testdata = self._make_checksum(tmpdir)
+
+            image_cache_manager = imagecache.ImageCacheManager()
+            self.assertEquals(
+                image_cache_manager._verify_checksum('aaa', fname), None)
+            self.assertFalse(os.path.exists(info_fname))
+
+            # The image is replaced while it is partially hashed
+            os.remove(fname)
+            with open(fname, 'w') as f:
+                f.write('x' * 40)
+
+            for i in range(2):
+                image_cache_manager._verify_checksum('aaa', fname)
+            self.assertEquals(imagecache.read_stored_checksum(
+                                  fname, timestamped=False),
+                              hashlib.sha1('x' * 40).hexdigest())
+
+    def test_image_checksum_rate_limited(self):
+        self.flags(checksum_max_bytes_per_second=1024)
+        self.stubs.Set(imagecache, 'CHECKSUM_CHUNK_SIZE', 512)
+        delays = []
+        self.stubs.Set(time, 'sleep', lambda delay: delays.append(delay))
+
+        with utils.tempdir() as tmpdir:
+            fname = os.path.join(tmpdir, 'aaa')
+            with open(fname, 'w') as f:
+                f.write('x' * 2048)
+
+            checksum = imagecache.ImageChecksum(fname).update()
+
+        self.assertEquals(checksum, hashlib.sha1('x' * 2048).hexdigest())
+        self.assertEquals(len(delays), 4)
+        self.assertTrue(0 < delays[-1] <= 2)
+
     @contextlib.contextmanager
     def _make_base_file(self, checksum=True):
         """Make a base file for testing."""
@@ -945,8 +1110,9 @@ class ImageCacheManagerTestCase(test.TestCase):
     def test_compute_manager(self):
         was = {'called': False}
 
-        def fake_get_all(context, *args, **kwargs):
+        def fake_get_all(context, host, *args, **kwargs):
             was['called'] = True
+            was['host'] = host
             return [{'image_ref': '1',
                      'host': CONF.host,
                      'name': 'instance-1',
@@ -963,9 +1129,11 @@ class ImageCacheManagerTestCase(test.TestCase):
         with utils.tempdir() as tmpdir:
             self.flags(instances_path=tmpdir)
 
-            self.stubs.Set(db, 'instance_get_all', fake_get_all)
+            self.stubs.Set(db, 'instance_get_all_by_host', fake_get_all)
             compute = importutils.import_object(CONF.compute_manager)
             self.flags(use_local=True, group='conductor')
             compute.conductor_api = conductor.API()
-            compute._run_image_cache_manager_pass(None)
+            compute._run_image_cache_manager_pass(
+                context.get_admin_context())
             self.assertTrue(was['called'])
+            self.assertEqual(was['host'], CONF.host)
@@ -253,3 +253,50 @@ class IptablesManagerTestCase(test.TestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+    def test_top_rule_keeps_counts(self):
+        current_lines = list(self.sample_filter)
+        current_lines[12] = '[12:345] -A FORWARD -j nova-filter-top'
+        new_lines = self.manager._modify_rules(current_lines,
+                                               self.manager.ipv4['filter'],
+                                               'filter')
+        self.assertTrue('[12:345] -A FORWARD -j nova-filter-top' in new_lines)
+        self.assertFalse('[0:0] -A FORWARD -j nova-filter-top' in new_lines)
+
+    def _apply(self, saved_lines):
+        restored = []
+
+        def fake_execute(*cmd, **kwargs):
+            if cmd[0].endswith('-save'):
+                return '\n'.join(saved_lines), ''
+            restored.append(kwargs['process_input'].split('\n'))
+            return '', ''
+
+        self.manager.execute = fake_execute
+        self.manager.apply()
+        return restored
+
+    def test_apply_changed_tables_only(self):
+        self.flags(iptables_apply_changed_tables_only=True, use_ipv6=False)
+        saved_lines = self.sample_filter + self.sample_nat
+        restored = self._apply(saved_lines)
+        self.assertEqual(len(restored), 1)
+        self.assertTrue('*mangle' in restored[0])
+        self.assertFalse('*filter' in restored[0])
+        self.assertFalse('*nat' in restored[0])
+
+        self.manager.ipv4['filter'].add_rule('FORWARD', '-s 1.2.3.4/5 -j DROP')
+        restored = self._apply(saved_lines)
+        self.assertTrue('*filter' in restored[0])
+        self.assertTrue('[0:0] -A %s-FORWARD -s 1.2.3.4/5 -j DROP' %
+                        self.binary_name in restored[0])
+        self.assertFalse('*nat' in restored[0])
+
+    def test_apply_changed_tables_only_skips_restore(self):
+        self.flags(use_ipv6=False)
+        restored = self._apply(self.sample_filter + self.sample_nat)
+        self.assertEqual(len(restored), 1)
+        self.assertTrue('*nat' in restored[0])
+
+        self.flags(iptables_apply_changed_tables_only=True)
+        self.assertEqual(self._apply(restored[0]), [])
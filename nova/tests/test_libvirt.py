@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import __builtin__
 import copy
 import errno
 import eventlet
@@ -24,6 +25,8 @@ import mox
 import os
 import re
 import shutil
+import StringIO
+import sys
 import tempfile
 
 from lxml import etree
@@ -277,6 +280,11 @@ class FakeConfigGuest(object):
         self.driver_cache = None
 
 
+class FakeStat(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
 class LibvirtConnTestCase(test.TestCase):
 
     def setUp(self):
@@ -2459,6 +2467,16 @@ class LibvirtConnTestCase(test.TestCase):
 
         db.instance_destroy(self.context, instance_ref['uuid'])
 
+    def _stub_disk_stats(self, sizes, mtime=1000):
+        real_stat = os.stat
+
+        def fake_stat(path):
+            if path not in sizes:
+                return real_stat(path)
+            return FakeStat(st_size=sizes[path], st_ino=hash(path),
+                            st_mtime=mtime)
+        self.stubs.Set(os, 'stat', fake_stat)
+
     def test_get_instance_disk_info_works_correctly(self):
         # Test data
         instance_ref = db.instance_create(self.context, self.test_instance)
@@ -2487,9 +2505,8 @@ class LibvirtConnTestCase(test.TestCase):
         fake_libvirt_utils.disk_sizes['/test/disk.local'] = 20 * GB
         fake_libvirt_utils.disk_backing_files['/test/disk.local'] = 'file'
 
-        self.mox.StubOutWithMock(os.path, "getsize")
-        os.path.getsize('/test/disk').AndReturn((10737418240))
-        os.path.getsize('/test/disk.local').AndReturn((3328599655))
+        self._stub_disk_stats({'/test/disk': 10737418240,
+                               '/test/disk.local': 3328599655})
 
         ret = ("image: /test/disk\n"
                "file format: raw\n"
@@ -2522,6 +2539,46 @@ class LibvirtConnTestCase(test.TestCase):
 
         db.instance_destroy(self.context, instance_ref['uuid'])
 
+    def test_get_instance_disk_info_caches_unchanged_disks(self):
+        dummyxml = ("<domain type='kvm'><name>instance-0000000a</name>"
+                    "<devices>"
+                    "<disk type='file'><driver name='qemu' type='qcow2'/>"
+                    "<source file='/test/disk'/>"
+                    "<target dev='vda' bus='virtio'/></disk>"
+                    "</devices></domain>")
+        fake_libvirt_utils.disk_backing_files['/test/disk'] = 'file'
+
+        ret = ("image: /test/disk\n"
+               "file format: qcow2\n"
+               "virtual size: 20G (21474836480 bytes)\n"
+               "disk size: 3.1G\n")
+
+        self.mox.StubOutWithMock(os.path, "exists")
+        os.path.exists('/test/disk').MultipleTimes().AndReturn(True)
+
+        self.mox.StubOutWithMock(utils, "execute")
+        utils.execute('env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
+                      '/test/disk').AndReturn((ret, ''))
+        utils.execute('env', 'LC_ALL=C', 'LANG=C', 'qemu-img', 'info',
+                      '/test/disk').AndReturn((ret, ''))
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+
+        self._stub_disk_stats({'/test/disk': 3328599655})
+        for i in range(2):
+            info = jsonutils.loads(
+                conn.get_instance_disk_info('instance-0000000a', dummyxml))
+            self.assertEquals(info[0]['virt_disk_size'], 21474836480)
+            self.assertEquals(info[0]['disk_size'], 3328599655)
+
+        # Writing to the disk changes its mtime, so qemu-img runs again.
+        self._stub_disk_stats({'/test/disk': 4328599655}, mtime=2000)
+        info = jsonutils.loads(
+            conn.get_instance_disk_info('instance-0000000a', dummyxml))
+        self.assertEquals(info[0]['disk_size'], 4328599655)
+        self.assertEquals(info[0]['over_committed_disk_size'], 17146236825)
+
     def test_spawn_with_network_info(self):
         # Preparing mocks
         def fake_none(*args, **kwargs):
@@ -3137,6 +3194,29 @@ class LibvirtConnTestCase(test.TestCase):
         result = conn.get_disk_over_committed_size_total()
         self.assertEqual(result, 10653532160)
 
+    def test_disk_over_committed_size_total_prunes_cache(self):
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        self.stubs.Set(conn, 'list_instances', lambda: ['fake1', 'fake2'])
+
+        def get_info(instance_name):
+            if instance_name == 'fake2':
+                raise exception.InstanceNotFound(instance_id=instance_name)
+            return jsonutils.dumps([{'type': 'qcow2',
+                                     'path': '/somepath/disk1',
+                                     'virt_disk_size': '10737418240',
+                                     'backing_file': '/somepath/disk1',
+                                     'disk_size': '83886080',
+                                     'over_committed_disk_size':
+                                         '10653532160'}])
+        self.stubs.Set(conn, 'get_instance_disk_info', get_info)
+
+        conn._disk_info_cache['/somepath/disk1'] = ('key', (1, 'base'))
+        conn._disk_info_cache['/somepath/gone'] = ('key', (1, 'base'))
+
+        result = conn.get_disk_over_committed_size_total()
+        self.assertEqual(result, 10653532160)
+        self.assertEqual(conn._disk_info_cache.keys(), ['/somepath/disk1'])
+
     def test_cpu_info(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
@@ -3573,34 +3653,84 @@ class LibvirtConnTestCase(test.TestCase):
         self.assertEqual(actual, expect)
 
     def test_failing_vcpu_count(self):
-        """Domain can fail to return the vcpu description in case it's
-        just starting up or shutting down. Make sure None is handled
-        gracefully.
+        """Domain can disappear while its vcpu description is requested
+        in case it's just starting up or shutting down. Make sure that is
+        handled gracefully.
         """
 
         class DiagFakeDomain(object):
-            def __init__(self, vcpus):
+            def __init__(self, name, vcpus):
+                self._name = name
                 self._vcpus = vcpus
 
-            def vcpus(self):
+            def name(self):
+                return self._name
+
+            def ID(self):
+                return 1
+
+            def info(self):
                 if self._vcpus is None:
-                    return None
-                else:
-                    return ([1] * self._vcpus, [True] * self._vcpus)
+                    raise libvirt.libvirtError('no domain')
+                return [1, 2048, 2048, self._vcpus, 123456789L]
 
         driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
         conn = driver._conn
         self.mox.StubOutWithMock(driver, 'list_instance_ids')
         conn.lookupByID = self.mox.CreateMockAnything()
+        self.mox.StubOutWithMock(libvirt.libvirtError, "get_error_code")
 
         driver.list_instance_ids().AndReturn([1, 2])
-        conn.lookupByID(1).AndReturn(DiagFakeDomain(None))
-        conn.lookupByID(2).AndReturn(DiagFakeDomain(5))
+        conn.lookupByID(1).AndReturn(DiagFakeDomain('fake1', None))
+        conn.lookupByID(2).AndReturn(DiagFakeDomain('fake2', 5))
+        libvirt.libvirtError.get_error_code().AndReturn(
+            libvirt.VIR_ERR_NO_DOMAIN)
 
         self.mox.ReplayAll()
 
         self.assertEqual(5, driver.get_vcpu_used())
 
+    def test_domain_stats_shared_between_callers(self):
+        self.flags(libvirt_type='xen')
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        conn = driver._conn
+        dom0 = self.mox.CreateMockAnything()
+        dom1 = self.mox.CreateMockAnything()
+        conn.listAllDomains = self.mox.CreateMockAnything()
+
+        conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE).AndReturn(
+            [dom0, dom1])
+        dom0.info().AndReturn([1, 8388608, 4194304, 4, 123456789L])
+        dom0.ID().AndReturn(0)
+        dom0.name().AndReturn('Domain-0')
+        dom1.info().AndReturn([1, 2097152, 1048576, 2, 123456789L])
+        dom1.ID().AndReturn(1)
+        dom1.name().AndReturn('instance-00000001')
+
+        self.stubs.Set(sys, 'platform', 'linux2')
+        meminfo = ('MemTotal: 16777216 kB\nMemFree: 1048576 kB\n'
+                   'Buffers: 1048576 kB\nCached: 1048576 kB\n')
+        self.mox.StubOutWithMock(__builtin__, 'open')
+        __builtin__.open('/proc/meminfo').AndReturn(
+            StringIO.StringIO(meminfo))
+
+        self.mox.ReplayAll()
+
+        self.assertEqual(6, driver.get_vcpu_used())
+        self.assertEqual(2048, driver.get_memory_mb_used())
+
+    def test_domain_stats_refreshed_when_stale(self):
+        self.flags(libvirt_domain_stats_max_age=0)
+        driver = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
+        self.mox.StubOutWithMock(driver, '_list_active_domains')
+        driver._list_active_domains().AndReturn([])
+        driver._list_active_domains().AndReturn([])
+
+        self.mox.ReplayAll()
+
+        self.assertEqual(0, driver.get_vcpu_used())
+        self.assertEqual(0, driver.get_vcpu_used())
+
     def test_get_instance_capabilities(self):
         conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), True)
 
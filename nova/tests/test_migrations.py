@@ -1269,6 +1269,34 @@ class TestNovaMigrations(BaseMigrationTestCase, CommonTestsMixIn):
         self.assertFalse('user_id' in rows[0])
         self.assertEqual(rows[0]['instance_id'], None)
 
+    def _check_176(self, engine, data):
+        rollups = get_table(engine, 'instance_usage_rollups')
+        rollups.insert().execute({'project_id': 'fake_project',
+                                  'host': 'fake_host',
+                                  'period_beginning': datetime.datetime.now(),
+                                  'instance_hours': 1.5})
+        rows = rollups.select().execute().fetchall()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['instance_hours'], 1.5)
+
+    def _post_downgrade_176(self, engine):
+        self.assertRaises(sqlalchemy.exc.NoSuchTableError, get_table,
+                          engine, 'instance_usage_rollups')
+
+    def _check_177(self, engine, data):
+        instances = get_table(engine, 'instances')
+        index_names = [index.name for index in instances.indexes]
+        self.assertIn('instances_project_id_deleted_created_at_idx',
+                      index_names)
+        self.assertIn('instances_deleted_created_at_idx', index_names)
+
+    def _post_downgrade_177(self, engine):
+        instances = get_table(engine, 'instances')
+        index_names = [index.name for index in instances.indexes]
+        self.assertNotIn('instances_project_id_deleted_created_at_idx',
+                         index_names)
+        self.assertNotIn('instances_deleted_created_at_idx', index_names)
+
 
 class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
@@ -231,6 +231,48 @@ class QuotaIntegrationTestCase(test.TestCase):
 
         assertInstancesReserved(0)
 
+    def test_reservation_expire_many(self):
+        self.useFixture(test.TimeOverride())
+
+        def assertReserved(instances, cores):
+            result = quota.QUOTAS.get_project_quotas(self.context,
+                                                     self.context.project_id)
+            self.assertEqual(instances, result['instances']['reserved'])
+            self.assertEqual(cores, result['cores']['reserved'])
+
+        quota.QUOTAS.reserve(self.context, expire=60, instances=1, cores=1)
+        quota.QUOTAS.reserve(self.context, expire=60, cores=2)
+        quota.QUOTAS.reserve(self.context, expire=600, instances=1, cores=1)
+        quota.QUOTAS.reserve(self.context, expire=60, cores=-1)
+        assertReserved(2, 4)
+
+        timeutils.advance_time_seconds(80)
+        quota.QUOTAS.expire(self.context)
+        assertReserved(1, 1)
+
+    def test_refresh_usages(self):
+        other_context = context.RequestContext('other', 'other_project')
+        for ctxt in (self.context, other_context):
+            reservations = quota.QUOTAS.reserve(ctxt, instances=1, cores=1)
+            quota.QUOTAS.commit(ctxt, reservations)
+        # The usages of the first project are now too low and those of
+        # the other one, which has no instances, too high
+        for i in xrange(2):
+            db.instance_create(self.context,
+                               {'project_id': self.context.project_id,
+                                'vcpus': 2, 'memory_mb': 512})
+
+        quota.QUOTAS.refresh_usages(self.context)
+
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   self.context.project_id)
+        self.assertEqual(2, usages['instances']['in_use'])
+        self.assertEqual(4, usages['cores']['in_use'])
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   'other_project')
+        self.assertEqual(0, usages['instances']['in_use'])
+        self.assertEqual(0, usages['cores']['in_use'])
+
 
 class FakeContext(object):
     def __init__(self, project_id, quota_class):
@@ -304,6 +346,9 @@ class FakeDriver(object):
     def destroy_all_by_project(self, context, project_id):
         self.called.append(('destroy_all_by_project', context, project_id))
 
+    def refresh_usages(self, context, resources):
+        self.called.append(('refresh_usages', context, resources))
+
     def expire(self, context):
         self.called.append(('expire', context))
 
@@ -703,6 +748,16 @@ class QuotaEngineTestCase(test.TestCase):
                 ('expire', context),
                 ])
 
+    def test_refresh_usages(self):
+        context = FakeContext(None, None)
+        driver = FakeDriver()
+        quota_obj = self._make_quota_obj(driver)
+        quota_obj.refresh_usages(context)
+
+        self.assertEqual(driver.called, [
+                ('refresh_usages', context, quota_obj._resources),
+                ])
+
     def test_resources(self):
         quota_obj = self._make_quota_obj(None)
 
@@ -1934,6 +1989,82 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                 ])
 
 
+class ConditionalUpdateQuotaDriverTestCase(test.TestCase):
+    def setUp(self):
+        super(ConditionalUpdateQuotaDriverTestCase, self).setUp()
+
+        self.flags(quota_instances=2,
+                   quota_cores=4,
+                   reservation_expire=86400,
+                   until_refresh=0,
+                   max_age=0,
+                   )
+
+        self.driver = quota.ConditionalUpdateQuotaDriver()
+        self.context = context.RequestContext('fake_user', 'fake_project')
+        self.resources = quota.QUOTAS._resources
+
+    def _reserve(self, **deltas):
+        return self.driver.reserve(self.context, self.resources, deltas)
+
+    def _get_usages(self):
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   'fake_project')
+        return dict((resource, (usages[resource]['in_use'],
+                                usages[resource]['reserved']))
+                    for resource in ('instances', 'cores'))
+
+    def test_reserve_and_commit(self):
+        reservations = self._reserve(instances=1, cores=2)
+        self.assertEqual(2, len(reservations))
+        self.assertEqual(dict(instances=(0, 1), cores=(0, 2)),
+                         self._get_usages())
+
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(dict(instances=(1, 0), cores=(2, 0)),
+                         self._get_usages())
+
+        # Committing again must not count the reservations twice
+        self.driver.commit(self.context, reservations)
+        self.assertEqual(dict(instances=(1, 0), cores=(2, 0)),
+                         self._get_usages())
+
+    def test_reserve_and_rollback(self):
+        reservations = self._reserve(instances=1, cores=2)
+        self.driver.rollback(self.context, reservations)
+        self.assertEqual(dict(instances=(0, 0), cores=(0, 0)),
+                         self._get_usages())
+
+    def test_reserve_over_quota(self):
+        self._reserve(instances=1, cores=2)
+        self._reserve(instances=1, cores=2)
+        self.assertEqual(dict(instances=(0, 2), cores=(0, 4)),
+                         self._get_usages())
+
+        self.assertRaises(exception.OverQuota,
+                          self._reserve, instances=1, cores=1)
+        self.assertEqual(dict(instances=(0, 2), cores=(0, 4)),
+                         self._get_usages())
+
+    def test_reserve_over_quota_rolls_back_other_resources(self):
+        self._reserve(cores=4)
+        self.assertRaises(exception.OverQuota,
+                          self._reserve, instances=1, cores=1)
+        self.assertEqual(dict(instances=(0, 0), cores=(0, 4)),
+                         self._get_usages())
+
+    def test_reserve_refreshes_desynced_usage(self):
+        reservations = self._reserve(instances=1, cores=2)
+        self.driver.commit(self.context, reservations)
+        self.driver.usage_reset(self.context, ['instances'])
+
+        # The usages are recounted from the instances, of which there
+        # are none
+        self._reserve(instances=1)
+        self.assertEqual(dict(instances=(0, 1), cores=(0, 0)),
+                         self._get_usages())
+
+
 class NoopQuotaDriverTestCase(test.TestCase):
     def setUp(self):
         super(NoopQuotaDriverTestCase, self).setUp()
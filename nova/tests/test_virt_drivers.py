@@ -21,6 +21,7 @@ import sys
 import traceback
 
 from nova.compute import manager
+from nova.compute import power_state
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -416,6 +417,13 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
         self.assertIn('num_cpu', info)
         self.assertIn('cpu_time', info)
 
+    @catch_notimplementederror
+    def test_get_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        power_states = self.connection.get_power_states()
+        self.assertEqual(power_state.RUNNING,
+                         power_states[instance_ref['name']])
+
     @catch_notimplementederror
     def test_get_info_for_unknown_instance(self):
         self.assertRaises(exception.NotFound,
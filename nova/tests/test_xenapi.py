@@ -387,6 +387,19 @@ class XenAPIVMTestCase(stubs.XenAPITestBase):
         self.assertEqual(len(uuids), len(instance_uuids))
         self.assertEqual(set(uuids), set(instance_uuids))
 
+    def test_get_power_states(self):
+        instance = self._create_instance()
+        self.assertEqual({instance['name']: power_state.RUNNING},
+                         self.conn.get_power_states())
+
+    def test_get_power_states_skips_other_pool_hosts(self):
+        instance = self._create_instance()
+        other_host = xenapi_fake.create_host('other-host')
+        xenapi_fake.create_vm('instance-other', 'Running',
+                              resident_on=other_host)
+        self.assertEqual({instance['name']: power_state.RUNNING},
+                         self.conn.get_power_states())
+
     def test_get_rrd_server(self):
         self.flags(xenapi_connection_url='myscheme://myaddress/')
         server_info = vm_utils._get_rrd_server()
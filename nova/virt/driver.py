@@ -154,6 +154,15 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self):
+        """Return the power state of all instances known to the hypervisor.
+
+        Returns a dict mapping instance names (not IDs!) to one of the
+        power_state codes. Instances missing from the dict are not known
+        to the hypervisor.
+        """
+        raise NotImplementedError()
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
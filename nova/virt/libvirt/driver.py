@@ -210,6 +210,15 @@ libvirt_opts = [
                  default=[],
                  help='Specific cachemodes to use for different disk types '
                       'e.g: ["file=directsync","block=none"]'),
+    cfg.IntOpt('libvirt_disk_info_workers',
+               default=8,
+               help='Number of instances whose disks are inspected '
+                    'concurrently when computing the disk over commit'),
+    cfg.IntOpt('libvirt_domain_stats_max_age',
+               default=5,
+               help='Number of seconds a snapshot of the state, memory and '
+                    'vcpus of all domains is reused for before libvirt is '
+                    'queried again. Set to 0 to always query libvirt'),
     ]
 
 CONF = cfg.CONF
@@ -300,6 +309,9 @@ class LibvirtDriver(driver.ComputeDriver):
 
         self._host_state = None
         self._initiator = None
+        self._disk_info_cache = {}
+        self._domain_stats = None
+        self._domain_stats_time = 0
         self._fc_wwnns = None
         self._fc_wwpns = None
         self._wrapped_conn = None
@@ -849,6 +861,7 @@ class LibvirtDriver(driver.ComputeDriver):
             target = libvirt_utils.get_instance_path(instance)
             LOG.info(_('Deleting instance files %(target)s') % locals(),
                      instance=instance)
+            imagecache.forget_backing_file(target)
             if os.path.exists(target):
                 # If we fail to get rid of the directory
                 # tree, this shouldn't block deletion of
@@ -1755,6 +1768,7 @@ class LibvirtDriver(driver.ComputeDriver):
 
         # ensure directories exist and are writable
         fileutils.ensure_tree(basepath(suffix=''))
+        imagecache.forget_backing_file(basepath(suffix=''))
 
         LOG.info(_('Creating image'), instance=instance)
 
@@ -2371,6 +2385,10 @@ class LibvirtDriver(driver.ComputeDriver):
 
         """
         virt_dom = self._lookup_by_name(instance['name'])
+        return self._get_domain_info(virt_dom)
+
+    @staticmethod
+    def _get_domain_info(virt_dom):
         (state, max_mem, mem, num_cpu, cpu_time) = virt_dom.info()
         return {'state': LIBVIRT_POWER_STATE[state],
                 'max_mem': max_mem,
@@ -2379,6 +2397,64 @@ class LibvirtDriver(driver.ComputeDriver):
                 'cpu_time': cpu_time,
                 'id': virt_dom.ID()}
 
+    def _list_active_domains(self):
+        """Return the domain objects of all running domains."""
+        list_all = getattr(self._conn, 'listAllDomains', None)
+        if list_all is not None:
+            return list_all(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)
+
+        # NOTE: libvirt older than 0.9.13 needs a lookup per domain id
+        dom_ids = self.list_instance_ids()
+        domains = []
+        for dom_id in dom_ids:
+            try:
+                domains.append(self._conn.lookupByID(dom_id))
+            except libvirt.libvirtError as err:
+                if err.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+                LOG.debug(_("List of domains returned by libVirt: %s")
+                          % dom_ids)
+                LOG.warn(_("libVirt can't find a domain with id: %s")
+                         % dom_id)
+        return domains
+
+    def _get_domain_stats(self, refresh=False):
+        """Return the state, memory and vcpus of all running domains.
+
+        Every domain is queried once and the result, keyed by domain name,
+        is shared by all callers for libvirt_domain_stats_max_age seconds,
+        so a single periodic task run only walks the domains once. If
+        'refresh' is True, libvirt is queried regardless.
+        """
+        now = time.time()
+        if (not refresh and self._domain_stats is not None and
+            now - self._domain_stats_time < CONF.libvirt_domain_stats_max_age):
+            return self._domain_stats
+
+        stats = {}
+        for virt_dom in self._list_active_domains():
+            try:
+                stats[virt_dom.name()] = self._get_domain_info(virt_dom)
+            except libvirt.libvirtError as err:
+                # The domain is just starting up or shutting down
+                if err.get_error_code() != libvirt.VIR_ERR_NO_DOMAIN:
+                    raise
+            # NOTE(gtt116): give change to do other task.
+            greenthread.sleep(0)
+
+        self._domain_stats = stats
+        self._domain_stats_time = now
+        return stats
+
+    def get_power_states(self):
+        """Return the power state of all domains, keyed by name."""
+        power_states = dict((name, info['state']) for name, info
+                            in self._get_domain_stats(refresh=True).items())
+        # Defined domains which are not running are shut off
+        for name in self._conn.listDefinedDomains():
+            power_states.setdefault(name, power_state.SHUTDOWN)
+        return power_states
+
     def _create_domain(self, xml=None, domain=None,
                        instance=None, launch_flags=0):
         """Create a domain.
@@ -2571,26 +2647,8 @@ class LibvirtDriver(driver.ComputeDriver):
         if CONF.libvirt_type == 'lxc':
             return total + 1
 
-        dom_ids = self.list_instance_ids()
-        for dom_id in dom_ids:
-            try:
-                dom = self._conn.lookupByID(dom_id)
-                vcpus = dom.vcpus()
-                if vcpus is None:
-                    LOG.debug(_("couldn't obtain the vpu count from domain id:"
-                                " %s") % dom_id)
-                else:
-                    total += len(vcpus[1])
-            except libvirt.libvirtError as err:
-                if err.get_error_code() == libvirt.VIR_ERR_NO_DOMAIN:
-                    LOG.debug(_("List of domains returned by libVirt: %s")
-                              % dom_ids)
-                    LOG.warn(_("libVirt can't find a domain with id: %s")
-                             % dom_id)
-                    continue
-                raise
-            # NOTE(gtt116): give change to do other task.
-            greenthread.sleep(0)
+        for info in self._get_domain_stats().itervalues():
+            total += info['num_cpu']
         return total
 
     def get_memory_mb_used(self):
@@ -2609,10 +2667,10 @@ class LibvirtDriver(driver.ComputeDriver):
         idx3 = m.index('Cached:')
         if CONF.libvirt_type == 'xen':
             used = 0
-            for domain_id in self.list_instance_ids():
+            for info in self._get_domain_stats().itervalues():
                 # skip dom0
-                dom_mem = int(self._conn.lookupByID(domain_id).info()[2])
-                if domain_id != 0:
+                dom_mem = int(info['mem'])
+                if info['id'] != 0:
                     used += dom_mem
                 else:
                     # the mem reported by dom0 is be greater of what
@@ -3260,6 +3318,7 @@ class LibvirtDriver(driver.ComputeDriver):
         """
         disk_info = jsonutils.loads(disk_info_json)
         instance_dir = libvirt_utils.get_instance_path(instance)
+        imagecache.forget_backing_file(instance_dir)
 
         for info in disk_info:
             base = os.path.basename(info['path'])
@@ -3372,12 +3431,13 @@ class LibvirtDriver(driver.ComputeDriver):
 
             # get the real disk size or
             # raise a localized error if image is unavailable
-            dk_size = int(os.path.getsize(path))
+            stat = os.stat(path)
+            dk_size = int(stat.st_size)
 
             disk_type = driver_nodes[cnt].get('type')
             if disk_type == "qcow2":
-                backing_file = libvirt_utils.get_disk_backing_file(path)
-                virt_size = disk.get_disk_size(path)
+                virt_size, backing_file = self._get_qcow2_disk_info(path,
+                                                                    stat)
                 over_commit_size = int(virt_size) - dk_size
             else:
                 backing_file = ""
@@ -3392,29 +3452,53 @@ class LibvirtDriver(driver.ComputeDriver):
                               'over_committed_disk_size': over_commit_size})
         return jsonutils.dumps(disk_info)
 
+    def _get_qcow2_disk_info(self, path, stat):
+        """Return the virtual size and backing file of a qcow2 disk.
+
+        qemu-img is only run when the disk has been replaced or written
+        to since it was last inspected, as seen by its inode and mtime.
+        """
+        key = (stat.st_ino, stat.st_mtime)
+        cached = self._disk_info_cache.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        backing_file = libvirt_utils.get_disk_backing_file(path)
+        virt_size = disk.get_disk_size(path)
+        self._disk_info_cache[path] = (key, (virt_size, backing_file))
+        return virt_size, backing_file
+
+    def _get_instance_disk_infos(self, i_name):
+        try:
+            return jsonutils.loads(self.get_instance_disk_info(i_name))
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                LOG.error(_("Getting disk size of %(i_name)s: %(e)s") %
+                          locals())
+            else:
+                raise
+        except exception.InstanceNotFound:
+            # Instance was deleted during the check so ignore it
+            pass
+        return []
+
     def get_disk_over_committed_size_total(self):
         """Return total over committed disk size for all instances."""
         # Disk size that all instance uses : virtual_size - disk_size
         instances_name = self.list_instances()
         disk_over_committed_size = 0
-        for i_name in instances_name:
-            try:
-                disk_infos = jsonutils.loads(
-                        self.get_instance_disk_info(i_name))
-                for info in disk_infos:
-                    disk_over_committed_size += int(
-                        info['over_committed_disk_size'])
-            except OSError as e:
-                if e.errno == errno.ENOENT:
-                    LOG.error(_("Getting disk size of %(i_name)s: %(e)s") %
-                              locals())
-                else:
-                    raise
-            except exception.InstanceNotFound:
-                # Instance was deleted during the check so ignore it
-                pass
-            # NOTE(gtt116): give change to do other task.
-            greenthread.sleep(0)
+        seen_paths = set()
+        pool = eventlet.greenpool.GreenPool(CONF.libvirt_disk_info_workers)
+        for disk_infos in pool.imap(self._get_instance_disk_infos,
+                                    instances_name):
+            for info in disk_infos:
+                seen_paths.add(info['path'])
+                disk_over_committed_size += int(
+                    info['over_committed_disk_size'])
+
+        # Forget about disks that no longer belong to any instance
+        for path in set(self._disk_info_cache) - seen_paths:
+            del self._disk_info_cache[path]
         return disk_over_committed_size
 
     def unfilter_instance(self, instance_ref, network_info):
@@ -3476,6 +3560,8 @@ class LibvirtDriver(driver.ComputeDriver):
         inst_base_resize = inst_base + "_resize"
         try:
             utils.execute('mv', inst_base, inst_base_resize)
+            imagecache.forget_backing_file(inst_base)
+            imagecache.forget_backing_file(inst_base_resize)
             if same_host:
                 dest = None
                 utils.execute('mkdir', '-p', inst_base)
@@ -3593,6 +3679,8 @@ class LibvirtDriver(driver.ComputeDriver):
             if os.path.exists(inst_base):
                 self._cleanup_failed_migration(inst_base)
             utils.execute('mv', inst_base_resize, inst_base)
+            imagecache.forget_backing_file(inst_base)
+            imagecache.forget_backing_file(inst_base_resize)
 
         disk_info = blockinfo.get_disk_info(CONF.libvirt_type,
                                             instance,
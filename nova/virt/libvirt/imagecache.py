@@ -22,12 +22,16 @@ http://wiki.openstack.org/nova-image-cache-management.
 
 """
 
+import ctypes
+import ctypes.util
+import errno
 import hashlib
 import json
 import os
 import re
 import time
 
+from eventlet import tpool
 from oslo.config import cfg
 
 from nova.compute import task_states
@@ -36,7 +40,6 @@ from nova.openstack.common import fileutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import lockutils
 from nova.openstack.common import log as logging
-from nova import utils
 from nova.virt.libvirt import utils as virtutils
 
 LOG = logging.getLogger(__name__)
@@ -74,6 +77,15 @@ imagecache_opts = [
     cfg.IntOpt('checksum_interval_seconds',
                default=3600,
                help='How frequently to checksum base images'),
+    cfg.IntOpt('checksum_max_bytes_per_second',
+               default=0,
+               help='Maximum rate in bytes per second at which base images '
+                    'are read while checksumming them. 0 means unlimited'),
+    cfg.IntOpt('checksum_max_bytes_per_pass',
+               default=0,
+               help='Maximum number of bytes of a base image checksummed '
+                    'in one image cache manager pass. Larger images are '
+                    'checksummed over several passes. 0 means unlimited'),
     ]
 
 CONF = cfg.CONF
@@ -81,6 +93,25 @@ CONF.register_opts(imagecache_opts)
 CONF.import_opt('host', 'nova.netconf')
 CONF.import_opt('instances_path', 'nova.compute.manager')
 
+CHECKSUM_CHUNK_SIZE = 4 * 1024 * 1024
+
+# From <fcntl.h> on Linux
+POSIX_FADV_DONTNEED = 4
+
+
+def _load_posix_fadvise():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        posix_fadvise = libc.posix_fadvise
+    except (OSError, AttributeError):
+        return None
+    posix_fadvise.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64,
+                              ctypes.c_int]
+    return posix_fadvise
+
+
+_posix_fadvise = _load_posix_fadvise()
+
 
 def get_cache_fname(images, key):
     """Return a filename based on the SHA1 hash of a given image ID.
@@ -234,14 +265,189 @@ def read_stored_checksum(target, timestamped=True):
 def write_stored_checksum(target):
     """Write a checksum to disk for a file in _base."""
 
-    with open(target, 'r') as img_file:
-        checksum = utils.hash_file(img_file)
+    checksum = ImageChecksum(target).update()
     write_stored_info(target, field='sha1', value=checksum)
 
 
+def _hash_chunk(img_file, checksum, offset, size):
+    """Hash the next chunk of a file and drop it from the page cache.
+
+    This runs in a native thread, both reading and hashing release the GIL.
+    """
+    data = img_file.read(size)
+    checksum.update(data)
+    if data and _posix_fadvise is not None:
+        # Base images are read once per checksum_interval_seconds, so there
+        # is no point in evicting the pages of running guests for them.
+        _posix_fadvise(img_file.fileno(), offset, len(data),
+                       POSIX_FADV_DONTNEED)
+    return len(data)
+
+
+class ImageChecksum(object):
+    """A SHA1 checksum of a file which can be computed in several steps.
+
+    The file is read in large chunks on the eventlet native thread pool,
+    at no more than checksum_max_bytes_per_second, and is kept out of the
+    page cache.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.stat = self._stat()
+        self.offset = 0
+        self.checksum = hashlib.sha1()
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_size, st.st_mtime)
+
+    def is_stale(self):
+        """Return True if the file changed since hashing started."""
+        try:
+            return self._stat() != self.stat
+        except OSError:
+            return True
+
+    def update(self, max_bytes=0):
+        """Hash up to max_bytes more of the file, or all of it if 0.
+
+        Returns the hex digest once the whole file has been hashed, None
+        otherwise.
+        """
+        max_rate = CONF.checksum_max_bytes_per_second
+        hashed = 0
+        start = time.time()
+
+        with open(self.path, 'rb') as img_file:
+            img_file.seek(self.offset)
+            while not max_bytes or hashed < max_bytes:
+                size = CHECKSUM_CHUNK_SIZE
+                if max_bytes:
+                    size = min(size, max_bytes - hashed)
+                length = tpool.execute(_hash_chunk, img_file, self.checksum,
+                                       self.offset, size)
+                if not length:
+                    return self.checksum.hexdigest()
+
+                self.offset += length
+                hashed += length
+                if max_rate:
+                    delay = float(hashed) / max_rate - (time.time() - start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+        if self.offset >= self.stat[1]:
+            return self.checksum.hexdigest()
+        return None
+
+
+def _get_backing_file_index_path():
+    return os.path.join(CONF.instances_path, 'backing_files')
+
+
+def _read_backing_file_index():
+    """Read the index of instance disk backing files.
+
+    Returns a dictionary mapping instance directory names to the inode of
+    their disk and its backing file, or an empty dictionary if there is no
+    index yet.
+    """
+    index_path = _get_backing_file_index_path()
+    try:
+        with open(index_path, 'r') as f:
+            return _read_possible_json(f.read(), index_path)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            LOG.error(_('Error reading backing file index %(filename)s: '
+                        '%(error)s'),
+                      {'filename': index_path,
+                       'error': e})
+        return {}
+
+
+def _save_backing_file_index(index):
+    # NOTE: the index is written to a temporary file first and renamed into
+    # place, so readers never see a partially written index.
+    # NOTE: the index lives on the possibly shared instances path, so the
+    # temporary file is named after the host and process writing it.
+    index_path = _get_backing_file_index_path()
+    tmp_path = '%s.%s.%d.tmp' % (index_path, CONF.host, os.getpid())
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps(index))
+        os.rename(tmp_path, index_path)
+    except (IOError, OSError) as e:
+        LOG.error(_('Failed to write backing file index %(filename)s, '
+                    'error was %(error)s'),
+                  {'filename': index_path,
+                   'error': e})
+
+
+def _backing_file_index_locked(f):
+    """Run f holding the backing file index lock.
+
+    The lock lives next to the index on the instances path, so image cache
+    managers on all hosts sharing it exclude each other.
+    """
+    lock_path = os.path.join(CONF.instances_path, 'locks')
+    return lockutils.synchronized('backing-file-index', 'nova-',
+                                  external=True, lock_path=lock_path)(f)
+
+
+def _update_backing_file_index(seen, updates, removals):
+    """Merge the results of an image cache manager pass into the index.
+
+    seen is the index as it was read at the start of the pass. The index
+    is read again under the lock and only the entries in updates and
+    removals are touched, and only if nobody else changed them since, so
+    an entry dropped by a concurrent forget_backing_file() stays dropped.
+    """
+    @_backing_file_index_locked
+    def update_index():
+        index = _read_backing_file_index()
+        changed = False
+        for ent in removals:
+            if ent in index and index[ent] == seen.get(ent):
+                del index[ent]
+                changed = True
+        for ent, entry in updates.iteritems():
+            if index.get(ent) == seen.get(ent):
+                index[ent] = entry
+                changed = True
+        if changed:
+            _save_backing_file_index(index)
+
+    update_index()
+
+
+def _remove_backing_file_index_entry(ent):
+    @_backing_file_index_locked
+    def remove_entry():
+        index = _read_backing_file_index()
+        if index.pop(ent, None) is not None:
+            _save_backing_file_index(index)
+
+    remove_entry()
+
+
+def forget_backing_file(instance_dir):
+    """Drop the backing file recorded for an instance directory.
+
+    This must be called whenever the disk of an instance is created,
+    replaced or deleted, so that the next image cache manager pass
+    inspects it again.
+    """
+    ent = os.path.basename(instance_dir)
+    # Only take the lock if there actually is something to forget
+    if ent in _read_backing_file_index():
+        _remove_backing_file_index_entry(ent)
+
+
 class ImageCacheManager(object):
     def __init__(self):
         self.lock_path = os.path.join(CONF.instances_path, 'locks')
+        self.partial_checksums = {}
         self._reset_state()
 
     def _reset_state(self):
@@ -324,16 +530,44 @@ class ImageCacheManager(object):
                 self.image_popularity.setdefault(image_ref_str, 0)
                 self.image_popularity[image_ref_str] += 1
 
+    def _get_backing_file(self, index, ent, disk_path):
+        """Return the backing file of an instance disk.
+
+        The index is consulted first, and qemu-img is only run for disks
+        which are new or have been replaced since they were last recorded.
+        """
+        try:
+            inode = os.stat(disk_path).st_ino
+        except OSError:
+            inode = None
+
+        entry = index.get(ent)
+        if inode is not None and entry and entry['inode'] == inode:
+            return entry['backing_file']
+
+        backing_file = virtutils.get_disk_backing_file(disk_path)
+        if inode is not None:
+            index[ent] = {'inode': inode,
+                          'backing_file': backing_file}
+        return backing_file
+
     def _list_backing_images(self):
         """List the backing images currently in use."""
         inuse_images = []
-        for ent in os.listdir(CONF.instances_path):
+        index = _read_backing_file_index()
+        entries = {}
+        removals = []
+        instance_dirs = os.listdir(CONF.instances_path)
+        for ent in instance_dirs:
             if ent in self.instance_names:
                 LOG.debug(_('%s is a valid instance name'), ent)
                 disk_path = os.path.join(CONF.instances_path, ent, 'disk')
                 if os.path.exists(disk_path):
                     LOG.debug(_('%s has a disk file'), ent)
-                    backing_file = virtutils.get_disk_backing_file(disk_path)
+                    if ent in index:
+                        entries[ent] = index[ent]
+                    backing_file = self._get_backing_file(entries, ent,
+                                                          disk_path)
                     LOG.debug(_('Instance %(instance)s is backed by '
                                 '%(backing)s'),
                               {'instance': ent,
@@ -354,6 +588,17 @@ class ImageCacheManager(object):
                                         {'instance': ent,
                                          'backing': backing_file})
                             self.unexplained_images.remove(backing_path)
+                elif ent in index:
+                    removals.append(ent)
+
+        # Entries of instance directories which are gone entirely
+        removals.extend(set(index) - set(instance_dirs))
+
+        # Only touch the index when an instance disk has come or gone
+        updates = dict((ent, entry) for ent, entry in entries.iteritems()
+                       if entry != index.get(ent))
+        if updates or removals:
+            _update_backing_file_index(index, updates, removals)
 
         return inuse_images
 
@@ -384,6 +629,26 @@ class ImageCacheManager(object):
             if m:
                 yield img, False, True
 
+    def _checksum_base_file(self, base_file):
+        """Checksum a base image, resuming the hash of a previous pass.
+
+        Returns the hex digest, or None if the image could not be hashed
+        completely within checksum_max_bytes_per_pass.
+        """
+        checksum = self.partial_checksums.pop(base_file, None)
+        if checksum is None or checksum.is_stale():
+            checksum = ImageChecksum(base_file)
+
+        current_checksum = checksum.update(CONF.checksum_max_bytes_per_pass)
+        if current_checksum is None:
+            LOG.info(_('%(base_file)s: checksummed %(offset)d of %(size)d '
+                       'bytes, resuming in the next pass'),
+                     {'base_file': base_file,
+                      'offset': checksum.offset,
+                      'size': checksum.stat[1]})
+            self.partial_checksums[base_file] = checksum
+        return current_checksum
+
     def _verify_checksum(self, img_id, base_file, create_if_missing=True):
         """Compare the checksum stored on disk with the current file.
 
@@ -419,8 +684,9 @@ class ImageCacheManager(object):
                     write_stored_info(base_file, field='sha1',
                                       value=stored_checksum)
 
-                with open(base_file, 'r') as f:
-                    current_checksum = utils.hash_file(f)
+                current_checksum = self._checksum_base_file(base_file)
+                if current_checksum is None:
+                    return None
 
                 if current_checksum != stored_checksum:
                     LOG.error(_('image %(id)s at (%(base_file)s): image '
@@ -445,7 +711,10 @@ class ImageCacheManager(object):
                     LOG.info(_('%(id)s (%(base_file)s): generating checksum'),
                              {'id': img_id,
                               'base_file': base_file})
-                    write_stored_checksum(base_file)
+                    checksum = self._checksum_base_file(base_file)
+                    if checksum is not None:
+                        write_stored_info(base_file, field='sha1',
+                                          value=checksum)
 
                 return None
 
@@ -475,6 +744,7 @@ class ImageCacheManager(object):
             LOG.info(_('Removing base file: %s'), base_file)
             try:
                 os.remove(base_file)
+                self.partial_checksums.pop(base_file, None)
                 signature = get_info_filename(base_file)
                 if os.path.exists(signature):
                     os.remove(signature)
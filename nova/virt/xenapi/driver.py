@@ -309,6 +309,10 @@ class XenAPIDriver(driver.ComputeDriver):
         """Return data about VM instance."""
         return self._vmops.get_info(instance)
 
+    def get_power_states(self):
+        """Return the power state of all VMs, keyed by name label."""
+        return self._vmops.get_power_states()
+
     def get_diagnostics(self, instance):
         """Return data about VM diagnostics."""
         return self._vmops.get_diagnostics(instance)
@@ -1337,6 +1337,15 @@ class VMOps(object):
         vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
         return vm_utils.compile_info(vm_rec)
 
+    def get_power_states(self):
+        """Return the power state of the VMs on this host, keyed by name
+        label."""
+        power_states = {}
+        for vm_ref, vm_rec in vm_utils.list_vms(self._session):
+            power_states[vm_rec["name_label"]] = vm_utils.compile_info(
+                vm_rec)['state']
+        return power_states
+
     def get_diagnostics(self, instance):
         """Return data about VM diagnostics."""
         vm_ref = self._get_vm_opaque_ref(instance)